@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# orchard: Utilities to training and analyzing machine learning-based density functionals
+# Copyright (C) 2024 The President and Fellows of Harvard College
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>
+#
+# Author: Kyle Bystrom <kylebystrom@gmail.com>
+#
+
+
+"""
+Per-process cache of parsed basis set and ECP data. Building a Mole
+with mol.basis = "def2-qzvppd" reads and parses the basis file for
+every element each time. apply_basis_cache replaces basis and ECP
+names by the parsed data, which is loaded once per (name, element)
+and process. Only plain element symbols are handled; ghost atoms,
+labeled atoms and uncontracted ("unc-") basis names are left to PySCF.
+"""
+
+import functools
+
+from pyscf import gto
+
+
+@functools.lru_cache(maxsize=None)
+def load_basis(name, symb):
+    return gto.basis.load(name, symb)
+
+
+@functools.lru_cache(maxsize=None)
+def load_ecp(name, symb):
+    # empty for elements without ECP (e.g. light elements in def2)
+    return gto.basis.load_ecp(name, symb) or []
+
+
+def _is_element(symb):
+    return gto.mole.ELEMENTS_PROTON.get(symb, 0) > 0
+
+
+def _cached_dict(spec, symbols, loader):
+    # Same element -> name resolution as gto.mole._parse_default_basis
+    if isinstance(spec, str):
+        names = {symb: spec for symb in symbols}
+    elif isinstance(spec, dict) and all(k == "default" or _is_element(k) for k in spec):
+        names = {symb: spec.get(symb, spec.get("default")) for symb in symbols}
+    else:
+        return None
+    result = {}
+    for symb, name in names.items():
+        if name is None:
+            continue
+        if isinstance(name, str) and not name.lower().startswith("unc"):
+            data = loader(name, symb)
+            if len(data) > 0:
+                result[symb] = data
+        else:
+            result[symb] = name
+    return result
+
+
+def apply_basis_cache(mol):
+    """
+    Replace the basis and ECP names of the unbuilt mol by cached parsed
+    data. Returns mol. Nothing is changed if mol contains ghost or
+    labeled atoms.
+    """
+    if not mol.basis and not mol.ecp:
+        return mol
+    symbols = {a[0] for a in gto.mole.format_atom(mol.atom, unit=mol.unit)}
+    if not all(_is_element(symb) for symb in symbols):
+        return mol
+    if mol.basis:
+        basis = _cached_dict(mol.basis, symbols, load_basis)
+        if basis is not None:
+            mol.basis = basis
+    if mol.ecp:
+        ecp = _cached_dict(mol.ecp, symbols, load_ecp)
+        if ecp is not None:
+            mol.ecp = ecp
+    return mol
+
+
+def get_cache_info():
+    return {
+        "basis": load_basis.cache_info()._asdict(),
+        "ecp": load_ecp.cache_info()._asdict(),
+    }
+
+
+def clear_cache():
+    load_basis.cache_clear()
+    load_ecp.cache_clear()
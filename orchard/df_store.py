@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# orchard: Utilities to training and analyzing machine learning-based density functionals
+# Copyright (C) 2024 The President and Fellows of Harvard College
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>
+#
+# Author: Kyle Bystrom <kylebystrom@gmail.com>
+#
+
+
+"""
+On-disk store for density-fitting (3-center) tensors so that restarts
+and analysis tasks do not recompute the DF tensor of a stored calc.
+Tensors are saved as compressed HDF5 files named by a hash of the
+geometry, basis, ECP and auxiliary basis, and the store is kept under
+a size budget by evicting the least recently used tensors.
+
+The store lives in DF_STORE_ROOT from ~/.orchard_config.yaml, or in
+<save_root>/DF_STORE otherwise. Its size budget is DF_STORE_MAX_BYTES
+(default 50 GiB).
+"""
+
+import os
+
+import h5py
+import numpy as np
+from pyscf import df, lib
+
+from orchard.disk_cache import evict_lru, hash_key, touch
+
+DEFAULT_MAX_BYTES = 50 * 1024**3
+DF_SUFFIX = ".df.h5"
+DATANAME = "j3c"
+
+
+def get_df_store_dir(save_root_dir=None):
+    from orchard.workflow_utils import get_config
+
+    config = get_config()
+    if config.get("DF_STORE_ROOT") is not None:
+        return config["DF_STORE_ROOT"]
+    save_root_dir = save_root_dir or config.get("MLDFTDB_ROOT")
+    if save_root_dir is None:
+        return None
+    return os.path.join(save_root_dir, "DF_STORE")
+
+
+def get_with_df(calc):
+    """
+    Return the density fitting object of calc, or None if calc does not
+    use (non-SGX) density fitting.
+    """
+    with_df = getattr(calc, "with_df", None)
+    if isinstance(with_df, df.DF):
+        return with_df
+    return None
+
+
+def get_df_key(mol, with_df):
+    auxmol = with_df.auxmol
+    if auxmol is None:
+        auxmol = df.addons.make_auxmol(mol, with_df.auxbasis)
+    return hash_key(
+        {
+            "atom": mol._atom,
+            "basis": mol._basis,
+            "ecp": mol._ecp,
+            "cart": mol.cart,
+            "auxbasis": auxmol._basis,
+        }
+    )
+
+
+def get_df_file(calc, store_dir):
+    with_df = get_with_df(calc)
+    if with_df is None or store_dir is None:
+        return None
+    return os.path.join(store_dir, get_df_key(calc.mol, with_df) + DF_SUFFIX)
+
+
+def save_df_tensor(calc, save_root_dir=None, max_bytes=None):
+    """
+    Save the DF tensor of calc to the store, if calc uses density
+    fitting. For pure functionals, PySCF may compute J without building
+    the tensor, in which case it is built here.
+
+    Returns:
+        Path of the stored tensor, or None if nothing was saved
+    """
+    store_dir = get_df_store_dir(save_root_dir)
+    fname = get_df_file(calc, store_dir)
+    with_df = get_with_df(calc)
+    if fname is None:
+        return None
+    if os.path.exists(fname):
+        touch(fname)
+        return fname
+    os.makedirs(store_dir, exist_ok=True)
+    naux = with_df.get_naoaux()
+    nao = calc.mol.nao_nr()
+    npair = nao * (nao + 1) // 2
+    tmp_file = "{}.tmp{}".format(fname, os.getpid())
+    with h5py.File(tmp_file, "w") as f:
+        dset = f.create_dataset(
+            DATANAME,
+            shape=(naux, npair),
+            dtype=np.float64,
+            chunks=(min(naux, 64), npair),
+            compression="gzip",
+            compression_opts=1,
+            shuffle=True,
+        )
+        p0 = 0
+        for blk in with_df.loop():
+            dset[p0 : p0 + blk.shape[0]] = blk
+            p0 += blk.shape[0]
+    os.replace(tmp_file, fname)
+    if max_bytes is None:
+        from orchard.workflow_utils import get_config
+
+        max_bytes = get_config().get("DF_STORE_MAX_BYTES", DEFAULT_MAX_BYTES)
+    evict_lru(store_dir, max_bytes, suffix=DF_SUFFIX, keep=[fname])
+    return fname
+
+
+def load_df_tensor(calc, save_root_dir=None):
+    """
+    Set the DF tensor of calc from the store if a matching tensor
+    exists. The tensor is read into memory if it fits in
+    calc.max_memory; otherwise calc reads it from the store file.
+
+    Returns:
+        True if a stored tensor was found
+    """
+    fname = get_df_file(calc, get_df_store_dir(save_root_dir))
+    if fname is None or not os.path.exists(fname):
+        return False
+    with_df = get_with_df(calc)
+    try:
+        with h5py.File(fname, "r") as f:
+            dset = f[DATANAME]
+            nbytes = dset.size * dset.dtype.itemsize
+            avail = calc.max_memory - lib.current_memory()[0]
+            if nbytes / 1e6 < 0.9 * avail:
+                cderi = dset[:]
+            else:
+                cderi = fname
+    except (OSError, KeyError):
+        return False
+    touch(fname)
+    with_df._cderi = cderi
+    with_df._dataname = DATANAME
+    with_df.auxmol = None
+    print("Loaded DF tensor from", fname)
+    return True
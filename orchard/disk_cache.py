@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# orchard: Utilities to training and analyzing machine learning-based density functionals
+# Copyright (C) 2024 The President and Fellows of Harvard College
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>
+#
+# Author: Kyle Bystrom <kylebystrom@gmail.com>
+#
+
+
+"""
+Helpers for content-addressed on-disk caches (e.g. the density-fitting
+tensor store): stable hashing of cache keys and size-bounded eviction
+of the least recently used files in a cache directory.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+def _jsonable(obj, decimals):
+    if isinstance(obj, dict):
+        return {str(k): _jsonable(v, decimals) for k, v in sorted(obj.items())}
+    if isinstance(obj, (list, tuple)):
+        return [_jsonable(v, decimals) for v in obj]
+    if isinstance(obj, np.ndarray):
+        return _jsonable(obj.tolist(), decimals)
+    if isinstance(obj, (float, np.floating)):
+        return round(float(obj), decimals)
+    if isinstance(obj, np.integer):
+        return int(obj)
+    return obj
+
+
+def hash_key(obj, decimals=8):
+    """
+    Return a hex digest for a key built from dicts, lists, tuples,
+    strings and numbers. Floats are rounded to the given number of
+    decimals so that round-tripped geometries hash identically.
+    """
+    s = json.dumps(_jsonable(obj, decimals), sort_keys=True)
+    return hashlib.sha256(s.encode("utf-8")).hexdigest()
+
+
+def touch(fname):
+    """
+    Mark fname as recently used for evict_lru.
+    """
+    try:
+        os.utime(fname)
+    except OSError:
+        pass
+
+
+def evict_lru(dirname, max_bytes, suffix="", keep=()):
+    """
+    Delete the least recently used files ending in suffix from dirname
+    until their total size is at most max_bytes. Files in keep are
+    never deleted.
+
+    Returns:
+        list of deleted paths
+    """
+    entries = []
+    keep = {os.path.abspath(fname) for fname in keep}
+    try:
+        with os.scandir(dirname) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(suffix):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+    except FileNotFoundError:
+        return []
+    total = sum(e[1] for e in entries)
+    deleted = []
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if os.path.abspath(path) in keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        deleted.append(path)
+    return deleted
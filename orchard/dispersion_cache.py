@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# orchard: Utilities to training and analyzing machine learning-based density functionals
+# Copyright (C) 2024 The President and Fellows of Harvard College
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>
+#
+# Author: Kyle Bystrom <kylebystrom@gmail.com>
+#
+
+
+"""
+Cache of DFT-D3/D4 dispersion energies and gradients, keyed by a hash
+of the geometry, charge, dispersion model and its parameters (xc,
+version, three-body term, custom damping parameters). It is shared by
+the dispersion-corrected calcs from setup_calc and the base energies
+of train_xc_params, so the dispersion of each molecule is computed
+once per functional and version.
+
+Results are kept in memory per process and, if a cache directory is
+known, as small .npz files in DISPERSION_CACHE_ROOT from
+~/.orchard_config.yaml, or <MLDFTDB_ROOT>/DISPERSION_CACHE otherwise.
+"""
+
+import os
+
+import numpy as np
+
+from orchard.disk_cache import hash_key
+
+DISPERSION_PARAMS = ["xc", "version", "atm", "param"]
+DISP_SUFFIX = ".disp.npz"
+_memory_cache = {}
+
+
+def get_dispersion_cache_dir():
+    from orchard.workflow_utils import get_config
+
+    config = get_config()
+    if config.get("DISPERSION_CACHE_ROOT") is not None:
+        return config["DISPERSION_CACHE_ROOT"]
+    if config.get("MLDFTDB_ROOT") is not None:
+        return os.path.join(config["MLDFTDB_ROOT"], "DISPERSION_CACHE")
+    return None
+
+
+def get_dispersion_key(mol, model, params):
+    return hash_key(
+        {
+            "atom": mol._atom,
+            "charge": mol.charge,
+            "model": model,
+            "params": params,
+        }
+    )
+
+
+def _load(fname):
+    try:
+        with np.load(fname) as f:
+            return float(f["energy"]), f["gradient"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _save(fname, energy, gradient):
+    try:
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        tmp_file = "{}.{}.tmp.npz".format(fname[: -len(".npz")], os.getpid())
+        np.savez(tmp_file, energy=energy, gradient=gradient)
+        os.replace(tmp_file, fname)
+    except OSError as e:
+        print("Could not save dispersion to cache: {}".format(e))
+
+
+def get_cached_dispersion(mol, model, params, compute, cache_dir=None):
+    """
+    Return (energy, gradient) of the dispersion model ("d3" or "d4")
+    with the given params for mol, calling compute() (which must
+    return (energy, gradient)) only if the result is not cached.
+    """
+    key = get_dispersion_key(mol, model, params)
+    if key in _memory_cache:
+        energy, gradient = _memory_cache[key]
+        return energy, gradient.copy()
+    cache_dir = cache_dir or get_dispersion_cache_dir()
+    fname = None
+    result = None
+    if cache_dir is not None:
+        fname = os.path.join(cache_dir, key + DISP_SUFFIX)
+        if os.path.exists(fname):
+            result = _load(fname)
+    if result is None:
+        energy, gradient = compute()
+        result = (float(energy), np.asarray(gradient))
+        if fname is not None:
+            _save(fname, *result)
+    _memory_cache[key] = result
+    return result[0], result[1].copy()
+
+
+def use_dispersion_cache(disp, model):
+    """
+    Make the kernel of a dftd3/dftd4 PySCF dispersion object (e.g.
+    calc.with_dftd3) use the dispersion cache. The key is built from
+    disp.mol and the attributes in DISPERSION_PARAMS when kernel is
+    called, so settings changed after this call are taken into account.
+    Returns disp.
+    """
+    kernel = disp.kernel
+
+    def cached_kernel(*args, **kwargs):
+        if len(args) > 0 or len(kwargs) > 0:
+            return kernel(*args, **kwargs)
+        params = {k: getattr(disp, k, None) for k in DISPERSION_PARAMS}
+        params["type"] = type(disp).__name__
+        return get_cached_dispersion(disp.mol, model, params, kernel)
+
+    disp.kernel = cached_kernel
+    return disp
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# orchard: Utilities to training and analyzing machine learning-based density functionals
+# Copyright (C) 2024 The President and Fellows of Harvard College
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>
+#
+# Author: Kyle Bystrom <kylebystrom@gmail.com>
+#
+
+
+"""
+Packed, indexed storage for the ACCDB geometries.
+
+compile_geometry_pack parses every .xyz file under ACCDB_ROOT/Geometries
+once and writes a single .npz file holding all coordinates as one
+float array with per-structure offsets, along with the atomic numbers,
+charges, spins and structure ids. read_accdb_structure uses the pack
+automatically when it exists; re-run the compiler after changing
+the geometry files.
+"""
+
+import os
+
+import numpy as np
+
+PACK_FILENAME = "Geometries.pack.npz"
+
+
+def parse_accdb_xyz(fname):
+    """
+    Parse an ACCDB .xyz file.
+
+    Returns:
+        symbols (list of str or int), coords (list of [x, y, z] str),
+        charge (int), spin (int, 2S)
+    """
+    with open(fname, "r") as f:
+        lines = f.readlines()
+    natom = int(lines[0])
+    charge_and_spin = lines[1].split()
+    charge = int(charge_and_spin[0].strip().strip(","))
+    spin = int(charge_and_spin[1].strip().strip(",")) - 1
+    symbols = []
+    coords = []
+    for i in range(natom):
+        line = lines[2 + i]
+        symbol, x, y, z = line.split()
+        if symbol.isdigit():
+            symbol = int(symbol)
+        else:
+            symbol = symbol[0].upper() + symbol[1:].lower()
+        symbols.append(symbol)
+        coords.append([x, y, z])
+    return symbols, coords, charge, spin
+
+
+def get_pack_path(accdb_root=None):
+    if accdb_root is None:
+        from orchard.workflow_utils import get_config
+
+        accdb_root = get_config().get("ACCDB_ROOT")
+    if accdb_root is None:
+        raise ValueError("Must provide accdb_root or set ACCDB_ROOT in config")
+    return os.path.join(accdb_root, PACK_FILENAME)
+
+
+def _list_struct_ids(geom_dir):
+    struct_ids = []
+    for dirpath, dirnames, filenames in os.walk(geom_dir):
+        dirnames.sort()
+        for fname in sorted(filenames):
+            if fname.endswith(".xyz"):
+                path = os.path.join(dirpath, fname)
+                struct_ids.append(os.path.relpath(path, geom_dir)[:-4])
+    return struct_ids
+
+
+def compile_geometry_pack(accdb_root=None, out_file=None, struct_ids=None):
+    """
+    Pack the ACCDB geometries into a single indexed .npz file.
+
+    Args:
+        accdb_root (str): ACCDB root directory, defaults to ACCDB_ROOT
+        out_file (str): Output file, defaults to
+            <accdb_root>/Geometries.pack.npz
+        struct_ids (list of str): Structures to pack, defaults to
+            all .xyz files under <accdb_root>/Geometries
+
+    Returns:
+        Path of the written pack file.
+    """
+    from ase.data import atomic_numbers
+
+    if accdb_root is None:
+        from orchard.workflow_utils import get_config
+
+        accdb_root = get_config().get("ACCDB_ROOT")
+    if out_file is None:
+        out_file = get_pack_path(accdb_root)
+    geom_dir = os.path.join(accdb_root, "Geometries")
+    if struct_ids is None:
+        struct_ids = _list_struct_ids(geom_dir)
+    offsets = [0]
+    numbers = []
+    coords = []
+    charges = []
+    spins = []
+    for struct_id in struct_ids:
+        fname = "{}.xyz".format(os.path.join(geom_dir, struct_id))
+        symbols, xyz, charge, spin = parse_accdb_xyz(fname)
+        for symbol in symbols:
+            if isinstance(symbol, int):
+                numbers.append(symbol)
+            else:
+                numbers.append(atomic_numbers[symbol])
+        coords.extend(xyz)
+        charges.append(charge)
+        spins.append(spin)
+        offsets.append(offsets[-1] + len(symbols))
+    tmp_file = out_file + ".tmp.npz"
+    np.savez(
+        tmp_file,
+        struct_ids=np.array(struct_ids, dtype=np.str_),
+        offsets=np.array(offsets, dtype=np.int64),
+        numbers=np.array(numbers, dtype=np.int32),
+        coords=np.array(coords, dtype=np.float64).reshape(-1, 3),
+        charges=np.array(charges, dtype=np.int32),
+        spins=np.array(spins, dtype=np.int32),
+    )
+    os.replace(tmp_file, out_file)
+    return out_file
+
+
+class GeometryPack:
+    def __init__(self, struct_ids, offsets, numbers, coords, charges, spins):
+        self.struct_ids = struct_ids
+        self.offsets = offsets
+        self.numbers = numbers
+        self.coords = coords
+        self.charges = charges
+        self.spins = spins
+        self.index = {sid: i for i, sid in enumerate(struct_ids.tolist())}
+
+    @classmethod
+    def load(cls, fname):
+        with np.load(fname) as f:
+            return cls(
+                f["struct_ids"],
+                f["offsets"],
+                f["numbers"],
+                f["coords"],
+                f["charges"],
+                f["spins"],
+            )
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, struct_id):
+        return struct_id in self.index
+
+    def get_arrays(self, struct_id):
+        """
+        Returns:
+            numbers (int array), positions (float array, Angstrom),
+            charge (int), spin (int, 2S)
+        """
+        i = self.index[struct_id]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return (
+            self.numbers[start:end],
+            self.coords[start:end],
+            int(self.charges[i]),
+            int(self.spins[i]),
+        )
+
+    def get_atoms(self, struct_id):
+        from ase import Atoms
+
+        numbers, positions, charge, spin = self.get_arrays(struct_id)
+        return Atoms(numbers=numbers, positions=positions), charge, spin
+
+    def load_structures(self, struct_ids, as_arrays=False):
+        """
+        Batch loader for many structures.
+
+        Returns:
+            List of (numbers, positions, charge, spin) if as_arrays,
+            else list of (Atoms, charge, spin).
+        """
+        if as_arrays:
+            return [self.get_arrays(sid) for sid in struct_ids]
+        return [self.get_atoms(sid) for sid in struct_ids]
+
+
+_LOADED_PACKS = {}
+
+
+def get_geometry_pack(accdb_root=None):
+    """
+    Return the GeometryPack for accdb_root, or None if it has not
+    been compiled. The pack is loaded once per process and reloaded
+    if the file changes.
+    """
+    fname = get_pack_path(accdb_root)
+    try:
+        mtime = os.stat(fname).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _LOADED_PACKS.get(fname)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, GeometryPack.load(fname))
+        _LOADED_PACKS[fname] = cached
+    return cached[1]
@@ -31,6 +31,7 @@ from ase import Atoms
 from fireworks import FiretaskBase, Firework, FWAction
 from fireworks.utilities.fw_utilities import explicit_serialize
 
+from orchard.results_catalog import record_result
 from orchard.workflow_utils import get_save_dir
 
 GPAW_CALL_SCRIPT = __file__.replace("gpaw_tasks", "gpaw_caller")
@@ -226,7 +227,7 @@ class GPAWSinglePointRestart(FiretaskBase):
 class SaveGPAWResults(FiretaskBase):
 
     required_params = ["save_root_dir"]
-    optional_params = ["no_overwrite"]
+    optional_params = ["no_overwrite", "update_catalog"]
 
     def run_task(self, fw_spec):
         save_dir = get_save_dir(
@@ -263,6 +264,19 @@ class SaveGPAWResults(FiretaskBase):
         if fw_spec["save_file"] is not None:
             shutil.copyfile(fw_spec["save_file"], os.path.join(save_dir, "calc.gpw"))
 
+        if self.get("update_catalog") is None or self["update_catalog"]:
+            record_result(
+                self["save_root_dir"],
+                "PW-KS",
+                fw_spec["method_name"],
+                "",
+                fw_spec["system_id"],
+                e_tot=fw_spec["e_tot"],
+                converged=fw_spec["converged"],
+                wall_time=fw_spec["wall_time"],
+                files=os.listdir(save_dir),
+            )
+
         return FWAction(stored_data={"save_dir": save_dir})
 
 
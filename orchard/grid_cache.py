@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# orchard: Utilities to training and analyzing machine learning-based density functionals
+# Copyright (C) 2024 The President and Fellows of Harvard College
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>
+#
+# Author: Kyle Bystrom <kylebystrom@gmail.com>
+#
+
+
+"""
+On-disk cache of DFT integration grids. Generating the Becke-partitioned
+grids is repeated for the same geometry and grid settings by every
+task that rebuilds a calc (SCFCalc, LoadSCFCalc via get_calc, analysis
+tasks). With the cache, the sorted and padded coords and weights are
+stored as uncompressed .npz files named by a hash of the geometry and
+grid settings, and loaded instead of regenerated. Density-dependent
+pruning (small_rho_cutoff) is applied by PySCF after loading as usual.
+
+The cache is used when GRID_CACHE_ROOT is set in ~/.orchard_config.yaml.
+Its size budget is GRID_CACHE_MAX_BYTES (default 10 GiB), enforced by
+evicting the least recently used grids.
+"""
+
+import os
+
+import numpy as np
+from pyscf.dft import gen_grid
+
+from orchard.disk_cache import evict_lru, hash_key, touch
+
+DEFAULT_MAX_BYTES = 10 * 1024**3
+GRID_SUFFIX = ".grid.npz"
+GRID_ARRAYS = ["coords", "weights", "atm_idx", "quadrature_weights"]
+
+
+def get_grid_cache_dir():
+    from orchard.workflow_utils import get_config
+
+    return get_config().get("GRID_CACHE_ROOT")
+
+
+def _name(obj):
+    # grid scheme settings may be functions (e.g. prune, radi_method)
+    if callable(obj):
+        return "{}.{}".format(
+            getattr(obj, "__module__", ""), getattr(obj, "__name__", repr(obj))
+        )
+    return obj
+
+
+def get_grid_key(mol, grids, sort_grids=True):
+    return hash_key(
+        {
+            "atom": mol._atom,
+            "atom_grid": grids.atom_grid,
+            "level": grids.level,
+            "prune": _name(grids.prune),
+            "radi_method": _name(grids.radi_method),
+            "becke_scheme": _name(grids.becke_scheme),
+            "radii_adjust": _name(grids.radii_adjust),
+            "atomic_radii": grids.atomic_radii,
+            "alignment": grids.alignment,
+            "sort_grids": sort_grids,
+        }
+    )
+
+
+class CachedGrids(gen_grid.Grids):
+    """
+    Grids that are loaded from cache_dir if they were built before for
+    the same geometry and settings, and saved there otherwise.
+    """
+
+    cache_dir = None
+    max_bytes = None
+
+    def build(self, mol=None, with_non0tab=False, sort_grids=True, **kwargs):
+        if mol is None:
+            mol = self.mol
+        if self.cache_dir is None or len(kwargs) > 0:
+            return super().build(
+                mol, with_non0tab=with_non0tab, sort_grids=sort_grids, **kwargs
+            )
+        fname = os.path.join(
+            self.cache_dir, get_grid_key(mol, self, sort_grids) + GRID_SUFFIX
+        )
+        if not self._load(fname):
+            super().build(mol, with_non0tab=False, sort_grids=sort_grids)
+            self._save(fname)
+        if with_non0tab:
+            self.non0tab = self.make_mask(mol, self.coords)
+            self.screen_index = self.non0tab
+        else:
+            self.screen_index = self.non0tab = None
+        return self
+
+    def _load(self, fname):
+        if not os.path.exists(fname):
+            return False
+        try:
+            with np.load(fname) as f:
+                arrays = {k: f[k] for k in GRID_ARRAYS}
+        except (OSError, ValueError, KeyError):
+            return False
+        self.__dict__.update(arrays)
+        touch(fname)
+        return True
+
+    def _save(self, fname):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_file = "{}.{}.tmp.npz".format(fname[: -len(".npz")], os.getpid())
+            np.savez(tmp_file, **{k: getattr(self, k) for k in GRID_ARRAYS})
+            os.replace(tmp_file, fname)
+        except OSError as e:
+            print("Could not save grids to cache: {}".format(e))
+            return
+        max_bytes = self.max_bytes
+        if max_bytes is None:
+            from orchard.workflow_utils import get_config
+
+            max_bytes = get_config().get("GRID_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)
+        evict_lru(self.cache_dir, max_bytes, suffix=GRID_SUFFIX, keep=[fname])
+
+
+def use_grid_cache(grids, cache_dir=None):
+    """
+    Make grids (a Grids object, e.g. calc.grids) use the grid cache in
+    cache_dir, by default GRID_CACHE_ROOT. Does nothing if no cache
+    directory is configured or grids is not a plain Grids object.
+    Returns grids.
+    """
+    cache_dir = cache_dir or get_grid_cache_dir()
+    if cache_dir is None or type(grids) not in [gen_grid.Grids, CachedGrids]:
+        return grids
+    grids.__class__ = CachedGrids
+    grids.cache_dir = cache_dir
+    return grids
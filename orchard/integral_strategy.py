@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# orchard: Utilities to training and analyzing machine learning-based density functionals
+# Copyright (C) 2024 The President and Fellows of Harvard College
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>
+#
+# Author: Kyle Bystrom <kylebystrom@gmail.com>
+#
+
+
+"""
+Choice of the two-electron integral strategy for PySCF calcs, set by
+settings['control']['integrals'] in pyscf_caller.setup_calc:
+
+    'exact': exact (4-center) J and K
+    'rij': density-fitted J, exact K (only_dfj)
+    'rijk': density-fitted J and K
+    'sgx': seminumerical exchange (with SGX J)
+    'auto': the cheapest of the above according to a simple cost model,
+        subject to memory limits. Exact integrals are kept whenever they
+        are estimated to be cheap, and SGX is only considered for
+        larger systems since it is the least accurate.
+
+The cost model estimates the wall time of a full SCF from nao, the
+auxiliary basis size, the number of occupied orbitals and atoms, using
+per-operation coefficients. The default coefficients can be replaced
+by calibrated ones from the calibrate_integral_cost script, which are
+read from INTEGRAL_COST_FILE in ~/.orchard_config.yaml, or from
+~/.orchard_integral_cost.yaml.
+"""
+
+import os
+
+import yaml
+
+INTEGRAL_STRATEGIES = ["exact", "rij", "rijk", "sgx"]
+
+# seconds per unit operation on a single core, see estimate_costs
+DEFAULT_COST_COEFFS = {
+    "eri": 2.0e-8,
+    "int3c": 2.0e-8,
+    "dfj": 1.0e-9,
+    "dfk": 5.0e-10,
+    "sgx": 1.0e-9,
+}
+DEFAULT_AUTO_PARAMS = {
+    "ncycle": 15,
+    "exact_time_limit": 60.0,
+    "sgx_min_atoms": 40,
+    "sgx_grids_per_atom": 3000,
+    "memory_fraction": 0.7,
+    "sgx_pjs": False,
+}
+DEFAULT_COST_FILE = os.path.expanduser("~/.orchard_integral_cost.yaml")
+_cost_coeffs = None
+
+
+def get_cost_file():
+    from orchard.workflow_utils import get_config
+
+    return os.path.expanduser(
+        get_config().get("INTEGRAL_COST_FILE") or DEFAULT_COST_FILE
+    )
+
+
+def get_cost_coeffs():
+    """
+    Return the cost model coefficients, calibrated ones if available.
+    """
+    global _cost_coeffs
+    if _cost_coeffs is None:
+        _cost_coeffs = dict(DEFAULT_COST_COEFFS)
+        fname = get_cost_file()
+        if os.path.exists(fname):
+            with open(fname, "r") as f:
+                _cost_coeffs.update((yaml.safe_load(f) or {}).get("coeffs", {}))
+    return _cost_coeffs
+
+
+def is_hybrid_calc(calc, settings):
+    if settings.get("jax") is not None:
+        return True
+    if settings.get("cider") is not None and settings["cider"].get("xmix", 0) != 0:
+        return True
+    xc = getattr(calc, "xc", None)
+    if xc is None:
+        return False
+    try:
+        from pyscf.dft import libxc
+
+        return libxc.is_hybrid_xc(xc)
+    except (KeyError, ValueError, TypeError):
+        return False
+
+
+def get_naux(mol, auxbasis=None):
+    from pyscf import df
+
+    return df.addons.make_auxmol(mol, auxbasis).nao_nr()
+
+
+def estimate_costs(mol, naux, hybrid, nthreads, max_memory, params=None, coeffs=None):
+    """
+    Estimate the wall time (s) of a full SCF for each strategy. Exact
+    integrals that do not fit in memory are recomputed every cycle
+    (direct SCF), and DF tensors that do not fit in memory are read
+    from disk every cycle (counted as a second build).
+
+    Returns:
+        dict {strategy: time}
+    """
+    params = dict(DEFAULT_AUTO_PARAMS, **(params or {}))
+    c = coeffs or get_cost_coeffs()
+    mem_limit = params["memory_fraction"] * max_memory
+    nao = mol.nao_nr()
+    nocc = max(1, mol.nelectron // 2)
+    npair = nao * (nao + 1) // 2
+    ncycle = params["ncycle"]
+    ngrids = params["sgx_grids_per_atom"] * mol.natm
+
+    eri_time = c["eri"] * npair**2 / 2
+    if npair**2 / 2 * 8 / 1e6 > mem_limit:
+        eri_time *= ncycle
+    int3c_time = c["int3c"] * naux * npair
+    if naux * npair * 8 / 1e6 > mem_limit:
+        int3c_time *= 2
+    dfj_time = int3c_time + ncycle * c["dfj"] * naux * npair
+    costs = {"exact": eri_time}
+    if hybrid:
+        costs["rij"] = dfj_time + eri_time
+        costs["rijk"] = dfj_time + ncycle * c["dfk"] * nocc * naux * nao**2
+        costs["sgx"] = ncycle * c["sgx"] * ngrids * nao * (nao + nocc)
+    else:
+        costs["rij"] = dfj_time
+    return {k: t / nthreads for k, t in costs.items()}
+
+
+def choose_integral_strategy(mol, calc, settings, max_memory, nthreads):
+    """
+    Pick the integral strategy for the 'auto' mode.
+
+    Returns:
+        strategy name, dict of estimated SCF times per strategy
+    """
+    params = dict(DEFAULT_AUTO_PARAMS)
+    if isinstance(settings["control"].get("integrals_auto"), dict):
+        params.update(settings["control"]["integrals_auto"])
+    hybrid = is_hybrid_calc(calc, settings)
+    naux = get_naux(mol, settings["control"].get("df_basis"))
+    costs = estimate_costs(mol, naux, hybrid, nthreads, max_memory, params=params)
+    if costs["exact"] <= params["exact_time_limit"]:
+        return "exact", costs
+    candidates = dict(costs)
+    if mol.natm < params["sgx_min_atoms"]:
+        candidates.pop("sgx", None)
+    return min(candidates, key=candidates.get), costs
+
+
+def get_integral_control(strategy, settings):
+    """
+    Control settings implementing an integral strategy.
+    """
+    control = {"integrals": strategy}
+    if strategy == "exact":
+        control.update({"density_fit": False, "sgx_params": None})
+    elif strategy == "rij":
+        control.update({"density_fit": True, "only_dfj": True, "sgx_params": None})
+    elif strategy == "rijk":
+        control.update({"density_fit": True, "only_dfj": False, "sgx_params": None})
+    elif strategy == "sgx":
+        sgx_params = settings["control"].get("sgx_params") or {
+            "pjs": DEFAULT_AUTO_PARAMS["sgx_pjs"]
+        }
+        control.update({"density_fit": False, "sgx_params": dict(sgx_params)})
+    else:
+        raise ValueError("Unknown integral strategy {}".format(strategy))
+    return control
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# orchard: Utilities to training and analyzing machine learning-based density functionals
+# Copyright (C) 2024 The President and Fellows of Harvard College
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>
+#
+# Author: Kyle Bystrom <kylebystrom@gmail.com>
+#
+
+
+"""
+Process-wide cache for joblib-serialized ML functional models, so that
+batched and restarted calculations do not reload the same model file
+for every calc. Entries are keyed by the resolved path, mtime, size and
+mmap_mode of the file, so a model file that is overwritten is reloaded.
+Models are evicted in least-recently-used order once the total size of
+the cached files exceeds the memory budget.
+
+Cached models are shared between calculations and must not be
+modified in place.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 4 * 1024**3
+
+
+class ModelCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Args:
+            max_bytes (int): Memory budget for cached models. The size
+                of a model is estimated by the size of its file on disk.
+                A model larger than the budget is loaded but not cached.
+        """
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def get_key(fname, mmap_mode=None):
+        path = os.path.realpath(fname)
+        st = os.stat(path)
+        return (path, st.st_mtime_ns, st.st_size, mmap_mode)
+
+    @property
+    def nbytes(self):
+        return sum(key[2] for key in self._entries)
+
+    def load(self, fname, mmap_mode=None):
+        """
+        Return the model stored in fname, loading it with joblib.load
+        if it is not already cached.
+
+        Args:
+            fname (str): Path to the joblib file
+            mmap_mode (str or None): Passed to joblib.load, e.g. "r" to
+                memory-map large numpy arrays instead of reading them.
+        """
+        key = self.get_key(fname, mmap_mode=mmap_mode)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        import joblib
+
+        model = joblib.load(key[0], mmap_mode=mmap_mode)
+        with self._lock:
+            # drop stale entries for the same file and mode
+            for old_key in list(self._entries):
+                if old_key[0] == key[0] and old_key[3] == mmap_mode:
+                    del self._entries[old_key]
+            if key[2] <= self.max_bytes:
+                self._entries[key] = model
+                self._evict()
+        return model
+
+    def _evict(self):
+        while self._entries and self.nbytes > self.max_bytes:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "num_models": len(self._entries),
+                "nbytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_model_cache = None
+
+
+def get_model_cache():
+    """
+    Return the process-wide ModelCache. The budget is read from
+    MODEL_CACHE_MAX_BYTES in ~/.orchard_config.yaml if set.
+    """
+    global _model_cache
+    if _model_cache is None:
+        from orchard.workflow_utils import get_config
+
+        max_bytes = get_config().get("MODEL_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)
+        _model_cache = ModelCache(max_bytes=max_bytes)
+    return _model_cache
+
+
+def load_mlfunc(fname, mmap_mode=None):
+    """
+    Load an ML functional model through the process-wide cache.
+    """
+    return get_model_cache().load(fname, mmap_mode=mmap_mode)
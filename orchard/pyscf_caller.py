@@ -18,9 +18,23 @@
 # Author: Kyle Bystrom <kylebystrom@gmail.com>
 #
 
+import copy
+import time
 from copy import deepcopy
 
-from pyscf import dft, gto, scf
+import numpy as np
+from pyscf import dft, gto, lib, scf
+
+from orchard.basis_cache import apply_basis_cache
+from orchard.dispersion_cache import use_dispersion_cache
+from orchard.grid_cache import use_grid_cache
+from orchard.model_cache import load_mlfunc
+from orchard.resource_config import (
+    choose_max_memory,
+    choose_num_threads,
+    configure_resources,
+    use_resources,
+)
 
 CALC_TYPES = {
     "RKS": dft.rks.RKS,
@@ -38,6 +52,36 @@ All PySCF settings supported:
         'remove_linear_dep': bool,
         'mol_format': str
         'cider_va': bool
+        'mlfunc_mmap_mode': None or str (joblib mmap_mode for the
+            ML functional, models are cached per process, see
+            orchard.model_cache)
+        'warm_start': bool (used by pyscf_tasks.SCFCalc, start from the
+            closest stored calc, see orchard.warm_start)
+        'basis_ladder': None, True or dict (used by run_scf, first
+            converge in a small basis and project the density to the
+            target basis as the initial guess; see BASIS_LADDER_DEFAULTS)
+        'symmetry': bool or dict (use point group symmetry if the calc
+            type supports it, dict may set "subgroup"; the molecule is
+            moved to the standard orientation)
+        'integrals': None, 'exact', 'rij', 'rijk', 'sgx' or 'auto'
+            (overrides density_fit, only_dfj and sgx_params, see
+            orchard.integral_strategy)
+        'precision_ramp': None, True or dict (used by run_scf, converge
+            loosely on a coarse pruned grid first, then continue on the
+            requested grids and conv_tol; see PRECISION_RAMP_DEFAULTS)
+        'convergence_fallback': None, True or dict (used by run_scf, if
+            the SCF does not converge, continue from the last density
+            with the stages in CONVERGENCE_FALLBACK_DEFAULTS until one
+            converges)
+        'scf_checkpoint': None, True, int or dict (used by SCFCalc and
+            SCFCalcFromRestart, write the MOs to the save_dir every N
+            iterations and resume from them on rerun, see
+            orchard.scf_checkpoint)
+        'adaptive_resources': None, bool or dict (choose the thread
+            count and max_memory from the system size and the cores
+            and memory of the node, see orchard.resource_config)
+        'num_threads': None or int (overrides adaptive_resources)
+        'max_memory': None or float (MB, overrides adaptive_resources)
     },
     'mol' : {
         'basis': str, default 'def2-qzvppd'
@@ -76,29 +120,20 @@ All PySCF settings supported:
 """
 
 
-def setup_calc(atoms, settings):
+def setup_calc(atoms, settings, mol=None):
+    # mol can be passed to reuse an already built Mole with the same
+    # geometry, mol settings and symmetry setting (see SCFSweep).
+    settings_inp = settings
     settings = deepcopy(settings)
-    mol = gto.Mole()
-    fmt = settings["control"]["mol_format"]
-    if fmt == "xyz_file":
-        mol.atom = atoms
-    elif fmt in ["xyz", "raw", "zmat"]:
-        mol.atom = gto.mole.fromstring(atoms, format=fmt)
-    elif fmt == "pyscf":
-        mol.atom = atoms
-    elif fmt == "ase":
-        from pyscf.pbc.tools.pyscf_ase import atoms_from_ase
-
-        mol.atom = atoms_from_ase(atoms)
-    mol.__dict__.update(settings["mol"])
-    mol.build()
+    if mol is None:
+        mol = build_mol(atoms, settings)
 
     is_cider = settings.get("cider") is not None
+    mmap_mode = settings["control"].get("mlfunc_mmap_mode")
     is_jax = settings.get("jax") is not None
     if (not is_cider) and (not is_jax):
         calc = dft.UKS(mol) if settings["control"]["spinpol"] else dft.RKS(mol)
     elif is_cider and settings["control"].get("cider_va"):
-        import joblib
         from ciderpress.dft.numint import setup_uks_calc
 
         mlfunc_filename = settings["cider"]["mlfunc_filename"]
@@ -126,7 +161,7 @@ def setup_calc(atoms, settings):
                 xc = xc + t
         calc = setup_uks_calc(
             mol,
-            joblib.load(mlfunc_filename),
+            load_mlfunc(mlfunc_filename, mmap_mode=mmap_mode),
             xmix=xmix,
             xc=xc,
         )
@@ -145,13 +180,12 @@ def setup_calc(atoms, settings):
 
         else:
             # TODO grid level settings
-            import joblib
             from ciderpress.dft.ri_cider import setup_cider_calc
 
             mlfunc_filename = settings["cider"].pop("mlfunc_filename")
             calc = setup_cider_calc(
                 mol,
-                joblib.load(mlfunc_filename),
+                load_mlfunc(mlfunc_filename, mmap_mode=mmap_mode),
                 spinpol=settings["control"]["spinpol"],
                 **(settings["cider"]),
             )
@@ -167,13 +201,12 @@ def setup_calc(atoms, settings):
             jax_thr=settings["jax"].get("jax_thr"),
         )
     else:
-        import joblib
         from ciderpress.dft.jax_ks import setup_jax_cider_calc
 
         mlfunc_filename = settings["cider"].pop("mlfunc_filename")
         calc = setup_jax_cider_calc(
             mol,
-            joblib.load(mlfunc_filename),
+            load_mlfunc(mlfunc_filename, mmap_mode=mmap_mode),
             settings["jax"]["xcname"],
             settings["jax"]["params"],
             spinpol=settings["control"]["spinpol"],
@@ -181,7 +214,24 @@ def setup_calc(atoms, settings):
             jax_thr=settings["jax"].get("jax_thr"),
             **(settings["cider"]),
         )
+    if mol.symmetry and not hasattr(calc, "irrep_nelec"):
+        print(
+            "Symmetry: {} calc is not symmetry-adapted, "
+            "running without symmetry".format(type(calc).__name__)
+        )
+        settings = deepcopy(settings_inp)
+        settings["control"]["symmetry"] = False
+        return setup_calc(atoms, settings)
     calc.__dict__.update(settings["calc"])
+    num_threads = choose_num_threads(mol, settings)
+    max_memory = choose_max_memory(mol, settings, default_memory=calc.max_memory)
+
+    integral_control = None
+    if settings["control"].get("integrals") is not None:
+        integral_control = resolve_integrals(
+            mol, calc, settings, nthreads=num_threads, max_memory=max_memory
+        )
+        settings["control"].update(integral_control)
 
     if settings["control"].get("sgx_params") is not None:
         sgx_params = settings["control"].get("sgx_params")
@@ -203,6 +253,9 @@ def setup_calc(atoms, settings):
         calc = calc.apply(scf.addons.remove_linear_dep_)
 
     calc.grids.__dict__.update(settings["grids"])
+    use_grid_cache(calc.grids)
+    if getattr(calc, "nlcgrids", None) is not None:
+        use_grid_cache(calc.nlcgrids)
     if settings["control"].get("dftd3"):
         import dftd3.pyscf as d3
 
@@ -214,6 +267,7 @@ def setup_calc(atoms, settings):
         d3xc = settings["control"].get("dftd3_xc")
         if d3xc is not None:
             calc.with_dftd3.xc = d3xc
+        use_dispersion_cache(calc.with_dftd3, "d3")
     elif settings["control"].get("dftd4"):
         import dftd4.pyscf as pyd4
 
@@ -223,13 +277,554 @@ def setup_calc(atoms, settings):
             calc.with_dftd4 = pyd4.DFTD4Dispersion(
                 calc.mol, xc=d4func.upper().replace(" ", "")
             )
+        use_dispersion_cache(calc.with_dftd4, "d4")
 
     if settings["control"].get("soscf"):
         calc = calc.newton()
 
+    if integral_control is not None:
+        calc.integral_control = integral_control
+    configure_resources(calc, settings, num_threads=num_threads, max_memory=max_memory)
     return calc
 
 
+def build_mol(atoms, settings):
+    mol = gto.Mole()
+    fmt = settings["control"]["mol_format"]
+    if fmt == "xyz_file":
+        mol.atom = atoms
+    elif fmt in ["xyz", "raw", "zmat"]:
+        mol.atom = gto.mole.fromstring(atoms, format=fmt)
+    elif fmt == "pyscf":
+        mol.atom = atoms
+    elif fmt == "ase":
+        from pyscf.pbc.tools.pyscf_ase import atoms_from_ase
+
+        mol.atom = atoms_from_ase(atoms)
+    mol.__dict__.update(settings["mol"])
+    basis, ecp = mol.basis, mol.ecp
+    apply_basis_cache(mol)
+    if settings["control"].get("symmetry"):
+        build_symmetric_mol(mol, settings["control"]["symmetry"])
+    else:
+        mol.build()
+    # keep the names rather than the parsed data in the built mol
+    mol.basis, mol.ecp = basis, ecp
+    return mol
+
+
+def build_symmetric_mol(mol, symmetry):
+    """
+    Build mol with point group symmetry. symmetry is True or a dict
+    with an optional "subgroup" to use instead of the full group.
+    Note that PySCF moves symmetric molecules to a standard orientation.
+    Falls back to building mol without symmetry if the point group
+    cannot be detected or is C1.
+    """
+    from pyscf.lib.exceptions import PointGroupSymmetryError
+
+    opts = symmetry if isinstance(symmetry, dict) else {}
+    mol.symmetry = True
+    mol.symmetry_subgroup = opts.get("subgroup")
+    try:
+        mol.build()
+    except PointGroupSymmetryError as e:
+        print("Symmetry: point group detection failed ({}), using C1".format(e))
+        mol.symmetry = False
+        mol.symmetry_subgroup = None
+        mol.build()
+        return mol
+    if mol.topgroup == "C1":
+        mol.symmetry = False
+        mol.build()
+    else:
+        print("Symmetry: using {} (full group {})".format(mol.groupname, mol.topgroup))
+    return mol
+
+
+def resolve_integrals(mol, calc, settings, nthreads=None, max_memory=None):
+    """
+    Return the control settings (density_fit, only_dfj, sgx_params)
+    for settings["control"]["integrals"], choosing the strategy from
+    the system size and available resources if it is "auto".
+    nthreads and max_memory are the thread count and max_memory the
+    calc will run with (default lib.num_threads() and calc.max_memory).
+    """
+    from orchard.integral_strategy import choose_integral_strategy, get_integral_control
+    from orchard.resources import get_available_memory_mb
+
+    strategy = settings["control"]["integrals"]
+    if strategy == "auto":
+        if max_memory is None:
+            max_memory = calc.max_memory
+        max_memory = min(max_memory, get_available_memory_mb())
+        if nthreads is None:
+            nthreads = lib.num_threads()
+        strategy, costs = choose_integral_strategy(
+            mol, calc, settings, max_memory, nthreads
+        )
+        print(
+            "Integrals: chose {} for nao={} natm={} (max_memory={:.0f} MB, "
+            "threads={}, estimated SCF times: {})".format(
+                strategy,
+                mol.nao_nr(),
+                mol.natm,
+                max_memory,
+                nthreads,
+                ", ".join("{} {:.1f} s".format(k, v) for k, v in costs.items()),
+            )
+        )
+    return get_integral_control(strategy, settings)
+
+
+BASIS_LADDER_DEFAULTS = {
+    "basis": "def2-svp",
+    "grids_level": 1,
+    "density_fit": True,
+    "conv_tol": 1e-6,
+    "max_cycle": 50,
+}
+
+
+def get_basis_ladder_settings(settings):
+    """
+    Settings for the small-basis step of the basis_ladder mode: the
+    small basis, coarse grids, density fitting and a loose convergence
+    threshold. Dispersion and second-order SCF are switched off since
+    they do not affect the guess density, and the thread count and
+    max_memory of the target calc are kept.
+    """
+    ladder = dict(BASIS_LADDER_DEFAULTS)
+    if isinstance(settings["control"].get("basis_ladder"), dict):
+        ladder.update(settings["control"]["basis_ladder"])
+    settings = deepcopy(settings)
+    settings["control"].update(
+        {
+            "basis_ladder": None,
+            "precision_ramp": None,
+            "convergence_fallback": None,
+            "integrals": None,
+            "density_fit": ladder["density_fit"],
+            "sgx_params": None,
+            "dftd3": False,
+            "dftd4": False,
+            "soscf": False,
+            "adaptive_resources": False,
+        }
+    )
+    settings["mol"]["basis"] = ladder["basis"]
+    settings["calc"]["conv_tol"] = ladder["conv_tol"]
+    settings["calc"]["max_cycle"] = ladder["max_cycle"]
+    settings["calc"].pop("chkfile", None)
+    settings["grids"] = {"level": ladder["grids_level"]}
+    if ladder.get("xc") is not None:
+        settings["calc"]["xc"] = ladder["xc"]
+    return settings
+
+
+def get_basis_ladder_guess(atoms, settings, mol):
+    """
+    Converge the calc for atoms in the small basis of the basis_ladder
+    mode and project its density onto mol.
+
+    Returns:
+        dm0, info dict with the basis, cycles and wall time of the
+        small-basis step
+    """
+    ladder_settings = get_basis_ladder_settings(settings)
+    start_time = time.monotonic()
+    small_calc = setup_calc(atoms, ladder_settings)
+    small_calc.kernel()
+    dm = small_calc.make_rdm1()
+    dm0 = scf.addons.project_dm_nr2nr(small_calc.mol, dm, mol)
+    info = {
+        "basis": ladder_settings["mol"]["basis"],
+        "cycles": small_calc.cycles,
+        "converged": bool(small_calc.converged),
+        "wall_time": time.monotonic() - start_time,
+    }
+    return dm0, info
+
+
+PRECISION_RAMP_DEFAULTS = {
+    "grids_level": 1,
+    "conv_tol": 1e-5,
+    "max_cycle": 30,
+    # cycles the final SCF must run before its convergence is accepted
+    "min_final_cycles": 2,
+}
+
+
+def get_precision_ramp_settings(settings):
+    ramp = dict(PRECISION_RAMP_DEFAULTS)
+    if isinstance(settings["control"].get("precision_ramp"), dict):
+        ramp.update(settings["control"]["precision_ramp"])
+    return ramp
+
+
+def run_precision_ramp(calc, settings, dm0=None):
+    """
+    Converge a shallow copy of calc on coarse pruned grids with a loose
+    conv_tol, starting from dm0. The copy shares everything except the
+    grids and the callback with calc (e.g. the DF tensor or in-core
+    ERIs are only built once), so callbacks of calc (telemetry,
+    checkpoints) only see the final SCF.
+
+    Returns:
+        dm0 for the final SCF, info dict with the cycles and wall time
+        of the coarse step
+    """
+    ramp = get_precision_ramp_settings(settings)
+    start_time = time.monotonic()
+    if (
+        getattr(calc, "with_df", None) is None
+        and calc._eri is None
+        and (calc._is_mem_enough() or calc.incore_anyway)
+    ):
+        # build the exact ERIs on calc, or the copy would build its own
+        calc._eri = calc.mol.intor("int2e", aosym="s8")
+    coarse_calc = copy.copy(calc)
+    # the copy does not keep _eri (see SCF.__getstate__)
+    coarse_calc._eri = calc._eri
+    coarse_calc.callback = None
+    coarse_calc.grids = dft.gen_grid.Grids(calc.mol)
+    coarse_calc.grids.level = ramp["grids_level"]
+    coarse_calc.conv_tol = ramp["conv_tol"]
+    coarse_calc.conv_tol_grad = None
+    coarse_calc.max_cycle = ramp["max_cycle"]
+    coarse_calc.chkfile = None
+    coarse_calc.kernel(dm0=dm0)
+    info = {
+        "grids_level": ramp["grids_level"],
+        "conv_tol": ramp["conv_tol"],
+        "cycles": coarse_calc.cycles,
+        "converged": bool(coarse_calc.converged),
+        "wall_time": time.monotonic() - start_time,
+    }
+    return coarse_calc.make_rdm1(), info
+
+
+def finish_precision_ramp(calc, settings):
+    """
+    Make sure the final SCF of the precision_ramp mode, which starts
+    from the coarse-grid density, meets its own conv_tol. PySCF accepts
+    it as soon as one step changes the energy by less than conv_tol,
+    which can happen on the first cycle while the density is still
+    relaxing. The SCF is therefore always restarted from its current
+    density, until it has run at least min_final_cycles cycles and a
+    restart changes the energy by less than conv_tol. calc.cycles is
+    set to the total number of cycles of the final SCF.
+
+    Returns:
+        total number of cycles of the final SCF
+    """
+    min_cycles = get_precision_ramp_settings(settings)["min_final_cycles"]
+    total_cycles = calc.cycles
+    e_prev = None
+    while calc.converged and total_cycles < calc.max_cycle:
+        if (
+            total_cycles >= min_cycles
+            and e_prev is not None
+            and abs(calc.e_tot - e_prev) < calc.conv_tol
+        ):
+            break
+        e_prev = calc.e_tot
+        calc.kernel(dm0=calc.make_rdm1())
+        total_cycles += calc.cycles
+    calc.cycles = total_cycles
+    return total_cycles
+
+
+CONVERGENCE_FALLBACK_STAGES = {
+    "adiis": {"DIIS": "ADIIS", "diis_space": 12},
+    "ediis": {"DIIS": "EDIIS", "diis_space": 12},
+    "damping": {"damp": 0.5, "diis_start_cycle": 6},
+    "level_shift": {"level_shift": 0.3},
+    "soscf": {},
+}
+
+CONVERGENCE_FALLBACK_DEFAULTS = {
+    # stage names from CONVERGENCE_FALLBACK_STAGES or dicts with a
+    # "name" and calc attributes overriding the stage defaults
+    "stages": ["adiis", "damping", "level_shift", "soscf"],
+    "max_cycle": 50,
+}
+
+
+def run_convergence_fallback(calc, settings):
+    """
+    Continue an unconverged SCF from its last density, trying each stage
+    of the convergence_fallback setting in order until one converges.
+    The soscf stage runs calc.newton() and copies the result to calc.
+    calc.cycles is set to the total number of cycles.
+
+    Returns:
+        info dict with the cycles, convergence and wall time per stage
+    """
+    from pyscf.scf import diis
+    from pyscf.soscf.newton_ah import _CIAH_SOSCF
+
+    fallback = dict(CONVERGENCE_FALLBACK_DEFAULTS)
+    if isinstance(settings["control"].get("convergence_fallback"), dict):
+        fallback.update(settings["control"]["convergence_fallback"])
+    info = {"initial_cycles": calc.cycles, "path": []}
+    total_cycles = calc.cycles
+    for stage in fallback["stages"]:
+        if isinstance(stage, dict):
+            stage = dict(stage)
+            name = stage.pop("name")
+            params = dict(CONVERGENCE_FALLBACK_STAGES.get(name, {}))
+            params.update(stage)
+        else:
+            name = stage
+            params = dict(CONVERGENCE_FALLBACK_STAGES[name])
+        if "DIIS" in params:
+            params["DIIS"] = getattr(diis, params["DIIS"])
+        params["max_cycle"] = params.get("max_cycle", fallback["max_cycle"])
+        start_time = time.monotonic()
+        dm = calc.make_rdm1()
+        if name == "soscf" and not isinstance(calc, _CIAH_SOSCF):
+            stage_calc = calc.newton()
+        else:
+            stage_calc = calc
+        old_params = {k: getattr(stage_calc, k) for k in params}
+        stage_calc.__dict__.update(params)
+        stage_calc.kernel(dm0=dm)
+        stage_calc.__dict__.update(old_params)
+        if stage_calc is not calc:
+            for k in ["e_tot", "converged", "mo_energy", "mo_coeff", "mo_occ"]:
+                setattr(calc, k, getattr(stage_calc, k))
+        total_cycles += stage_calc.cycles
+        info["path"].append(
+            {
+                "stage": name,
+                "cycles": stage_calc.cycles,
+                "converged": bool(stage_calc.converged),
+                "e_tot": float(stage_calc.e_tot),
+                "wall_time": time.monotonic() - start_time,
+            }
+        )
+        print(
+            "Convergence fallback: {} {} after {} cycles".format(
+                name,
+                "converged" if stage_calc.converged else "did not converge",
+                stage_calc.cycles,
+            )
+        )
+        if calc.converged:
+            break
+    calc.cycles = total_cycles
+    info["converged"] = bool(calc.converged)
+    return info
+
+
+def run_scf(calc, atoms, settings, dm0=None):
+    """
+    Run the SCF for calc, which was set up by setup_calc(atoms, settings),
+    applying the SCF modes in settings["control"]. If dm0 is given it is
+    used as the initial guess and the basis_ladder step is skipped.
+
+    Returns:
+        dict with information about the SCF modes used
+    """
+    with use_resources(calc):
+        return _run_scf(calc, atoms, settings, dm0=dm0)
+
+
+def _run_scf(calc, atoms, settings, dm0=None):
+    info = {}
+    if calc.mol.symmetry:
+        info["symmetry"] = {
+            "groupname": calc.mol.groupname,
+            "topgroup": calc.mol.topgroup,
+        }
+    ladder = settings["control"].get("basis_ladder")
+    if isinstance(ladder, dict) and ladder.get("basis") is not None:
+        ladder_basis = ladder["basis"]
+    else:
+        ladder_basis = BASIS_LADDER_DEFAULTS["basis"]
+    if ladder_basis == settings["mol"].get("basis"):
+        ladder = None
+    if dm0 is None and ladder:
+        dm0, info["basis_ladder"] = get_basis_ladder_guess(atoms, settings, calc.mol)
+    if settings["control"].get("precision_ramp"):
+        dm0, info["precision_ramp"] = run_precision_ramp(calc, settings, dm0=dm0)
+    calc.kernel(dm0=dm0)
+    if settings["control"].get("precision_ramp"):
+        info["precision_ramp"]["final_cycles"] = finish_precision_ramp(calc, settings)
+    if not calc.converged and settings["control"].get("convergence_fallback"):
+        info["convergence_fallback"] = run_convergence_fallback(calc, settings)
+    return info
+
+
+def convert_dm_spin(dm, unrestricted):
+    """
+    Convert a density matrix between the restricted (nao, nao) and
+    unrestricted (2, nao, nao) forms.
+    """
+    if unrestricted and dm.ndim == 2:
+        return np.stack([0.5 * dm, 0.5 * dm])
+    if not unrestricted and dm.ndim == 3:
+        return dm[0] + dm[1]
+    return dm
+
+
+def _is_plain_ks(calc, settings):
+    return (
+        settings.get("cider") is None
+        and settings.get("jax") is None
+        and isinstance(calc, dft.rks.KohnShamDFT)
+        and not calc.nlc
+        and not calc._numint.libxc.is_nlc(calc.xc)
+    )
+
+
+def _get_jk_key(calc):
+    with_df = getattr(calc, "with_df", None)
+    if with_df is None:
+        return None
+    return (type(with_df).__name__, repr(getattr(with_df, "auxbasis", None)))
+
+
+def get_nscf_energies(calc, settings, atoms, functional_settings):
+    """
+    Evaluate total energies of several functionals non-self-consistently
+    on the density of the converged calc.
+
+    For libxc functionals (no CIDER/JAX, no VV10) with the same grids
+    and spin treatment as calc, the one-electron term is computed once,
+    the Coulomb and exact exchange terms once per density-fitting basis
+    (the one each functional's own calc would use), and the XC energies
+    of all such functionals are computed in a single pass over the
+    grid. Dispersion corrections are included through energy_nuc of the
+    calc set up for each functional. Other functionals are evaluated
+    with energy_tot of their own calc.
+
+    Args:
+        calc: converged calc, set up from atoms and settings
+        settings (dict): settings of calc
+        atoms: Atoms object
+        functional_settings (dict): {name: full settings dict}
+
+    Returns:
+        dict {name: {"e_tot": float, "mode": "grid_pass" or "energy_tot"}}
+    """
+    with use_resources(calc):
+        return _get_nscf_energies(calc, settings, atoms, functional_settings)
+
+
+def _get_nscf_energies(calc, settings, atoms, functional_settings):
+    mol = calc.mol
+    dm = np.asarray(calc.make_rdm1())
+    spin_dm = dm.ndim == 3
+    dm_tot = dm[0] + dm[1] if spin_dm else dm
+    results = {}
+    grid_pass = {}
+    for name, fsettings in functional_settings.items():
+        nscf_calc = setup_calc(atoms, fsettings)
+        same_grids = fsettings["grids"] == settings["grids"]
+        unrestricted = isinstance(nscf_calc, scf.uhf.UHF)
+        if (
+            _is_plain_ks(nscf_calc, fsettings)
+            and same_grids
+            and unrestricted == spin_dm
+        ):
+            grid_pass[name] = nscf_calc
+            continue
+        if same_grids and calc.grids.coords is not None:
+            nscf_calc.grids = calc.grids
+        e_tot = nscf_calc.energy_tot(dm=convert_dm_spin(dm, unrestricted))
+        results[name] = {"e_tot": float(e_tot), "mode": "energy_tot"}
+    if len(grid_pass) == 0:
+        return results
+
+    ni = calc._numint
+    e1 = float(np.einsum("ij,ji->", calc.get_hcore(), dm_tot).real)
+    calc_key = _get_jk_key(calc)
+    coul_cache = {}
+    exx_cache = {}
+
+    def _jk_calc(nscf_calc):
+        # J and K are evaluated with the integrals of each functional's
+        # own calc (e.g. a hybrid uses a JK fit where a pure functional
+        # uses a J-only fit), reusing calc when they are the same
+        key = _get_jk_key(nscf_calc)
+        return key, (calc if key == calc_key else nscf_calc)
+
+    def _coul(nscf_calc):
+        key, jk_calc = _jk_calc(nscf_calc)
+        if key not in coul_cache:
+            vj = jk_calc.get_j(mol, dm_tot, hermi=1)
+            coul_cache[key] = 0.5 * float(np.einsum("ij,ji->", dm_tot, vj).real)
+        return coul_cache[key]
+
+    def _exx(nscf_calc, omega):
+        # exact exchange energy of dm for the (range-separated) Coulomb
+        # operator with the given omega, without any prefactor
+        key, jk_calc = _jk_calc(nscf_calc)
+        if (key, omega) not in exx_cache:
+            vk = jk_calc.get_k(mol, dm, hermi=1, omega=omega or None)
+            if spin_dm:
+                exx = -0.5 * float(np.einsum("sij,sji->", dm, vk).real)
+            else:
+                exx = -0.25 * float(np.einsum("ij,ji->", dm, vk).real)
+            exx_cache[(key, omega)] = exx
+        return exx_cache[(key, omega)]
+
+    energies = {}
+    for name, nscf_calc in grid_pass.items():
+        xc = nscf_calc.xc
+        energy = e1 + _coul(nscf_calc) + nscf_calc.energy_nuc()
+        if ni.libxc.is_hybrid_xc(xc):
+            omega, alpha, hyb = ni.rsh_and_hybrid_coeff(xc, spin=mol.spin)
+            if omega == 0:
+                energy += hyb * _exx(nscf_calc, 0)
+            elif alpha == 0:
+                energy += hyb * _exx(nscf_calc, -omega)
+            elif hyb == 0:
+                energy += alpha * _exx(nscf_calc, omega)
+            else:
+                energy += hyb * _exx(nscf_calc, 0) + (alpha - hyb) * _exx(
+                    nscf_calc, omega
+                )
+        energies[name] = energy
+
+    # single pass over the grid for the semilocal XC energies
+    grids = calc.grids
+    if grids.coords is None:
+        grids.build(with_non0tab=True)
+    mo_coeff = calc.mo_coeff
+    mo_occ = calc.mo_occ
+    nao = mol.nao_nr()
+    for ao, mask, weight, coords in ni.block_loop(
+        mol, grids, nao, deriv=1, max_memory=calc.max_memory
+    ):
+        if spin_dm:
+            rho = np.stack(
+                [
+                    ni.eval_rho2(
+                        mol, ao, mo_coeff[s], mo_occ[s], mask, "MGGA", with_lapl=False
+                    )
+                    for s in range(2)
+                ]
+            )
+            rho0 = rho[0, 0] + rho[1, 0]
+        else:
+            rho = ni.eval_rho2(mol, ao, mo_coeff, mo_occ, mask, "MGGA", with_lapl=False)
+            rho0 = rho[0]
+        for name, nscf_calc in grid_pass.items():
+            xctype = ni._xc_type(nscf_calc.xc)
+            if xctype == "HF":
+                continue
+            nvar = {"LDA": 1, "GGA": 4, "MGGA": 5}[xctype]
+            sub = rho[..., :nvar, :] if nvar > 1 else rho[..., 0, :]
+            exc = ni.eval_xc_eff(nscf_calc.xc, sub, deriv=0, xctype=xctype)[0]
+            energies[name] += float(np.dot(weight * rho0, exc))
+    for name, energy in energies.items():
+        results[name] = {"e_tot": energy, "mode": "grid_pass"}
+    return results
+
+
 def update_calc_settings(calc, settings_update):
     calc.__dict__.update(settings_update)
     return calc
@@ -26,9 +26,38 @@ import yaml
 from ase import Atoms
 from fireworks import FiretaskBase, Firework, FWAction
 from fireworks.utilities.fw_utilities import explicit_serialize
-from pyscf import lib
+from pyscf import lib, scf
 
-from orchard import pyscf_caller
+from orchard import pyscf_caller, workflow_utils
+from orchard.df_store import load_df_tensor, save_df_tensor
+from orchard.resource_config import get_num_threads
+from orchard.results_catalog import record_analysis, record_result
+from orchard.scf_checkpoint import (
+    get_checkpoint_file,
+    get_checkpoint_key,
+    get_checkpoint_settings,
+    remove_checkpoint,
+    resume_from_checkpoint,
+    setup_checkpointing,
+)
+from orchard.scf_handles import (
+    dump_calc,
+    get_calc,
+    get_chkfile_path,
+    get_rdm1,
+    move_handle,
+    register_calc,
+    register_lazy_result,
+)
+from orchard.scf_telemetry import add_telemetry, use_telemetry, write_telemetry
+from orchard.scf_timing import (
+    PhaseTimer,
+    add_phase,
+    instrument_calc,
+    remove_timer,
+    untimed_class,
+)
+from orchard.warm_start import finalize_init_guess_info, find_initial_guess
 from orchard.workflow_utils import get_save_dir
 
 DEFAULT_PYSCF_SETTINGS = {
@@ -68,20 +97,62 @@ def get_pyscf_settings(settings_inp, default_settings=DEFAULT_PYSCF_SETTINGS):
 class SCFCalc(FiretaskBase):
 
     required_params = ["struct", "settings", "method_name", "system_id"]
-    optional_params = ["require_converged", "method_description"]
+    optional_params = ["require_converged", "method_description", "save_root_dir"]
 
     def run_task(self, fw_spec):
         settings = get_pyscf_settings(self["settings"])
         start_time = time.monotonic()
-        calc = pyscf_caller.setup_calc(Atoms.fromdict(self["struct"]), settings)
-        calc.kernel()
+        atoms = Atoms.fromdict(self["struct"])
+        ckpt_key = get_checkpoint_key(self["struct"], settings)
+        timer = PhaseTimer()
+        with timer.phase("mol_build"):
+            mol = pyscf_caller.build_mol(atoms, settings)
+        with timer.phase("setup"):
+            calc = pyscf_caller.setup_calc(atoms, settings, mol=mol)
+        instrument_calc(calc, timer)
+        telemetry = add_telemetry(calc) if use_telemetry(settings) else None
+        # store the concrete integral settings if they were chosen by "auto"
+        settings["control"].update(getattr(calc, "integral_control", None) or {})
+        calc.chkfile = get_chkfile_path()
+        save_root_dir = self.get("save_root_dir") or workflow_utils.SAVE_ROOT
+        dm0 = None
+        init_guess = {"method": "default"}
+        ckpt = get_checkpoint_settings(settings)
+        if ckpt is not None:
+            ckpt_file = get_checkpoint_file(
+                save_root_dir, settings, self["system_id"], self["method_name"]
+            )
+            dm0, ckpt_info = resume_from_checkpoint(calc, ckpt_file, ckpt_key)
+            if dm0 is not None:
+                init_guess = ckpt_info
+            old_callback = setup_checkpointing(
+                calc,
+                ckpt_file,
+                ckpt_key,
+                ckpt["every"],
+                start_cycle=(ckpt_info or {}).get("cycle", 0),
+            )
+        if dm0 is None and settings["control"].get("warm_start"):
+            dm0, init_guess = find_initial_guess(
+                calc, self["system_id"], save_root_dir, self["method_name"]
+            )
+            print("Initial guess:", init_guess)
+        with timer.phase("scf"):
+            scf_modes = pyscf_caller.run_scf(calc, atoms, settings, dm0=dm0)
         stop_time = time.monotonic()
         if self.get("require_converged") is None:
             self["require_converged"] = True
         if (not calc.converged) and self["require_converged"]:
             raise RuntimeError("SCF calculation did not converge!")
+        if ckpt is not None:
+            calc.callback = old_callback
+            remove_checkpoint(ckpt_file)
+        with timer.phase("dump"):
+            dump_calc(calc, calc.chkfile)
+        timings = timer.summary(calc.mol, calc.grids, threads=get_num_threads(calc))
+        remove_timer(calc)
         update_spec = {
-            "calc": calc,
+            "calc_handle": register_calc(calc, calc.chkfile, converged=calc.converged),
             "e_tot": calc.e_tot,
             "converged": calc.converged,
             "method_name": self["method_name"],
@@ -91,14 +162,20 @@ class SCFCalc(FiretaskBase):
             "struct": self["struct"],
             "system_id": self["system_id"],
             "wall_time": stop_time - start_time,
+            "scf_cycles": calc.cycles,
+            "scf_modes": scf_modes,
+            "init_guess": finalize_init_guess_info(init_guess, calc),
+            "timings": timings,
+            "scf_telemetry": telemetry and telemetry.to_dict(),
         }
-        return FWAction(update_spec=update_spec)
+        return FWAction(update_spec=update_spec, stored_data={"timings": timings})
 
 
 @explicit_serialize
 class LoadSCFCalc(FiretaskBase):
 
     required_params = ["save_root_dir", "method_name", "basis", "system_id"]
+    optional_params = ["dm_only"]
 
     def run_task(self, fw_spec):
         load_dir = get_save_dir(
@@ -110,18 +187,37 @@ class LoadSCFCalc(FiretaskBase):
         )
         hdf5file = os.path.join(load_dir, "data.hdf5")
         in_file = os.path.join(load_dir, "run_info.yaml")
+        if not os.path.exists(hdf5file):
+            nscf_dir = get_save_dir(
+                self["save_root_dir"],
+                "NSCF",
+                self["basis"],
+                self["system_id"],
+                functional=self["method_name"],
+            )
+            msg = "No SCF data to load in {}".format(load_dir)
+            if os.path.exists(nscf_dir):
+                msg += " ({} is a non-self-consistent result)".format(nscf_dir)
+            raise FileNotFoundError(msg)
         with open(in_file, "r") as f:
             in_data = yaml.load(f, Loader=yaml.Loader)
-        calc = pyscf_caller.setup_calc(
-            Atoms.fromdict(in_data["struct"]), in_data["settings"]
-        )
-        calc.e_tot = lib.chkfile.load(hdf5file, "calc/e_tot")
-        calc.mo_coeff = lib.chkfile.load(hdf5file, "calc/mo_coeff")
-        calc.mo_energy = lib.chkfile.load(hdf5file, "calc/mo_energy")
-        calc.mo_occ = lib.chkfile.load(hdf5file, "calc/mo_occ")
+        # The calc is only rebuilt (by get_calc) when a task needs it.
+        handle = {
+            "id": "{}:{}".format(hdf5file, os.stat(hdf5file).st_mtime_ns),
+            "chkfile": hdf5file,
+            "key": "calc",
+            "save_root_dir": self["save_root_dir"],
+        }
+        if in_data.get("converged") is not None:
+            handle["converged"] = bool(in_data["converged"])
+        if self.get("dm_only"):
+            handle["dm_only"] = True
+        # nothing is read or built until a following task needs it
+        register_lazy_result(handle, in_data["struct"], in_data["settings"])
         update_spec = {
             "basis": self["basis"],
-            "calc": calc,
+            "calc_handle": handle,
+            "converged": handle.get("converged"),
             "method_name": self["method_name"],
             "settings": in_data["settings"],
             "struct": in_data["struct"],
@@ -134,22 +230,70 @@ class LoadSCFCalc(FiretaskBase):
 class SCFCalcFromRestart(FiretaskBase):
 
     required_params = ["new_settings", "new_method_name"]
-    optional_params = ["require_converged", "new_method_description"]
+    optional_params = ["require_converged", "new_method_description", "save_root_dir"]
 
     def run_task(self, fw_spec):
         settings = get_pyscf_settings(
             self["new_settings"], default_settings=fw_spec["settings"]
         )
         start_time = time.monotonic()
-        calc = pyscf_caller.setup_calc(Atoms.fromdict(fw_spec["struct"]), settings)
-        calc.kernel(dm0=fw_spec["calc"].make_rdm1())
+        atoms = Atoms.fromdict(fw_spec["struct"])
+        ckpt_key = get_checkpoint_key(fw_spec["struct"], settings)
+        timer = PhaseTimer()
+        with timer.phase("mol_build"):
+            mol = pyscf_caller.build_mol(atoms, settings)
+        with timer.phase("setup"):
+            calc = pyscf_caller.setup_calc(atoms, settings, mol=mol)
+            load_df_tensor(calc, fw_spec.get("calc_handle", {}).get("save_root_dir"))
+        instrument_calc(calc, timer)
+        telemetry = add_telemetry(calc) if use_telemetry(settings) else None
+        calc.chkfile = get_chkfile_path()
+        dm0 = None
+        init_guess = None
+        ckpt = get_checkpoint_settings(settings)
+        if ckpt is not None:
+            save_root_dir = (
+                self.get("save_root_dir")
+                or fw_spec.get("calc_handle", {}).get("save_root_dir")
+                or workflow_utils.SAVE_ROOT
+            )
+            ckpt_file = get_checkpoint_file(
+                save_root_dir, settings, fw_spec["system_id"], self["new_method_name"]
+            )
+            dm0, init_guess = resume_from_checkpoint(calc, ckpt_file, ckpt_key)
+            old_callback = setup_checkpointing(
+                calc,
+                ckpt_file,
+                ckpt_key,
+                ckpt["every"],
+                start_cycle=(init_guess or {}).get("cycle", 0),
+            )
+        symmetry_changed = bool(settings["control"].get("symmetry")) != bool(
+            fw_spec["settings"]["control"].get("symmetry")
+        )
+        if dm0 is None and symmetry_changed:
+            # symmetric molecules are reoriented, so the old density
+            # is not in the same frame
+            print("Symmetry setting changed, not using the old density")
+        elif dm0 is None:
+            with timer.phase("load_dm"):
+                dm0 = get_rdm1(fw_spec)
+        with timer.phase("scf"):
+            scf_modes = pyscf_caller.run_scf(calc, atoms, settings, dm0=dm0)
         stop_time = time.monotonic()
         if self.get("require_converged") is None:
             self["require_converged"] = True
         if (not calc.converged) and self["require_converged"]:
             raise RuntimeError("SCF calculation did not converge!")
+        if ckpt is not None:
+            calc.callback = old_callback
+            remove_checkpoint(ckpt_file)
+        with timer.phase("dump"):
+            dump_calc(calc, calc.chkfile)
+        timings = timer.summary(calc.mol, calc.grids, threads=get_num_threads(calc))
+        remove_timer(calc)
         update_spec = {
-            "calc": calc,
+            "calc_handle": register_calc(calc, calc.chkfile, converged=calc.converged),
             "e_tot": calc.e_tot,
             "converged": calc.converged,
             "method_name": self["new_method_name"],
@@ -157,65 +301,483 @@ class SCFCalcFromRestart(FiretaskBase):
             "pyscf_atoms": calc.mol._atom,
             "settings": settings,
             "wall_time": stop_time - start_time,
+            "scf_cycles": calc.cycles,
+            "scf_modes": scf_modes,
+            "init_guess": init_guess,
+            "timings": timings,
+            "scf_telemetry": telemetry and telemetry.to_dict(),
         }
-        return FWAction(update_spec=update_spec)
+        return FWAction(update_spec=update_spec, stored_data={"timings": timings})
+
+
+def save_scf_results(
+    save_root_dir,
+    calc,
+    spec,
+    no_overwrite=False,
+    write_data=True,
+    update_catalog=True,
+    save_df=False,
+    mo_storage=None,
+    calc_type="KS",
+):
+    """
+    Save a converged calc in the <calc_type>/<functional>/<basis>/<system_id>
+    layout of save_root_dir. spec contains the same keys as the spec
+    SaveSCFResults reads (system_id, method_name, struct, settings,
+    e_tot, converged, wall_time, method_description and optionally
+    scf_cycles, scf_modes, init_guess, nscf, timings and
+    scf_telemetry). The time spent writing files is added to timings
+    as the "save" phase, and scf_telemetry is written to
+    scf_telemetry.npz.
+    mo_storage selects compact MO storage in data.hdf5, see
+    results_io.write_scf_data.
+
+    Returns:
+        save_dir
+    """
+    timer = PhaseTimer()
+    basis = calc.mol.basis
+    save_dir = get_save_dir(
+        save_root_dir,
+        calc_type,
+        basis,
+        spec["system_id"],
+        functional=spec["method_name"],
+    )
+    os.makedirs(save_dir, exist_ok=not no_overwrite)
+
+    with timer.phase("save"):
+        chkmol = os.path.join(save_dir, "mol.chk")
+        lib.chkfile.save_mol(calc.mol, chkmol)
+        mo_storage_info = None
+        if write_data:
+            hdf5file = os.path.join(save_dir, "data.hdf5")
+            mo_storage_info = dump_calc(
+                calc, hdf5file, key="calc", mo_storage=mo_storage
+            )
+        if spec.get("scf_telemetry") is not None:
+            write_telemetry(save_dir, spec["scf_telemetry"])
+    out_data = {
+        "struct": spec["struct"],
+        "settings": spec["settings"],
+        "e_tot": spec["e_tot"],
+        # since e_tot is numpy double scalar
+        "e_tot_readable": float(spec["e_tot"]),
+        "converged": spec["converged"],
+        "conv_tol": calc.conv_tol,
+        "wall_time": spec["wall_time"],
+        "method_description": spec["method_description"],
+    }
+    for k in ["scf_cycles", "scf_modes", "init_guess", "nscf"]:
+        if spec.get(k) is not None:
+            out_data[k] = spec[k]
+    if mo_storage is not None and mo_storage_info is not None:
+        out_data["mo_storage"] = mo_storage_info
+    if spec.get("timings") is not None:
+        save_time = timer.phases["save"]
+        out_data["timings"] = add_phase(
+            spec["timings"], "save", save_time["wall"], save_time["cpu"]
+        )
+    out_file = os.path.join(save_dir, "run_info.yaml")
+    with open(out_file, "w") as f:
+        yaml.dump(out_data, f)
+    if save_df:
+        save_df_tensor(calc, save_root_dir)
+
+    if update_catalog:
+        record_result(
+            save_root_dir,
+            calc_type,
+            spec["method_name"],
+            basis,
+            spec["system_id"],
+            e_tot=spec["e_tot"],
+            converged=spec["converged"],
+            wall_time=spec["wall_time"],
+            files=os.listdir(save_dir),
+        )
+    return save_dir
 
 
 @explicit_serialize
 class SaveSCFResults(FiretaskBase):
 
     required_params = ["save_root_dir"]
-    optional_params = ["no_overwrite", "write_data"]
+    optional_params = [
+        "no_overwrite",
+        "write_data",
+        "update_catalog",
+        "save_df_tensor",
+        "mo_storage",
+    ]
 
     def run_task(self, fw_spec):
-        save_dir = get_save_dir(
+        if self.get("write_data") is None:
+            self["write_data"] = True
+        calc = get_calc(fw_spec)
+        save_dir = save_scf_results(
             self["save_root_dir"],
-            "KS",
-            fw_spec["calc"].mol.basis,
-            fw_spec["system_id"],
-            functional=fw_spec["method_name"],
+            calc,
+            fw_spec,
+            no_overwrite=bool(self.get("no_overwrite")),
+            write_data=self["write_data"],
+            update_catalog=self.get("update_catalog") is None or self["update_catalog"],
+            save_df=bool(self.get("save_df_tensor")),
+            mo_storage=self.get("mo_storage"),
         )
-        if self.get("no_overwrite"):
-            exist_ok = False
-        else:
-            exist_ok = True
-        os.makedirs(save_dir, exist_ok=exist_ok)
+        stored_data = {"save_dir": save_dir}
+        if fw_spec.get("timings") is not None:
+            stored_data["timings"] = fw_spec["timings"]
+        update_spec = {}
+        handle = fw_spec.get("calc_handle")
+        if self["write_data"] and handle is not None and handle["key"] == "scf":
+            # the results are stored now, so the scratch chkfile can go
+            update_spec["calc_handle"] = move_handle(
+                handle, os.path.join(save_dir, "data.hdf5")
+            )
+            if getattr(calc, "chkfile", None) == handle["chkfile"]:
+                calc.chkfile = None
+        return FWAction(update_spec=update_spec, stored_data=stored_data)
 
-        calc = fw_spec["calc"]
-        chkmol = os.path.join(save_dir, "mol.chk")
-        lib.chkfile.save_mol(calc.mol, chkmol)
-        if self.get("write_data") is None:
-            self["write_data"] = True
-        if self["write_data"]:
-            hdf5file = os.path.join(save_dir, "data.hdf5")
-            lib.chkfile.save(hdf5file, "calc/e_tot", calc.e_tot)
-            lib.chkfile.save(hdf5file, "calc/mo_coeff", calc.mo_coeff)
-            lib.chkfile.save(hdf5file, "calc/mo_energy", calc.mo_energy)
-            lib.chkfile.save(hdf5file, "calc/mo_occ", calc.mo_occ)
-        out_data = {
-            "struct": fw_spec["struct"],
-            "settings": fw_spec["settings"],
-            "e_tot": fw_spec["e_tot"],
-            "e_tot_readable": float(
-                fw_spec["e_tot"]
-            ),  # since e_tot is numpy double scalar
-            "converged": fw_spec["converged"],
-            "conv_tol": calc.conv_tol,
-            "wall_time": fw_spec["wall_time"],
-            "method_description": fw_spec["method_description"],
-        }
-        out_file = os.path.join(save_dir, "run_info.yaml")
-        with open(out_file, "w") as f:
-            yaml.dump(out_data, f)
 
-        return FWAction(stored_data={"save_dir": save_dir})
+def _share_integrals(calc, ref_calc, share_grids=True):
+    """
+    Let calc reuse the grids and integrals of ref_calc, which has the
+    same geometry and basis (only charge, spin and functional may
+    differ). DF tensors are only shared if the auxiliary basis is the
+    same, and grids only if share_grids is True.
+    """
+    if share_grids and ref_calc.grids.coords is not None:
+        calc.grids = ref_calc.grids
+    nlcgrids = getattr(ref_calc, "nlcgrids", None)
+    if nlcgrids is not None and nlcgrids.coords is not None:
+        calc.nlcgrids = nlcgrids
+    with_df = getattr(calc, "with_df", None)
+    ref_with_df = getattr(ref_calc, "with_df", None)
+    if (
+        with_df is not None
+        and untimed_class(with_df) is untimed_class(ref_with_df)
+        and getattr(ref_with_df, "_cderi", None) is not None
+        and with_df.auxbasis == ref_with_df.auxbasis
+    ):
+        with_df._cderi = ref_with_df._cderi
+        with_df.auxmol = ref_with_df.auxmol
+    if (
+        with_df is not None
+        and untimed_class(with_df) is untimed_class(ref_with_df)
+        and getattr(ref_with_df, "_vjopt", None) is not None
+        and with_df.auxbasis == ref_with_df.auxbasis
+    ):
+        # J-only DF (pure functionals) builds _vjopt instead of _cderi
+        with_df._vjopt = ref_with_df._vjopt
+        with_df.auxmol = ref_with_df.auxmol
+    if getattr(ref_calc, "_eri", None) is not None:
+        calc._eri = ref_calc._eri
+
+
+@explicit_serialize
+class SCFCalcGeometryFamily(FiretaskBase):
+    """
+    Run SCF calcs for several charge/spin states of one geometry, e.g.
+    a neutral molecule and its ions. The grids and integrals are built
+    by the first calc and shared by the others, and each state is saved
+    like SaveSCFResults would. members is a list of dicts with keys
+    system_id, charge and spin.
+    """
+
+    required_params = [
+        "struct",
+        "settings",
+        "method_name",
+        "members",
+        "save_root_dir",
+    ]
+    optional_params = [
+        "require_converged",
+        "method_description",
+        "no_overwrite",
+        "write_data",
+        "update_catalog",
+        "mo_storage",
+    ]
+
+    def run_task(self, fw_spec):
+        atoms = Atoms.fromdict(self["struct"])
+        require_converged = self.get("require_converged")
+        if require_converged is None:
+            require_converged = True
+        write_data = self.get("write_data")
+        if write_data is None:
+            write_data = True
+        ref_calc = None
+        save_dirs = []
+        failed = []
+        for member in self["members"]:
+            settings = get_pyscf_settings(self["settings"])
+            settings["mol"]["charge"] = member["charge"]
+            settings["mol"]["spin"] = member["spin"]
+            if member["spin"] != 0:
+                settings["control"]["spinpol"] = True
+            start_time = time.monotonic()
+            timer = PhaseTimer()
+            with timer.phase("setup"):
+                calc = pyscf_caller.setup_calc(atoms, settings)
+            settings["control"].update(getattr(calc, "integral_control", None) or {})
+            if ref_calc is not None:
+                _share_integrals(calc, ref_calc)
+            instrument_calc(calc, timer)
+            telemetry = add_telemetry(calc) if use_telemetry(settings) else None
+            with timer.phase("scf"):
+                scf_modes = pyscf_caller.run_scf(calc, atoms, settings)
+            timings = timer.summary(calc.mol, calc.grids, threads=get_num_threads(calc))
+            remove_timer(calc)
+            stop_time = time.monotonic()
+            if ref_calc is None:
+                ref_calc = calc
+            if not calc.converged:
+                failed.append(member["system_id"])
+                if require_converged:
+                    continue
+            spec = {
+                "e_tot": calc.e_tot,
+                "converged": calc.converged,
+                "method_name": self["method_name"],
+                "method_description": self.get("method_description"),
+                "settings": settings,
+                "struct": self["struct"],
+                "system_id": member["system_id"],
+                "wall_time": stop_time - start_time,
+                "scf_cycles": calc.cycles,
+                "scf_modes": scf_modes,
+                "timings": timings,
+                "scf_telemetry": telemetry and telemetry.to_dict(),
+            }
+            save_dirs.append(
+                save_scf_results(
+                    self["save_root_dir"],
+                    calc,
+                    spec,
+                    no_overwrite=bool(self.get("no_overwrite")),
+                    write_data=write_data,
+                    update_catalog=self.get("update_catalog") is None
+                    or self["update_catalog"],
+                    mo_storage=self.get("mo_storage"),
+                )
+            )
+        if require_converged and len(failed) > 0:
+            raise RuntimeError(
+                "SCF calculation did not converge for {}".format(", ".join(failed))
+            )
+        return FWAction(stored_data={"save_dirs": save_dirs})
+
+
+@explicit_serialize
+class SCFSweep(FiretaskBase):
+    """
+    Run SCF calcs for several settings variants (e.g. functionals) of
+    one system in a single process. variants is a list of dicts with
+    keys method_name, settings and optionally method_description.
+    The Mole is reused when the mol settings do not change, grids when
+    the grids settings do not change, and DF tensors when the auxiliary
+    basis does not change. Each calc starts from the density of the
+    previous converged calc (projected if the basis changes). Each
+    variant is saved like SaveSCFResults would, with its own wall time.
+    """
+
+    required_params = [
+        "struct",
+        "system_id",
+        "variants",
+        "save_root_dir",
+    ]
+    optional_params = [
+        "require_converged",
+        "no_overwrite",
+        "write_data",
+        "update_catalog",
+        "mo_storage",
+    ]
+
+    def run_task(self, fw_spec):
+        atoms = Atoms.fromdict(self["struct"])
+        require_converged = self.get("require_converged")
+        if require_converged is None:
+            require_converged = True
+        write_data = self.get("write_data")
+        if write_data is None:
+            write_data = True
+        ref_calc = None
+        ref_settings = None
+        ref_name = None
+        save_dirs = []
+        failed = []
+        for variant in self["variants"]:
+            settings = get_pyscf_settings(variant["settings"])
+            start_time = time.monotonic()
+            same_mol = ref_settings is not None and all(
+                settings["control"].get(k) == ref_settings["control"].get(k)
+                for k in ["mol_format", "symmetry"]
+            )
+            same_mol = same_mol and settings["mol"] == ref_settings["mol"]
+            timer = PhaseTimer()
+            with timer.phase("setup"):
+                calc = pyscf_caller.setup_calc(
+                    atoms, settings, mol=ref_calc.mol if same_mol else None
+                )
+            settings["control"].update(getattr(calc, "integral_control", None) or {})
+            sweep_info = {"reused_mol": same_mol}
+            dm0 = None
+            if same_mol:
+                share_grids = settings["grids"] == ref_settings["grids"]
+                _share_integrals(calc, ref_calc, share_grids=share_grids)
+                sweep_info["reused_grids"] = share_grids
+            if ref_calc is not None and settings["control"].get(
+                "symmetry"
+            ) == ref_settings["control"].get("symmetry"):
+                dm0 = ref_calc.make_rdm1()
+                if not same_mol:
+                    dm0 = scf.addons.project_dm_nr2nr(ref_calc.mol, dm0, calc.mol)
+                dm0 = pyscf_caller.convert_dm_spin(dm0, settings["control"]["spinpol"])
+                sweep_info["dm0_from"] = ref_name
+            instrument_calc(calc, timer)
+            telemetry = add_telemetry(calc) if use_telemetry(settings) else None
+            with timer.phase("scf"):
+                scf_modes = pyscf_caller.run_scf(calc, atoms, settings, dm0=dm0)
+            timings = timer.summary(calc.mol, calc.grids, threads=get_num_threads(calc))
+            remove_timer(calc)
+            scf_modes["sweep"] = sweep_info
+            stop_time = time.monotonic()
+            print(
+                "SCFSweep {}: {} ({:.2f} s, {} cycles)".format(
+                    variant["method_name"],
+                    calc.e_tot,
+                    stop_time - start_time,
+                    calc.cycles,
+                )
+            )
+            if calc.converged or ref_calc is None:
+                ref_calc = calc
+                ref_settings = settings
+                ref_name = variant["method_name"]
+            if not calc.converged:
+                failed.append(variant["method_name"])
+                if require_converged:
+                    continue
+            spec = {
+                "e_tot": calc.e_tot,
+                "converged": calc.converged,
+                "method_name": variant["method_name"],
+                "method_description": variant.get("method_description"),
+                "settings": settings,
+                "struct": self["struct"],
+                "system_id": self["system_id"],
+                "wall_time": stop_time - start_time,
+                "scf_cycles": calc.cycles,
+                "scf_modes": scf_modes,
+                "timings": timings,
+                "scf_telemetry": telemetry and telemetry.to_dict(),
+            }
+            save_dirs.append(
+                save_scf_results(
+                    self["save_root_dir"],
+                    calc,
+                    spec,
+                    no_overwrite=bool(self.get("no_overwrite")),
+                    write_data=write_data,
+                    update_catalog=self.get("update_catalog") is None
+                    or self["update_catalog"],
+                    mo_storage=self.get("mo_storage"),
+                )
+            )
+        if require_converged and len(failed) > 0:
+            raise RuntimeError(
+                "SCF calculation did not converge for {}".format(", ".join(failed))
+            )
+        return FWAction(stored_data={"save_dirs": save_dirs})
+
+
+@explicit_serialize
+class NSCFMultiFunctional(FiretaskBase):
+    """
+    Evaluate several functionals non-self-consistently on the density
+    of the calc in the spec (e.g. from LoadSCFCalc), and save each
+    energy in the NSCF/<name>/<basis>/<system_id> layout, which holds
+    no data.hdf5 and is kept apart from the SCF results. functionals
+    maps the method name to save under to new_settings, which update
+    the settings of the loaded calc like in SCFCalcFromRestart (set
+    "cider" or "jax" to None to drop them). See
+    pyscf_caller.get_nscf_energies.
+    """
+
+    required_params = ["functionals", "save_root_dir"]
+    optional_params = ["no_overwrite", "update_catalog", "method_descriptions"]
+
+    def run_task(self, fw_spec):
+        calc = get_calc(fw_spec)
+        # the convergence of the SCF that produced the density, which a
+        # rebuilt calc does not know
+        converged = fw_spec.get("converged")
+        if converged is None:
+            converged = fw_spec.get("calc_handle", {}).get("converged")
+        if converged is None:
+            converged = calc.converged
+        atoms = Atoms.fromdict(fw_spec["struct"])
+        functional_settings = {
+            name: get_pyscf_settings(new_settings, default_settings=fw_spec["settings"])
+            for name, new_settings in self["functionals"].items()
+        }
+        start_time = time.monotonic()
+        results = pyscf_caller.get_nscf_energies(
+            calc, fw_spec["settings"], atoms, functional_settings
+        )
+        # all functionals share one pass, so only the total is known
+        wall_time = time.monotonic() - start_time
+        descriptions = self.get("method_descriptions") or {}
+        save_dirs = []
+        for name, res in results.items():
+            print("NSCF {}: {} ({})".format(name, res["e_tot"], res["mode"]))
+            spec = {
+                "e_tot": res["e_tot"],
+                "converged": bool(converged),
+                "method_name": name,
+                "method_description": descriptions.get(name),
+                "settings": functional_settings[name],
+                "struct": fw_spec["struct"],
+                "system_id": fw_spec["system_id"],
+                "wall_time": None,
+                "nscf": {
+                    "source_method_name": fw_spec["method_name"],
+                    "mode": res["mode"],
+                    "functionals": sorted(results),
+                    "wall_time": wall_time,
+                },
+            }
+            save_dirs.append(
+                save_scf_results(
+                    self["save_root_dir"],
+                    calc,
+                    spec,
+                    no_overwrite=bool(self.get("no_overwrite")),
+                    write_data=False,
+                    update_catalog=self.get("update_catalog") is None
+                    or self["update_catalog"],
+                    calc_type="NSCF",
+                )
+            )
+        return FWAction(stored_data={"save_dirs": save_dirs})
 
 
 @explicit_serialize
 class RunAnalysis(FiretaskBase):
 
     required_params = ["save_root_dir", "system_id"]
-    optional_params = ["grids_level", "cider_kwargs_and_version", "omegas"]
+    optional_params = [
+        "grids_level",
+        "cider_kwargs_and_version",
+        "omegas",
+        "update_catalog",
+    ]
 
     def get_cider_features(self, analyzer, restricted):
         from ciderpress.density import get_exchange_descriptors2
@@ -230,7 +792,7 @@ class RunAnalysis(FiretaskBase):
     def run_task(self, fw_spec):
         from ciderpress.analyzers import ElectronAnalyzer
 
-        calc = fw_spec["calc"]
+        calc = get_calc(fw_spec)
         analyzer = ElectronAnalyzer.from_calc(calc, self.get("grids_level"))
         analyzer.perform_full_analysis()
         save_dir = get_save_dir(
@@ -254,6 +816,15 @@ class RunAnalysis(FiretaskBase):
             for omega in omegas:
                 analyzer.get_ee_energy_density_rs(omega)
         analyzer.dump(save_file)
+        if self.get("update_catalog") is None or self["update_catalog"]:
+            record_analysis(
+                self["save_root_dir"],
+                "KS",
+                fw_spec["method_name"],
+                calc.mol.basis,
+                self["system_id"],
+                analyzer.grids_level,
+            )
 
         return FWAction(stored_data={"save_dir": save_dir})
 
@@ -294,6 +865,8 @@ def make_etot_firework(
     method_description=None,
     write_data=None,
     name=None,
+    save_df_tensor=False,
+    mo_storage=None,
 ):
     struct = struct.todict()
     t1 = SCFCalc(
@@ -303,9 +876,14 @@ def make_etot_firework(
         system_id=system_id,
         require_converged=require_converged,
         method_description=method_description,
+        save_root_dir=save_root_dir,
     )
     t2 = SaveSCFResults(
-        save_root_dir=save_root_dir, no_overwrite=no_overwrite, write_data=write_data
+        save_root_dir=save_root_dir,
+        no_overwrite=no_overwrite,
+        write_data=write_data,
+        save_df_tensor=save_df_tensor,
+        mo_storage=mo_storage,
     )
     return Firework([t1, t2], name=name)
 
@@ -322,6 +900,8 @@ def make_etot_firework_restart(
     new_method_description=None,
     write_data=None,
     name=None,
+    save_df_tensor=False,
+    mo_storage=None,
 ):
     t1 = LoadSCFCalc(
         save_root_dir=save_root_dir,
@@ -334,13 +914,106 @@ def make_etot_firework_restart(
         new_method_name=new_method_name,
         require_converged=require_converged,
         new_method_description=new_method_description,
+        save_root_dir=save_root_dir,
     )
     t3 = SaveSCFResults(
-        save_root_dir=save_root_dir, no_overwrite=no_overwrite, write_data=write_data
+        save_root_dir=save_root_dir,
+        no_overwrite=no_overwrite,
+        write_data=write_data,
+        save_df_tensor=save_df_tensor,
+        mo_storage=mo_storage,
     )
     return Firework([t1, t2, t3], name=name)
 
 
+def make_geometry_family_firework(
+    struct,
+    members,
+    settings,
+    method_name,
+    save_root_dir,
+    no_overwrite=False,
+    require_converged=True,
+    method_description=None,
+    write_data=None,
+    name=None,
+):
+    """
+    Firework running all charge/spin states in members (list of dicts
+    with system_id, charge and spin) of the geometry struct together,
+    see SCFCalcGeometryFamily and workflow_utils.group_geometry_families.
+    """
+    t1 = SCFCalcGeometryFamily(
+        struct=struct.todict(),
+        settings=settings,
+        method_name=method_name,
+        members=members,
+        save_root_dir=save_root_dir,
+        require_converged=require_converged,
+        method_description=method_description,
+        no_overwrite=no_overwrite,
+        write_data=write_data,
+    )
+    return Firework([t1], name=name)
+
+
+def make_sweep_firework(
+    struct,
+    system_id,
+    variants,
+    save_root_dir,
+    no_overwrite=False,
+    require_converged=True,
+    write_data=None,
+    name=None,
+):
+    """
+    Firework running all settings variants (list of dicts with
+    method_name, settings and optionally method_description) for
+    one system in a single process, see SCFSweep.
+    """
+    t1 = SCFSweep(
+        struct=struct.todict(),
+        system_id=system_id,
+        variants=variants,
+        save_root_dir=save_root_dir,
+        require_converged=require_converged,
+        no_overwrite=no_overwrite,
+        write_data=write_data,
+    )
+    return Firework([t1], name=name)
+
+
+def make_nscf_firework(
+    functionals,
+    system_id,
+    basis,
+    method_name,
+    save_root_dir,
+    no_overwrite=False,
+    method_descriptions=None,
+    name=None,
+):
+    """
+    Firework evaluating functionals (dict of method name to new
+    settings) on the stored density of method_name/basis/system_id,
+    see NSCFMultiFunctional.
+    """
+    t1 = LoadSCFCalc(
+        save_root_dir=save_root_dir,
+        method_name=method_name,
+        basis=basis,
+        system_id=system_id,
+    )
+    t2 = NSCFMultiFunctional(
+        functionals=functionals,
+        save_root_dir=save_root_dir,
+        no_overwrite=no_overwrite,
+        method_descriptions=method_descriptions,
+    )
+    return Firework([t1, t2], name=name)
+
+
 def make_analysis_firework(
     method_name, system_id, basis, save_root_dir, grids_level=None, name=None, **kwargs
 ):
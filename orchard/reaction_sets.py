@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# orchard: Utilities to training and analyzing machine learning-based density functionals
+# Copyright (C) 2024 The President and Fellows of Harvard College
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>
+#
+# Author: Kyle Bystrom <kylebystrom@gmail.com>
+#
+
+
+"""
+Compiled reaction sets. A ReactionSet stores the reactions of one or
+more reaction YAML files as a sparse (reactions x systems) stoichiometry
+matrix, so that reaction energies, gradients and errors are single
+sparse matrix-vector products instead of loops over structs and counts.
+Compiled sets are cached next to the YAML file and recompiled when
+the YAML file changes.
+"""
+
+import json
+import os
+
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+
+CACHE_SUFFIX = ".compiled.npz"
+
+
+def _encode_ids(ids):
+    return json.dumps([list(i) if isinstance(i, tuple) else i for i in ids])
+
+
+def _decode_ids(ids):
+    return [tuple(i) if isinstance(i, list) else i for i in json.loads(ids)]
+
+
+def _opt_float(val):
+    return np.nan if val is None else float(val)
+
+
+class ReactionSet:
+    def __init__(self, rxn_ids, system_ids, stoich, energies, noise, noise_factor):
+        """
+        Args:
+            rxn_ids (list): Reaction ids, length nrxn
+            system_ids (list): System ids (str or tuple), length nsys
+            stoich (csr_matrix): (nrxn, nsys) stoichiometry matrix
+            energies (np.ndarray): Reference reaction energies (as
+                stored in the YAML file), NaN if not provided
+            noise (np.ndarray): Fixed noise per reaction, NaN if not
+                provided
+            noise_factor (np.ndarray): Noise factor per reaction, NaN
+                if not provided
+        """
+        self.rxn_ids = list(rxn_ids)
+        self.system_ids = list(system_ids)
+        self.system_index = {sysid: i for i, sysid in enumerate(self.system_ids)}
+        self.stoich = csr_matrix(stoich)
+        self.energies = np.asarray(energies, dtype=np.float64)
+        self.noise = np.asarray(noise, dtype=np.float64)
+        self.noise_factor = np.asarray(noise_factor, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.rxn_ids)
+
+    @property
+    def nrxn(self):
+        return len(self.rxn_ids)
+
+    @property
+    def nsys(self):
+        return len(self.system_ids)
+
+    @classmethod
+    def from_formulas(cls, formulas):
+        """
+        Compile a dict of reactions in the load_rxns format, i.e.
+        {rxn_id: {"structs": [...], "counts": [...], "energy": ...}}.
+        """
+        rxn_ids = list(formulas.keys())
+        system_index = {}
+        rows, cols, vals = [], [], []
+        for irxn, rxn_id in enumerate(rxn_ids):
+            rxn = formulas[rxn_id]
+            for sysid, count in zip(rxn["structs"], rxn["counts"]):
+                if sysid not in system_index:
+                    system_index[sysid] = len(system_index)
+                rows.append(irxn)
+                cols.append(system_index[sysid])
+                vals.append(count)
+        # duplicate (row, col) entries are summed by csr_matrix
+        stoich = csr_matrix(
+            (
+                np.array(vals, dtype=np.float64),
+                (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)),
+            ),
+            shape=(len(rxn_ids), len(system_index)),
+        )
+        return cls(
+            rxn_ids,
+            list(system_index.keys()),
+            stoich,
+            [_opt_float(formulas[r].get("energy")) for r in rxn_ids],
+            [_opt_float(formulas[r].get("noise")) for r in rxn_ids],
+            [_opt_float(formulas[r].get("noise_factor")) for r in rxn_ids],
+        )
+
+    @classmethod
+    def concatenate(cls, rxn_sets, drop_duplicates=False):
+        """
+        Combine reaction sets. If drop_duplicates is True, a reaction
+        id that appears in more than one set is taken from the last
+        set containing it, at the position of its first occurrence
+        (like dict.update on load_rxns outputs).
+        """
+        system_ids = []
+        system_index = {}
+        for rset in rxn_sets:
+            for sysid in rset.system_ids:
+                if sysid not in system_index:
+                    system_index[sysid] = len(system_ids)
+                    system_ids.append(sysid)
+        rxn_ids = []
+        blocks = []
+        arrs = {"energies": [], "noise": [], "noise_factor": []}
+        for rset in rxn_sets:
+            cols = np.array(
+                [system_index[sysid] for sysid in rset.system_ids], dtype=np.int64
+            )
+            proj = csr_matrix(
+                (np.ones(rset.nsys), (np.arange(rset.nsys), cols)),
+                shape=(rset.nsys, len(system_ids)),
+            )
+            blocks.append(rset.stoich @ proj)
+            rxn_ids.extend(rset.rxn_ids)
+            for k in arrs:
+                arrs[k].append(getattr(rset, k))
+        stoich = vstack(blocks, format="csr")
+        arrs = {k: np.concatenate(v) for k, v in arrs.items()}
+        if drop_duplicates:
+            last = {rxn_id: i for i, rxn_id in enumerate(rxn_ids)}
+            keep = np.array(list(last.values()), dtype=np.int64)
+            rxn_ids = [rxn_ids[i] for i in keep]
+            stoich = stoich[keep]
+            arrs = {k: v[keep] for k, v in arrs.items()}
+        return cls(rxn_ids, system_ids, stoich, **arrs)
+
+    def save(self, fname, source_mtime_ns=-1):
+        tmp_file = fname + ".tmp.npz"
+        np.savez(
+            tmp_file,
+            rxn_ids=np.array(_encode_ids(self.rxn_ids)),
+            system_ids=np.array(_encode_ids(self.system_ids)),
+            data=self.stoich.data,
+            indices=self.stoich.indices,
+            indptr=self.stoich.indptr,
+            shape=np.array(self.stoich.shape, dtype=np.int64),
+            energies=self.energies,
+            noise=self.noise,
+            noise_factor=self.noise_factor,
+            source_mtime_ns=np.array(source_mtime_ns, dtype=np.int64),
+        )
+        os.replace(tmp_file, fname)
+
+    @classmethod
+    def load_compiled(cls, fname):
+        """
+        Returns:
+            ReactionSet, mtime (ns) of the source YAML when compiled
+        """
+        with np.load(fname) as f:
+            stoich = csr_matrix(
+                (f["data"], f["indices"], f["indptr"]), shape=tuple(f["shape"])
+            )
+            rset = cls(
+                _decode_ids(str(f["rxn_ids"])),
+                _decode_ids(str(f["system_ids"])),
+                stoich,
+                f["energies"],
+                f["noise"],
+                f["noise_factor"],
+            )
+            return rset, int(f["source_mtime_ns"])
+
+    @classmethod
+    def load(cls, rxn_list_id, rxndir=None, use_cache=True):
+        """
+        Load the reaction set rxn_list_id from rxndir (default RXN_ROOT),
+        using the compiled cache next to the YAML file if it is up to
+        date, and writing it otherwise.
+        """
+        from orchard.workflow_utils import get_rxn_file, load_rxns
+
+        rxnfile = get_rxn_file(rxn_list_id, rxndir=rxndir)
+        cache_file = rxnfile + CACHE_SUFFIX
+        mtime = os.stat(rxnfile).st_mtime_ns
+        if use_cache and os.path.exists(cache_file):
+            try:
+                rset, cache_mtime = cls.load_compiled(cache_file)
+                if cache_mtime == mtime:
+                    return rset
+            except (OSError, ValueError, KeyError):
+                pass
+        rset = cls.from_formulas(load_rxns(rxn_list_id, rxndir=rxndir))
+        if use_cache:
+            try:
+                rset.save(cache_file, source_mtime_ns=mtime)
+            except OSError:
+                pass
+        return rset
+
+    def get_stoich_matrix(self, system_index, nsys=None):
+        """
+        Return the stoichiometry matrix with columns reordered to an
+        external system ordering.
+
+        Args:
+            system_index (dict): Maps each system id of this set to a
+                column index. Raises KeyError if a system is missing.
+            nsys (int): Number of columns, default len(system_index)
+
+        Returns:
+            (nrxn, nsys) csr_matrix
+        """
+        if nsys is None:
+            nsys = len(system_index)
+        cols = np.array(
+            [system_index[sysid] for sysid in self.system_ids], dtype=np.int64
+        )
+        proj = csr_matrix(
+            (np.ones(self.nsys), (np.arange(self.nsys), cols)),
+            shape=(self.nsys, nsys),
+        )
+        return self.stoich @ proj
+
+    def get_reaction_values(self, values):
+        """
+        Combine per-system values (first axis ordered like system_ids)
+        into per-reaction values, i.e. sum_s count_rs * values[s].
+        """
+        return self.stoich @ np.asarray(values)
+
+    def get_noise(self, sigma):
+        """
+        Noise per reaction: the fixed noise if given, else
+        noise_factor * sigma if given, else sigma.
+        """
+        noise = np.where(np.isnan(self.noise_factor), 1.0, self.noise_factor) * sigma
+        return np.where(np.isnan(self.noise), noise, self.noise)
+
+    def get_weights(self):
+        """
+        Loss weight per reaction, 1 / noise_factor**2 (a missing or
+        zero noise_factor is treated as 1).
+        """
+        nf = self.noise_factor
+        nf = np.where(np.isnan(nf) | (nf == 0), 1.0, nf)
+        return 1.0 / nf**2
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# orchard: Utilities to training and analyzing machine learning-based density functionals
+# Copyright (C) 2024 The President and Fellows of Harvard College
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>
+#
+# Author: Kyle Bystrom <kylebystrom@gmail.com>
+#
+
+
+"""
+Choice of the thread count and max_memory of PySCF calcs from the
+system size and the detected cores and memory, made in
+pyscf_caller.setup_calc before integrals='auto' is resolved, which
+then uses both. max_memory is set on the calc. The thread
+count is stored in calc.resource_control and only applied while the
+calc runs (see use_resources), so the thread count of the process is
+not changed. Control settings:
+
+    'adaptive_resources': None, True, False or dict (on unless False,
+        a dict overrides entries of DEFAULT_RESOURCE_PARAMS)
+    'num_threads': None or int (fixed thread count)
+    'max_memory': None or float (fixed max_memory in MB, a max_memory
+        in settings['calc'] is also respected)
+
+The work per SCF cycle is estimated from nao, the auxiliary basis
+size naux (if density fitting is requested) and the expected number
+of grid points, and one thread is used per work_per_thread
+operations, up to the number of cores this process may use (and
+OMP_NUM_THREADS, if set). max_memory is the estimated size of the
+in-core data (DF tensors or exact ERIs, AO values on grid blocks and
+the DIIS history) times a safety factor, at least min_memory and at
+most memory_fraction of the available memory. Without an override,
+max_memory is never set below the default of the calc (PySCF's
+MAX_MEMORY), so adaptive resources only raise it.
+"""
+
+import os
+
+from pyscf import lib
+
+from orchard.resources import get_available_memory_mb, get_num_cores
+
+DEFAULT_RESOURCE_PARAMS = {
+    "work_per_thread": 2.0e9,
+    "grids_per_atom": 10000,
+    "ao_block_size": 4000,
+    "diis_space": 8,
+    "memory_safety": 1.5,
+    "min_memory": 2000,
+    "memory_fraction": 0.7,
+}
+
+
+def get_resource_params(settings):
+    """
+    Return the adaptive resource parameters for settings, or None if
+    adaptive resources are off.
+    """
+    opt = settings["control"].get("adaptive_resources")
+    if opt is not None and not opt:
+        return None
+    params = dict(DEFAULT_RESOURCE_PARAMS)
+    if isinstance(opt, dict):
+        params.update(opt)
+    return params
+
+
+def get_max_threads():
+    """
+    Upper limit for the thread count: the cores this process may run
+    on, or OMP_NUM_THREADS if it is set and smaller.
+    """
+    ncore = get_num_cores()
+    try:
+        return max(1, min(ncore, int(os.environ["OMP_NUM_THREADS"])))
+    except (KeyError, ValueError):
+        return ncore
+
+
+def estimate_scf_size(mol, params, auxbasis=None, density_fit=False):
+    """
+    Returns:
+        dict with nao, naux (0 without density fitting) and ngrids
+    """
+    from orchard.integral_strategy import get_naux
+
+    return {
+        "nao": mol.nao_nr(),
+        "naux": get_naux(mol, auxbasis) if density_fit else 0,
+        "ngrids": params["grids_per_atom"] * mol.natm,
+    }
+
+
+def _requests_density_fit(control):
+    integrals = control.get("integrals")
+    if integrals is None:
+        return bool(control.get("density_fit"))
+    return integrals in ["rij", "rijk"]
+
+
+def estimate_num_threads(size, params, max_threads):
+    nao, naux, ngrids = size["nao"], size["naux"], size["ngrids"]
+    npair = nao * (nao + 1) // 2
+    work = ngrids * nao**2 + (naux * npair if naux > 0 else npair**2 / 2)
+    nthreads = int(work // params["work_per_thread"]) + 1
+    return max(1, min(nthreads, max_threads))
+
+
+def estimate_memory_mb(size, params):
+    """
+    Estimate of the memory (MB) the SCF can use for in-core data.
+    """
+    nao, naux = size["nao"], size["naux"]
+    npair = nao * (nao + 1) // 2
+    if naux > 0:
+        nbytes = 8 * naux * npair
+    else:
+        nbytes = 8 * npair**2 / 2
+    # AO values and derivatives on a block of grid points
+    nbytes += 8 * 10 * params["ao_block_size"] * nao
+    # Fock and error vectors in the DIIS history (both spins)
+    nbytes += 8 * 4 * (params["diis_space"] + 4) * nao**2
+    return params["memory_safety"] * nbytes / 1e6
+
+
+def choose_num_threads(mol, settings):
+    """
+    Thread count for a calc on mol with settings, or None if adaptive
+    resources are off and num_threads is not set.
+    """
+    num_threads = settings["control"].get("num_threads")
+    if num_threads is not None:
+        return int(num_threads)
+    params = get_resource_params(settings)
+    if params is None:
+        return None
+    size = estimate_scf_size(
+        mol,
+        params,
+        auxbasis=settings["control"].get("df_basis"),
+        density_fit=_requests_density_fit(settings["control"]),
+    )
+    return estimate_num_threads(size, params, get_max_threads())
+
+
+def _get_max_memory_override(settings):
+    return settings["control"].get("max_memory") or settings["calc"].get("max_memory")
+
+
+def choose_max_memory(mol, settings, default_memory=None):
+    """
+    max_memory (MB) for a calc on mol with settings, or None if
+    adaptive resources are off and max_memory is not set. Unless
+    max_memory is set, the result is at least default_memory (default
+    lib.param.MAX_MEMORY), the max_memory the calc would have anyway.
+    """
+    max_memory = _get_max_memory_override(settings)
+    if max_memory is not None:
+        return float(max_memory)
+    params = get_resource_params(settings)
+    if params is None:
+        return None
+    if default_memory is None:
+        default_memory = lib.param.MAX_MEMORY
+    size = estimate_scf_size(
+        mol,
+        params,
+        auxbasis=settings["control"].get("df_basis"),
+        density_fit=_requests_density_fit(settings["control"]),
+    )
+    available = get_available_memory_mb()
+    max_memory = max(estimate_memory_mb(size, params), params["min_memory"])
+    max_memory = min(max_memory, params["memory_fraction"] * available)
+    return float(max(max_memory, default_memory))
+
+
+def configure_resources(calc, settings, num_threads=None, max_memory=None):
+    """
+    Set calc.max_memory to max_memory (from choose_max_memory), and
+    store it with num_threads (from choose_num_threads) as
+    calc.resource_control. The chosen values are printed.
+
+    Returns:
+        dict with num_threads and max_memory, or None if adaptive
+        resources are off and there are no overrides
+    """
+    params = get_resource_params(settings)
+    if params is None and num_threads is None and max_memory is None:
+        return None
+    size = None
+    if params is not None and _get_max_memory_override(settings) is None:
+        with_df = getattr(calc, "with_df", None)
+        size = estimate_scf_size(
+            calc.mol,
+            params,
+            auxbasis=getattr(with_df, "auxbasis", None),
+            density_fit=hasattr(with_df, "auxbasis"),
+        )
+    if max_memory is not None:
+        max_memory = float(max_memory)
+        calc.max_memory = max_memory
+        if getattr(calc, "with_df", None) is not None:
+            calc.with_df.max_memory = max_memory
+    resource_control = {
+        "num_threads": num_threads,
+        "max_memory": calc.max_memory,
+    }
+    if size is not None:
+        resource_control.update(size)
+    print(
+        "Resources: threads={} max_memory={:.0f} MB{}".format(
+            "default" if num_threads is None else num_threads,
+            resource_control["max_memory"],
+            ""
+            if size is None
+            else " (nao={} naux={} estimated ngrids={})".format(
+                size["nao"], size["naux"], size["ngrids"]
+            ),
+        )
+    )
+    calc.resource_control = resource_control
+    return resource_control
+
+
+def get_num_threads(calc):
+    """
+    The thread count calc runs with.
+    """
+    num_threads = (getattr(calc, "resource_control", None) or {}).get("num_threads")
+    return lib.num_threads() if num_threads is None else num_threads
+
+
+def use_resources(calc):
+    """
+    Context in which the thread count is the one chosen for calc. The
+    previous thread count is restored on exit.
+    """
+    resource_control = getattr(calc, "resource_control", None) or {}
+    return lib.with_omp_threads(resource_control.get("num_threads"))
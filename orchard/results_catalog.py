@@ -0,0 +1,566 @@
+#!/usr/bin/env python
+# orchard: Utilities to training and analyzing machine learning-based density functionals
+# Copyright (C) 2024 The President and Fellows of Harvard College
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>
+#
+# Author: Kyle Bystrom <kylebystrom@gmail.com>
+#
+
+
+"""
+Indexed catalog of the results stored under SAVE_ROOT.
+
+Each row is keyed by (calc_type, functional, basis, system_id), where
+functional is the database name used by get_save_dir (see
+get_functional_db_name). The save_dir column records where the result
+was found; lookups rebuild it from the key and the caller's save root
+(see get_row_save_dir), so that the save root can be mounted elsewhere.
+updated is the time the result was stored (the mtime of run_info.yaml
+for rebuilt entries). The catalog is a single SQLite file, so it
+should live on a local or otherwise lock-friendly filesystem; set
+CATALOG_PATH in ~/.orchard_config.yaml to override the default location
+of <save_root>/results_catalog.sqlite.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import time
+
+import yaml
+
+from orchard.workflow_utils import get_config, get_functional_db_name, get_save_dir
+
+CATALOG_FILENAME = "results_catalog.sqlite"
+CATALOG_CALC_TYPES = ["KS", "NSCF", "PW-KS"]
+COLUMNS = [
+    "calc_type",
+    "functional",
+    "basis",
+    "system_id",
+    "save_dir",
+    "e_tot",
+    "converged",
+    "wall_time",
+    "files",
+    "analysis_levels",
+    "updated",
+]
+
+_ANALYSIS_RE = re.compile(r"^analysis_L(.+)\.hdf5$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    calc_type TEXT NOT NULL,
+    functional TEXT NOT NULL,
+    basis TEXT NOT NULL,
+    system_id TEXT NOT NULL,
+    save_dir TEXT NOT NULL,
+    e_tot REAL,
+    converged INTEGER,
+    wall_time REAL,
+    files TEXT,
+    analysis_levels TEXT,
+    updated REAL,
+    PRIMARY KEY (calc_type, functional, basis, system_id)
+);
+CREATE INDEX IF NOT EXISTS results_by_system ON results (system_id);
+"""
+
+
+def _functional_key(functional):
+    if functional is None:
+        return ""
+    return get_functional_db_name(functional)
+
+
+def _encode_levels(levels):
+    levels = sorted(set(str(lvl) for lvl in levels))
+    return ",".join(levels)
+
+
+def _decode_levels(levels):
+    if not levels:
+        return []
+    return [int(lvl) if lvl.isdigit() else lvl for lvl in levels.split(",")]
+
+
+def _row_to_dict(row):
+    d = dict(zip(COLUMNS, row))
+    if d["converged"] is not None:
+        d["converged"] = bool(d["converged"])
+    d["files"] = json.loads(d["files"]) if d["files"] else []
+    d["analysis_levels"] = _decode_levels(d["analysis_levels"])
+    return d
+
+
+def get_catalog_path(save_root_dir):
+    catalog_path = get_config().get("CATALOG_PATH")
+    if catalog_path is not None:
+        return os.path.expanduser(catalog_path)
+    return os.path.join(save_root_dir, CATALOG_FILENAME)
+
+
+def get_catalog(save_root_dir, create=True):
+    """
+    Return the ResultsCatalog for save_root_dir, or None if create
+    is False and the catalog file does not exist yet.
+    """
+    path = get_catalog_path(save_root_dir)
+    if not create and not os.path.exists(path):
+        return None
+    return ResultsCatalog(path)
+
+
+class ResultsCatalog:
+    def __init__(self, path, timeout=60.0):
+        self.path = path
+        self.timeout = timeout
+        dirname = os.path.dirname(os.path.abspath(path))
+        os.makedirs(dirname, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=self.timeout)
+
+    def _execute(self, query, params=()):
+        conn = self._connect()
+        try:
+            return conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+
+    def record(
+        self,
+        calc_type,
+        functional,
+        basis,
+        system_id,
+        save_dir,
+        e_tot=None,
+        converged=None,
+        wall_time=None,
+        files=None,
+        analysis_levels=None,
+    ):
+        """
+        Insert or replace the entry for a single result. If files or
+        analysis_levels are None, the values already in the catalog
+        are kept.
+        """
+        self.record_many(
+            [
+                {
+                    "calc_type": calc_type,
+                    "functional": functional,
+                    "basis": basis,
+                    "system_id": system_id,
+                    "save_dir": save_dir,
+                    "e_tot": e_tot,
+                    "converged": converged,
+                    "wall_time": wall_time,
+                    "files": files,
+                    "analysis_levels": analysis_levels,
+                }
+            ]
+        )
+
+    def record_many(self, rows):
+        """
+        Insert or replace many entries in one transaction. Each row
+        is a dict with the same keys as the arguments of record, and
+        optionally updated (default: now).
+        """
+        now = time.time()
+        params = []
+        for row in rows:
+            files = row.get("files")
+            levels = row.get("analysis_levels")
+            converged = row.get("converged")
+            e_tot = row.get("e_tot")
+            wall_time = row.get("wall_time")
+            params.append(
+                (
+                    row["calc_type"],
+                    _functional_key(row["functional"]),
+                    row["basis"],
+                    row["system_id"],
+                    row["save_dir"],
+                    None if e_tot is None else float(e_tot),
+                    None if converged is None else int(bool(converged)),
+                    None if wall_time is None else float(wall_time),
+                    None if files is None else json.dumps(sorted(files)),
+                    None if levels is None else _encode_levels(levels),
+                    row.get("updated") or now,
+                )
+            )
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO results VALUES (?,?,?,?,?,?,?,?,?,?,?) "
+                    "ON CONFLICT (calc_type, functional, basis, system_id) "
+                    "DO UPDATE SET save_dir=excluded.save_dir, "
+                    "e_tot=excluded.e_tot, converged=excluded.converged, "
+                    "wall_time=excluded.wall_time, "
+                    "files=COALESCE(excluded.files, files), "
+                    "analysis_levels=COALESCE(excluded.analysis_levels, "
+                    "analysis_levels), updated=excluded.updated",
+                    params,
+                )
+        finally:
+            conn.close()
+
+    def add_analysis_level(
+        self, calc_type, functional, basis, system_id, level, filename=None
+    ):
+        """
+        Mark analysis level as available for an existing entry,
+        adding filename to the list of files if provided.
+        """
+        key = (calc_type, _functional_key(functional), basis, system_id)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                res = conn.execute(
+                    "SELECT files, analysis_levels FROM results WHERE "
+                    "calc_type=? AND functional=? AND basis=? AND system_id=?",
+                    key,
+                ).fetchone()
+                if res is None:
+                    return False
+                files = json.loads(res[0]) if res[0] else []
+                if filename is not None and filename not in files:
+                    files.append(filename)
+                levels = _decode_levels(res[1]) + [level]
+                conn.execute(
+                    "UPDATE results SET files=?, analysis_levels=?, updated=? "
+                    "WHERE calc_type=? AND functional=? AND basis=? "
+                    "AND system_id=?",
+                    (json.dumps(sorted(files)), _encode_levels(levels), time.time())
+                    + key,
+                )
+        finally:
+            conn.close()
+        return True
+
+    def remove(self, calc_type, functional, basis, system_id):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "DELETE FROM results WHERE calc_type=? AND functional=? "
+                    "AND basis=? AND system_id=?",
+                    (calc_type, _functional_key(functional), basis, system_id),
+                )
+        finally:
+            conn.close()
+
+    def get(self, calc_type, functional, basis, system_id):
+        rows = self._execute(
+            "SELECT * FROM results WHERE calc_type=? AND functional=? "
+            "AND basis=? AND system_id=?",
+            (calc_type, _functional_key(functional), basis, system_id),
+        )
+        if len(rows) == 0:
+            return None
+        return _row_to_dict(rows[0])
+
+    def get_table(
+        self,
+        calc_type=None,
+        functional=None,
+        basis=None,
+        system_ids=None,
+        converged=None,
+        analysis_level=None,
+    ):
+        """
+        Return all entries matching the given filters as a list of
+        dicts. Filters set to None are ignored. If system_ids is given,
+        only those systems are returned.
+        """
+        conds = []
+        params = []
+        for name, val in [("calc_type", calc_type), ("basis", basis)]:
+            if val is not None:
+                conds.append("{}=?".format(name))
+                params.append(val)
+        if functional is not None:
+            conds.append("functional=?")
+            params.append(_functional_key(functional))
+        if converged is not None:
+            conds.append("converged=?")
+            params.append(int(bool(converged)))
+        query = "SELECT * FROM results"
+        if len(conds) > 0:
+            query += " WHERE " + " AND ".join(conds)
+        rows = [_row_to_dict(row) for row in self._execute(query, params)]
+        if system_ids is not None:
+            system_ids = set(system_ids)
+            rows = [row for row in rows if row["system_id"] in system_ids]
+        if analysis_level is not None:
+            rows = [row for row in rows if analysis_level in row["analysis_levels"]]
+        return rows
+
+    def get_column(self, column, calc_type, functional, basis, system_ids=None):
+        """
+        Return {system_id: value} for one column of the results table,
+        e.g. get_column("e_tot", "KS", "PBE", "def2-qzvppd").
+        """
+        if column not in COLUMNS:
+            raise ValueError("Unknown catalog column {}".format(column))
+        rows = self.get_table(
+            calc_type=calc_type,
+            functional=functional,
+            basis=basis,
+            system_ids=system_ids,
+        )
+        return {row["system_id"]: row[column] for row in rows}
+
+    def get_save_dirs(
+        self, calc_type, functional, basis, system_ids, save_root_dir=None
+    ):
+        """
+        Return {system_id: save_dir} for the system_ids that are in
+        the catalog. Missing systems are omitted. If save_root_dir is
+        given, the save_dirs are located under it instead of where
+        they were recorded.
+        """
+        rows = self.get_table(
+            calc_type=calc_type,
+            functional=functional,
+            basis=basis,
+            system_ids=system_ids,
+        )
+        if save_root_dir is None:
+            return {row["system_id"]: row["save_dir"] for row in rows}
+        return {row["system_id"]: get_row_save_dir(save_root_dir, row) for row in rows}
+
+    def find_missing(
+        self, calc_type, functional, basis, system_ids, analysis_level=None
+    ):
+        """
+        Return the subset of system_ids (in input order) that have no
+        entry in the catalog, or no analysis at analysis_level if given.
+        """
+        rows = self.get_table(
+            calc_type=calc_type,
+            functional=functional,
+            basis=basis,
+            system_ids=system_ids,
+            analysis_level=analysis_level,
+        )
+        present = {row["system_id"] for row in rows}
+        return [sysid for sysid in system_ids if sysid not in present]
+
+
+def get_row_save_dir(save_root_dir, row):
+    """
+    save_dir of a catalog row (a dict from get_table) under
+    save_root_dir.
+    """
+    return get_save_dir(
+        save_root_dir,
+        row["calc_type"],
+        row["basis"],
+        row["system_id"],
+        row["functional"],
+    )
+
+
+def get_result_dirs(
+    save_root_dir, calc_type, functional, basis, system_ids, analysis_level=None
+):
+    """
+    Look up the save_dirs of many results with a single catalog query.
+
+    Returns:
+        {system_id: save_dir} for all system_ids, and the list of
+        system_ids without a catalog entry (or without analysis at
+        analysis_level), or None if there is no catalog. Those get
+        the save_dir from get_save_dir, since the catalog may lag
+        behind the files.
+    """
+    catalog = get_catalog(save_root_dir, create=False)
+    missing = None
+    dirs = {}
+    if catalog is not None:
+        rows = catalog.get_table(
+            calc_type=calc_type,
+            functional=functional,
+            basis=basis,
+            system_ids=system_ids,
+            analysis_level=analysis_level,
+        )
+        dirs = {row["system_id"]: get_row_save_dir(save_root_dir, row) for row in rows}
+        missing = [sysid for sysid in system_ids if sysid not in dirs]
+    for sysid in system_ids:
+        if sysid not in dirs:
+            dirs[sysid] = get_save_dir(
+                save_root_dir, calc_type, basis, sysid, functional
+            )
+    return dirs, missing
+
+
+def record_result(save_root_dir, calc_type, functional, basis, system_id, **kwargs):
+    """
+    Record a result in the catalog of save_root_dir. Catalog errors
+    are reported but do not raise, since the files under save_dir
+    remain the source of truth and rebuild_catalog can recover them.
+    """
+    save_dir = get_save_dir(save_root_dir, calc_type, basis, system_id, functional)
+    try:
+        catalog = get_catalog(save_root_dir)
+        catalog.record(calc_type, functional, basis, system_id, save_dir, **kwargs)
+    except sqlite3.Error as e:
+        print("WARNING: Could not update results catalog:", e)
+
+
+def record_analysis(save_root_dir, calc_type, functional, basis, system_id, level):
+    save_dir = get_save_dir(save_root_dir, calc_type, basis, system_id, functional)
+    try:
+        catalog = get_catalog(save_root_dir)
+        filename = "analysis_L{}.hdf5".format(level)
+        if not catalog.add_analysis_level(
+            calc_type, functional, basis, system_id, level, filename=filename
+        ):
+            catalog.record(
+                calc_type,
+                functional,
+                basis,
+                system_id,
+                save_dir,
+                files=[filename],
+                analysis_levels=[level],
+            )
+    except sqlite3.Error as e:
+        print("WARNING: Could not update results catalog:", e)
+
+
+def _find_result_dirs(topdir):
+    result_dirs = []
+    for dirpath, dirnames, filenames in os.walk(topdir):
+        if "run_info.yaml" in filenames:
+            result_dirs.append((dirpath, filenames))
+    return result_dirs
+
+
+def _parse_result_dir(args):
+    calc_type, functional, basis, base_dir, dirpath, filenames = args
+    loader = getattr(yaml, "CLoader", yaml.Loader)
+    fname = os.path.join(dirpath, "run_info.yaml")
+    try:
+        with open(fname, "r") as f:
+            info = yaml.load(f, Loader=loader)
+        updated = os.path.getmtime(fname)
+    except (OSError, yaml.YAMLError):
+        return None
+    levels = []
+    for fname in filenames:
+        match = _ANALYSIS_RE.match(fname)
+        if match is not None:
+            levels.append(match.group(1))
+    e_tot = info.get("e_tot_readable", info.get("e_tot"))
+    return {
+        "calc_type": calc_type,
+        "functional": functional,
+        "basis": basis,
+        "system_id": os.path.relpath(dirpath, base_dir),
+        "save_dir": dirpath,
+        "e_tot": None if e_tot is None else float(e_tot),
+        "converged": info.get("converged"),
+        "wall_time": info.get("wall_time"),
+        "files": filenames,
+        "analysis_levels": levels,
+        "updated": updated,
+    }
+
+
+def _list_subtrees(save_root_dir, calc_types):
+    """
+    Split SAVE_ROOT into (calc_type, functional, basis, base_dir, topdir)
+    subtrees that can be walked independently.
+    """
+    subtrees = []
+    for calc_type in calc_types:
+        ctdir = os.path.join(save_root_dir, calc_type)
+        if not os.path.isdir(ctdir):
+            continue
+        for functional in sorted(os.listdir(ctdir)):
+            fdir = os.path.join(ctdir, functional)
+            if not os.path.isdir(fdir):
+                continue
+            if calc_type == "PW-KS":
+                bases = [""]
+            else:
+                bases = sorted(os.listdir(fdir))
+            for basis in bases:
+                bdir = os.path.join(fdir, basis)
+                if not os.path.isdir(bdir):
+                    continue
+                for sub in sorted(os.listdir(bdir)):
+                    topdir = os.path.join(bdir, sub)
+                    if os.path.isdir(topdir):
+                        subtrees.append((calc_type, functional, basis, bdir, topdir))
+    return subtrees
+
+
+def _walk_subtree(subtree):
+    calc_type, functional, basis, base_dir, topdir = subtree
+    return [
+        (calc_type, functional, basis, base_dir, dirpath, filenames)
+        for dirpath, filenames in _find_result_dirs(topdir)
+    ]
+
+
+def rebuild_catalog(
+    save_root_dir, catalog=None, calc_types=None, nproc=None, chunksize=64
+):
+    """
+    Crawl save_root_dir and (re)populate the catalog from the
+    run_info.yaml files found there. Walking and parsing are
+    distributed over nproc worker processes.
+
+    Returns:
+        The number of entries recorded.
+    """
+    from multiprocessing import Pool
+
+    if catalog is None:
+        catalog = get_catalog(save_root_dir)
+    if calc_types is None:
+        calc_types = CATALOG_CALC_TYPES
+    subtrees = _list_subtrees(save_root_dir, calc_types)
+    nrec = 0
+    with Pool(nproc) as pool:
+        tasks = []
+        for res in pool.imap_unordered(_walk_subtree, subtrees):
+            tasks.extend(res)
+        rows = []
+        for row in pool.imap_unordered(_parse_result_dir, tasks, chunksize=chunksize):
+            if row is None:
+                continue
+            rows.append(row)
+            if len(rows) >= 10000:
+                catalog.record_many(rows)
+                nrec += len(rows)
+                rows = []
+        catalog.record_many(rows)
+        nrec += len(rows)
+    return nrec
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# orchard: Utilities to training and analyzing machine learning-based density functionals
+# Copyright (C) 2024 The President and Fellows of Harvard College
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>
+#
+# Author: Kyle Bystrom <kylebystrom@gmail.com>
+#
+
+
+"""
+Reading and writing the SCF data files (data.hdf5 in the save_dir
+of a calc, and the chkfiles of SCF tasks).
+
+write_scf_data writes the energy, MO arrays and molecule in a single
+h5py transaction, with the MO coefficients chunked along the MO axis
+so that the occupied block can be read without the virtuals, and
+optional compression, float32 storage and truncation of the virtual
+space (see MO_STORAGE_DEFAULTS). The layout is compatible with
+lib.chkfile: the arrays are under <key>/ and the molecule under mol.
+
+LazySCFResult gives access to stored results without building a calc:
+the density matrix only needs the occupied MOs, the molecule is read
+from the file, and the full calc is built on first access.
+"""
+
+import h5py
+import numpy as np
+from pyscf import gto, scf
+
+MO_STORAGE_DEFAULTS = {
+    # number of virtual orbitals kept above the highest occupied one,
+    # None to keep all
+    "nvirt": None,
+    # "float32" halves the size of mo_coeff; not for restart files
+    "dtype": "float64",
+    # h5py compression filter for the MO arrays, e.g. "gzip"
+    "compression": None,
+}
+MO_CHUNK_SIZE = 64
+
+
+def get_mo_storage_settings(mo_storage):
+    """
+    Return the MO storage options for mo_storage, which is None or
+    "full" (store all MOs), "occupied" (no virtuals) or a dict
+    updating MO_STORAGE_DEFAULTS.
+    """
+    opts = dict(MO_STORAGE_DEFAULTS)
+    if mo_storage is None or mo_storage == "full":
+        return opts
+    if mo_storage == "occupied":
+        opts["nvirt"] = 0
+    elif isinstance(mo_storage, dict):
+        opts.update(mo_storage)
+    else:
+        raise ValueError("Unknown mo_storage {}".format(mo_storage))
+    return opts
+
+
+def get_nmo_window(mo_occ, nvirt=0):
+    """
+    Number of leading MOs that contain all occupied orbitals (of both
+    spins) plus nvirt virtuals (all MOs if nvirt is None).
+    """
+    mo_occ = np.asarray(mo_occ)
+    nmo = mo_occ.shape[-1]
+    if nvirt is None:
+        return nmo
+    occupied = np.nonzero((mo_occ.reshape(-1, nmo) > 0).any(axis=0))[0]
+    nocc = occupied[-1] + 1 if occupied.size > 0 else 0
+    return int(min(nmo, nocc + nvirt))
+
+
+def write_scf_data(fname, calc, key="calc", mo_storage=None, write_mol=True):
+    """
+    Write e_tot, mo_coeff, mo_energy and mo_occ of calc to fname under
+    key (and calc.mol under "mol" if write_mol) in one open of the file.
+
+    Returns:
+        dict describing the MO storage (see get_mo_storage_settings)
+    """
+    opts = get_mo_storage_settings(mo_storage)
+    mo_coeff = np.asarray(calc.mo_coeff)
+    nmo = mo_coeff.shape[-1]
+    nkeep = get_nmo_window(calc.mo_occ, opts["nvirt"])
+    kwargs = {}
+    if opts["compression"] is not None:
+        kwargs = {"compression": opts["compression"], "shuffle": True}
+    chunks = mo_coeff.shape[:-1] + (max(1, min(nkeep, MO_CHUNK_SIZE)),)
+    if mo_coeff.ndim == 3:
+        chunks = (1,) + chunks[1:]
+    with h5py.File(fname, "a") as f:
+        for name in [key, "mol"]:
+            if name in f and (name == key or write_mol):
+                del f[name]
+        grp = f.create_group(key)
+        grp["e_tot"] = calc.e_tot
+        grp.create_dataset(
+            "mo_coeff",
+            data=mo_coeff[..., :nkeep].astype(opts["dtype"]),
+            chunks=chunks,
+            **kwargs
+        )
+        grp.create_dataset(
+            "mo_energy", data=np.asarray(calc.mo_energy)[..., :nkeep], **kwargs
+        )
+        grp.create_dataset(
+            "mo_occ", data=np.asarray(calc.mo_occ)[..., :nkeep], **kwargs
+        )
+        if nkeep < nmo:
+            grp["nmo"] = nmo
+        if write_mol:
+            f["mol"] = calc.mol.dumps()
+    return {
+        "nmo": nmo,
+        "nmo_saved": nkeep,
+        "dtype": opts["dtype"],
+        "compression": opts["compression"],
+    }
+
+
+def read_scf_data(fname, key="calc", occupied_only=False):
+    """
+    Read the data written by write_scf_data (or lib.chkfile.save) from
+    fname. With occupied_only, only the leading MOs up to the highest
+    occupied one are read, which is all the density matrix needs.
+    MOs stored as float32 are returned in double precision.
+    """
+    with h5py.File(fname, "r") as f:
+        grp = f.get(key)
+        if grp is None:
+            raise RuntimeError("No SCF data under {} in {}".format(key, fname))
+        mo_occ = grp["mo_occ"][()]
+        nkeep = get_nmo_window(mo_occ, 0 if occupied_only else None)
+        data = {
+            "e_tot": grp["e_tot"][()],
+            "mo_coeff": grp["mo_coeff"][..., :nkeep],
+            "mo_energy": grp["mo_energy"][..., :nkeep],
+            "mo_occ": mo_occ[..., :nkeep],
+        }
+    data["mo_coeff"] = np.asarray(data["mo_coeff"], dtype=np.float64)
+    return data
+
+
+def read_mol(fname):
+    """
+    Read the molecule stored in fname, or return None if there is none.
+    """
+    with h5py.File(fname, "r") as f:
+        if "mol" not in f:
+            return None
+        molstr = f["mol"][()]
+    if isinstance(molstr, bytes):
+        molstr = molstr.decode()
+    return gto.loads(molstr)
+
+
+def make_rdm1(mo_coeff, mo_occ):
+    if mo_coeff.ndim == 3:
+        return scf.uhf.make_rdm1(mo_coeff, mo_occ)
+    return scf.hf.make_rdm1(mo_coeff, mo_occ)
+
+
+class LazySCFResult:
+    """
+    Stored SCF result that reads data and builds objects on demand.
+    fname/key locate the data written by write_scf_data. build_calc is
+    called without arguments to build the calc (without MO data) the
+    first time the calc, or an attribute not defined here, is needed.
+    """
+
+    def __init__(self, fname, key="calc", build_calc=None, dm_only=False):
+        self.fname = fname
+        self.key = key
+        self.dm_only = dm_only
+        self._build_calc = build_calc
+        self._data = None
+        self._mol = None
+        self._calc = None
+
+    def _get_data(self, occupied_only=False):
+        occupied_only = occupied_only or self.dm_only
+        if self._data is None or (self._data[0] and not occupied_only):
+            data = read_scf_data(self.fname, self.key, occupied_only=occupied_only)
+            self._data = (occupied_only, data)
+        return self._data[1]
+
+    @property
+    def e_tot(self):
+        return self._get_data(occupied_only=True)["e_tot"]
+
+    @property
+    def mo_coeff(self):
+        return self._get_data()["mo_coeff"]
+
+    @property
+    def mo_energy(self):
+        return self._get_data()["mo_energy"]
+
+    @property
+    def mo_occ(self):
+        return self._get_data()["mo_occ"]
+
+    def make_rdm1(self):
+        data = self._get_data(occupied_only=True)
+        return make_rdm1(data["mo_coeff"], data["mo_occ"])
+
+    @property
+    def mol(self):
+        if self._calc is not None:
+            return self._calc.mol
+        if self._mol is None:
+            self._mol = read_mol(self.fname)
+        if self._mol is None:
+            return self.calc.mol
+        return self._mol
+
+    @property
+    def calc(self):
+        if self._calc is None:
+            if self._build_calc is None:
+                raise RuntimeError("No way to build the calc for " + self.fname)
+            calc = self._build_calc()
+            data = self._get_data()
+            calc.e_tot = data["e_tot"]
+            calc.mo_coeff = data["mo_coeff"]
+            calc.mo_energy = data["mo_energy"]
+            calc.mo_occ = data["mo_occ"]
+            self._calc = calc
+        return self._calc
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.calc, name)
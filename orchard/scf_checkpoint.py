@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# orchard: Utilities to training and analyzing machine learning-based density functionals
+# Copyright (C) 2024 The President and Fellows of Harvard College
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>
+#
+# Author: Kyle Bystrom <kylebystrom@gmail.com>
+#
+
+
+"""
+In-flight checkpointing of SCF calculations.
+
+With the scf_checkpoint control setting, the MOs of the running SCF
+are written every N iterations to scf_checkpoint.npz in the save_dir
+of the calc. Writes go to a temporary file that is then renamed, so
+a job killed during a write leaves the previous checkpoint intact.
+When the task is rerun with the same struct and settings, the SCF
+resumes from the density of the latest checkpoint. The checkpoint is
+removed once the SCF has finished.
+"""
+
+import os
+import time
+
+import numpy as np
+
+from orchard.disk_cache import hash_key
+from orchard.workflow_utils import get_save_dir
+
+CHECKPOINT_NAME = "scf_checkpoint.npz"
+CHECKPOINT_DEFAULTS = {
+    "every": 5,
+}
+
+
+def get_checkpoint_settings(settings):
+    """
+    Return the checkpoint options for settings, or None if
+    checkpointing is off. scf_checkpoint may be True, an int (the
+    number of iterations between checkpoints) or a dict.
+    """
+    opt = settings["control"].get("scf_checkpoint")
+    if not opt:
+        return None
+    ckpt = dict(CHECKPOINT_DEFAULTS)
+    if isinstance(opt, dict):
+        ckpt.update(opt)
+    elif not isinstance(opt, bool):
+        ckpt["every"] = int(opt)
+    return ckpt
+
+
+def get_checkpoint_file(save_root_dir, settings, system_id, method_name):
+    save_dir = get_save_dir(
+        save_root_dir,
+        "KS",
+        settings["mol"]["basis"],
+        system_id,
+        functional=method_name,
+    )
+    return os.path.join(save_dir, CHECKPOINT_NAME)
+
+
+def get_checkpoint_key(struct, settings):
+    """
+    Key identifying the calculation a checkpoint belongs to.
+    """
+    return hash_key([struct, settings])
+
+
+def add_scf_callback(calc, fn):
+    """
+    Call fn(envs) after every SCF iteration of calc, in addition to any
+    callback that is already set.
+    """
+    old_callback = calc.callback
+    if old_callback is None:
+        calc.callback = fn
+    else:
+
+        def callback(envs):
+            old_callback(envs)
+            fn(envs)
+
+        calc.callback = callback
+
+
+def write_checkpoint(fname, key, cycle, envs):
+    """
+    Atomically write the MOs of the current SCF iteration to fname.
+    """
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    tmp_fname = "{}.{}.tmp.npz".format(fname[:-4], os.getpid())
+    np.savez(
+        tmp_fname,
+        key=key,
+        cycle=cycle,
+        e_tot=envs["e_tot"],
+        mo_coeff=envs["mo_coeff"],
+        mo_occ=envs["mo_occ"],
+    )
+    os.replace(tmp_fname, fname)
+
+
+def load_checkpoint(fname, key):
+    """
+    Return the checkpoint in fname as a dict, or None if it does not
+    exist, cannot be read or belongs to a different calculation.
+    """
+    if not os.path.exists(fname):
+        return None
+    try:
+        with np.load(fname) as f:
+            if str(f["key"]) != key:
+                print("SCF checkpoint {} is for different settings".format(fname))
+                return None
+            return {k: f[k] for k in ["cycle", "e_tot", "mo_coeff", "mo_occ"]}
+    except (OSError, ValueError, KeyError) as e:
+        print("Could not read SCF checkpoint {}: {}".format(fname, e))
+        return None
+
+
+def setup_checkpointing(calc, fname, key, every, start_cycle=0):
+    """
+    Make calc write a checkpoint to fname every `every` iterations.
+    start_cycle is the cycle of the checkpoint the SCF resumed from.
+    Returns the previous calc.callback, to be restored when done.
+    """
+    old_callback = calc.callback
+    # cycles of earlier kernel calls (restarts, fallback stages)
+    state = {"offset": start_cycle, "last": -1}
+
+    def callback(envs):
+        # counts from zero within each kernel call, the second-order
+        # solver calls its macro iterations imacro
+        cycle = envs.get("cycle", envs.get("imacro"))
+        if cycle is None:
+            return
+        if cycle <= state["last"]:
+            state["offset"] += state["last"] + 1
+        state["last"] = cycle
+        total_cycle = state["offset"] + cycle + 1
+        if (total_cycle - start_cycle) % every != 0:
+            return
+        t0 = time.monotonic()
+        write_checkpoint(fname, key, total_cycle, envs)
+        print(
+            "SCF checkpoint at cycle {} ({:.2f} s)".format(
+                total_cycle, time.monotonic() - t0
+            )
+        )
+
+    add_scf_callback(calc, callback)
+    return old_callback
+
+
+def remove_checkpoint(fname):
+    """
+    Remove the checkpoint file, and the save_dir too if the checkpoint
+    was the only thing in it (so that no_overwrite saves still work).
+    """
+    try:
+        os.remove(fname)
+    except FileNotFoundError:
+        return
+    try:
+        os.rmdir(os.path.dirname(fname))
+    except OSError:
+        pass
+
+
+def resume_from_checkpoint(calc, fname, key):
+    """
+    Return (dm0, init_guess info) from the checkpoint in fname, or
+    (None, None) if there is no usable checkpoint.
+    """
+    ckpt = load_checkpoint(fname, key)
+    if ckpt is None:
+        return None, None
+    if ckpt["mo_coeff"].shape[-2] != calc.mol.nao_nr():
+        print("SCF checkpoint {} has the wrong shape".format(fname))
+        return None, None
+    dm0 = calc.make_rdm1(ckpt["mo_coeff"], ckpt["mo_occ"])
+    info = {
+        "method": "checkpoint",
+        "cycle": int(ckpt["cycle"]),
+        "e_tot": float(ckpt["e_tot"]),
+    }
+    print("Resuming SCF from checkpoint at cycle {}".format(info["cycle"]))
+    return dm0, info
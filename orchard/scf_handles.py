@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# orchard: Utilities to training and analyzing machine learning-based density functionals
+# Copyright (C) 2024 The President and Fellows of Harvard College
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>
+#
+# Author: Kyle Bystrom <kylebystrom@gmail.com>
+#
+
+
+"""
+Handle-based handoff of PySCF calculations between Firetasks.
+
+Instead of putting the calc object itself into the Fireworks spec,
+tasks register the calc in a per-process registry and put a small
+handle into the spec:
+
+    {"id": str, "chkfile": str, "key": str}
+
+(plus optionally "converged", "save_root_dir", used to locate stored
+DF tensors, see orchard.df_store, and "dm_only", see below)
+where chkfile/key locate the e_tot, mo_energy, mo_coeff and mo_occ of
+the converged calc on disk ("scf" for PySCF chkfiles, "calc" for the
+data.hdf5 files written by SaveSCFResults). Within one Firework, the
+following tasks get the calc object back from the registry. Across
+Fireworks (or processes), and for results loaded by LoadSCFCalc, a
+results_io.LazySCFResult is registered instead, which reads the
+stored data and rebuilds the calc from the struct and settings in the
+spec only when they are needed. Handles with "dm_only" rebuild a cheap
+calc that only holds the occupied MOs (enough for make_rdm1), without
+loading stored DF tensors.
+
+SCFCalc and SCFCalcFromRestart write their results to a scratch
+chkfile in the launch directory (see get_chkfile_path), since a
+following Firework may need it. SaveSCFResults moves the handle to
+the data.hdf5 it writes and deletes the scratch chkfile, so a scratch
+chkfile only remains if the results were not saved with data (and it
+may be removed once no Firework reads the handle anymore).
+"""
+
+import os
+import re
+import uuid
+from collections import OrderedDict
+
+from orchard.results_io import LazySCFResult, make_rdm1, read_scf_data, write_scf_data
+
+MAX_REGISTRY_SIZE = 4
+_registry = OrderedDict()
+_SCRATCH_RE = re.compile(r"^scf_[0-9a-f]{12}\.chk$")
+
+
+def _add_to_registry(handle_id, calc):
+    _registry[handle_id] = calc
+    _registry.move_to_end(handle_id)
+    while len(_registry) > MAX_REGISTRY_SIZE:
+        _registry.popitem(last=False)
+
+
+def register_calc(calc, chkfile, key="scf", converged=None):
+    """
+    Add calc to the process registry and return a handle for the spec.
+    """
+    handle = {
+        "id": uuid.uuid4().hex,
+        "chkfile": os.path.abspath(chkfile),
+        "key": key,
+    }
+    if converged is not None:
+        handle["converged"] = bool(converged)
+    _add_to_registry(handle["id"], calc)
+    return handle
+
+
+def dump_calc(calc, chkfile, key="scf", mo_storage=None):
+    """
+    Write the data needed to rebuild calc to chkfile under key, see
+    results_io.write_scf_data for mo_storage.
+
+    Returns:
+        dict describing the MO storage
+    """
+    return write_scf_data(chkfile, calc, key=key, mo_storage=mo_storage)
+
+
+def get_chkfile_path(dirname=None):
+    """
+    New, unique chkfile path for an SCF task in dirname (default: the
+    launch directory).
+    """
+    fname = "scf_{}.chk".format(uuid.uuid4().hex[:12])
+    return os.path.abspath(os.path.join(dirname or os.getcwd(), fname))
+
+
+def move_handle(handle, chkfile, key="calc"):
+    """
+    Return a copy of handle that points to the same results in chkfile
+    under key (e.g. the data.hdf5 written by SaveSCFResults), and
+    delete the scratch chkfile from get_chkfile_path that handle
+    pointed to, if any. The registered calc is kept under the same id.
+    """
+    old_chkfile = handle["chkfile"]
+    handle = dict(handle)
+    handle["chkfile"] = os.path.abspath(chkfile)
+    handle["key"] = key
+    if old_chkfile != handle["chkfile"] and _SCRATCH_RE.match(
+        os.path.basename(old_chkfile)
+    ):
+        try:
+            os.remove(old_chkfile)
+        except FileNotFoundError:
+            pass
+    return handle
+
+
+def _load_mo_data(handle, occupied_only=False):
+    return read_scf_data(handle["chkfile"], handle["key"], occupied_only=occupied_only)
+
+
+def _make_lazy_result(handle, struct, settings):
+    def build_calc():
+        from ase import Atoms
+
+        from orchard import pyscf_caller
+        from orchard.df_store import load_df_tensor
+
+        calc = pyscf_caller.setup_calc(Atoms.fromdict(struct), settings)
+        if not handle.get("dm_only"):
+            load_df_tensor(calc, handle.get("save_root_dir"))
+        if handle.get("converged") is not None:
+            calc.converged = handle["converged"]
+        return calc
+
+    return LazySCFResult(
+        handle["chkfile"],
+        key=handle["key"],
+        build_calc=build_calc,
+        dm_only=bool(handle.get("dm_only")),
+    )
+
+
+def register_lazy_result(handle, struct, settings):
+    """
+    Register a LazySCFResult for a handle to stored data (e.g. from
+    LoadSCFCalc), so that nothing is read or built until a task needs
+    it. Returns the LazySCFResult.
+    """
+    result = _make_lazy_result(handle, struct, settings)
+    _add_to_registry(handle["id"], result)
+    return result
+
+
+def get_scf_result(fw_spec, handle_key="calc_handle"):
+    """
+    Return the calc, or a LazySCFResult standing in for it, referred to
+    by fw_spec[handle_key]. Both provide e_tot, mol, mo_* and
+    make_rdm1(), but the LazySCFResult only reads the data it needs and
+    only builds the calc when other attributes are accessed.
+    """
+    handle = fw_spec.get(handle_key)
+    if handle is None:
+        return get_calc(fw_spec, handle_key=handle_key)
+    result = _registry.get(handle["id"])
+    if result is None:
+        result = register_lazy_result(handle, fw_spec["struct"], fw_spec["settings"])
+    else:
+        _add_to_registry(handle["id"], result)
+    return result
+
+
+def get_calc(fw_spec, handle_key="calc_handle"):
+    """
+    Return the calc referred to by fw_spec[handle_key]. The registered
+    object is returned if it lives in this process; otherwise the calc
+    is rebuilt from fw_spec["struct"], fw_spec["settings"] and the
+    checkpoint, and registered for the following tasks. Specs from
+    before handles were used that contain "calc" directly still work.
+    """
+    handle = fw_spec.get(handle_key)
+    if handle is None:
+        if fw_spec.get("calc") is not None:
+            return fw_spec["calc"]
+        raise KeyError("fw_spec contains neither {} nor calc".format(handle_key))
+    result = get_scf_result(fw_spec, handle_key=handle_key)
+    if isinstance(result, LazySCFResult):
+        return result.calc
+    return result
+
+
+def load_rdm1(chkfile, key):
+    """
+    Build the density matrix from the MO data stored in chkfile under
+    key, without building a calc.
+    """
+    data = _load_mo_data({"chkfile": chkfile, "key": key}, occupied_only=True)
+    return make_rdm1(data["mo_coeff"], data["mo_occ"])
+
+
+def get_rdm1(fw_spec, handle_key="calc_handle"):
+    """
+    Return the density matrix of the calc referred to by
+    fw_spec[handle_key], without rebuilding the calc if it is not
+    in this process.
+    """
+    return get_scf_result(fw_spec, handle_key=handle_key).make_rdm1()
+
+
+def clear_registry():
+    _registry.clear()
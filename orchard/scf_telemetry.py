@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# orchard: Utilities to training and analyzing machine learning-based density functionals
+# Copyright (C) 2024 The President and Fellows of Harvard College
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>
+#
+# Author: Kyle Bystrom <kylebystrom@gmail.com>
+#
+
+
+"""
+Per-iteration SCF telemetry. A callback records the energy, energy
+change, orbital gradient norm (the norm of the commutator FDS - SDF
+that DIIS extrapolates, i.e. the DIIS error), density change and time
+of each SCF iteration. cycle counts from zero within each kernel call,
+and run numbers the kernel calls of the calc (restarts and
+convergence fallback stages continue the SCF in a new run). The records are passed along in the task spec
+and written to scf_telemetry.npz in the save_dir of the calc.
+collect_telemetry aggregates many of these files for convergence
+analysis.
+"""
+
+import os
+import time
+
+import numpy as np
+
+from orchard.scf_checkpoint import add_scf_callback
+
+TELEMETRY_NAME = "scf_telemetry.npz"
+TELEMETRY_FIELDS = [
+    "run",
+    "cycle",
+    "e_tot",
+    "delta_e",
+    "norm_gorb",
+    "norm_ddm",
+    "time",
+]
+_INT_FIELDS = ["run", "cycle"]
+
+
+def use_telemetry(settings):
+    """
+    Telemetry is recorded unless the scf_telemetry control setting
+    is False.
+    """
+    opt = settings["control"].get("scf_telemetry")
+    return opt is None or bool(opt)
+
+
+class SCFTelemetry:
+    def __init__(self):
+        self.records = {k: [] for k in TELEMETRY_FIELDS}
+        self.start_time = time.time()
+
+    def __call__(self, envs):
+        # hf.kernel passes cycle, newton (SOSCF) passes imacro
+        cycle = envs.get("cycle", envs.get("imacro"))
+        e_tot = envs.get("e_tot")
+        last_e = envs.get("last_hf_e")
+        if cycle is None or e_tot is None:
+            return
+        run = self.records["run"][-1] if self.records["run"] else 0
+        if self.records["cycle"] and cycle <= self.records["cycle"][-1]:
+            run += 1
+        self.records["run"].append(run)
+        self.records["cycle"].append(int(cycle))
+        self.records["e_tot"].append(float(e_tot))
+        self.records["delta_e"].append(
+            np.nan if last_e is None else float(e_tot - last_e)
+        )
+        for k in ["norm_gorb", "norm_ddm"]:
+            v = envs.get(k)
+            self.records[k].append(np.nan if v is None else float(v))
+        self.records["time"].append(time.time() - self.start_time)
+
+    def to_dict(self):
+        """
+        Records as a dict of lists, which can be stored in a spec.
+        """
+        data = {k: list(v) for k, v in self.records.items()}
+        data["start_time"] = self.start_time
+        return data
+
+
+def add_telemetry(calc):
+    """
+    Record telemetry for every SCF iteration of calc. Returns the
+    SCFTelemetry object.
+    """
+    telemetry = SCFTelemetry()
+    add_scf_callback(calc, telemetry)
+    return telemetry
+
+
+def write_telemetry(save_dir, telemetry):
+    """
+    Write telemetry (an SCFTelemetry or the dict from to_dict) to
+    scf_telemetry.npz in save_dir. Returns the file name.
+    """
+    if isinstance(telemetry, SCFTelemetry):
+        telemetry = telemetry.to_dict()
+    fname = os.path.join(save_dir, TELEMETRY_NAME)
+    arrays = {
+        k: np.asarray(telemetry[k], dtype=np.int32 if k in _INT_FIELDS else np.float64)
+        for k in TELEMETRY_FIELDS
+    }
+    np.savez_compressed(fname, start_time=telemetry["start_time"], **arrays)
+    return fname
+
+
+def load_telemetry(fname):
+    with np.load(fname) as f:
+        data = {k: f[k] for k in f.files}
+    if "run" not in data:
+        # written before runs were recorded
+        data["run"] = np.zeros(len(data["cycle"]), dtype=np.int32)
+    return data
+
+
+def find_telemetry_files(save_root_dir, method_name=None, basis=None):
+    """
+    Find the telemetry files in the KS/<functional>/<basis> layout
+    of save_root_dir, optionally restricted to one functional and/or
+    basis.
+    """
+    from orchard.workflow_utils import get_functional_db_name
+
+    root = os.path.join(save_root_dir, "KS")
+    check_basis = basis is not None
+    if method_name is not None:
+        root = os.path.join(root, get_functional_db_name(method_name))
+        if basis is not None:
+            root = os.path.join(root, basis)
+            check_basis = False
+    fnames = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        if TELEMETRY_NAME in filenames:
+            fname = os.path.join(dirpath, TELEMETRY_NAME)
+            # KS/<functional>/<basis>/<system_id>
+            if check_basis and os.path.relpath(fname, root).split(os.sep)[1] != basis:
+                continue
+            fnames.append(fname)
+    return sorted(fnames)
+
+
+def collect_telemetry(fnames):
+    """
+    Aggregate telemetry files. Returns a dict with the concatenated
+    records of all files, the offsets of each file in the concatenated
+    arrays (records of file i are offsets[i]:offsets[i+1]) and the
+    file names. Unreadable files are skipped.
+    """
+    data = {k: [] for k in TELEMETRY_FIELDS}
+    offsets = [0]
+    loaded = []
+    for fname in fnames:
+        try:
+            tel = load_telemetry(fname)
+        except (OSError, ValueError, KeyError):
+            print("Could not read telemetry file {}".format(fname))
+            continue
+        for k in TELEMETRY_FIELDS:
+            data[k].append(tel[k])
+        offsets.append(offsets[-1] + len(tel["e_tot"]))
+        loaded.append(fname)
+    for k in TELEMETRY_FIELDS:
+        if len(data[k]) > 0:
+            data[k] = np.concatenate(data[k])
+        else:
+            data[k] = np.zeros(0)
+    data["offsets"] = np.asarray(offsets)
+    data["fnames"] = loaded
+    return data
+
+
+def get_convergence_rates(data, key="norm_gorb", min_cycles=3):
+    """
+    Estimate the convergence rate of each file in collected telemetry
+    as the slope of log10 |data[key]| versus iteration, from a linear
+    fit over the first run (the SCF itself, not its restarts or
+    fallback stages). Files with fewer than min_cycles finite values
+    get nan.
+
+    Returns:
+        np.ndarray of length len(data["fnames"])
+    """
+    offsets = data["offsets"]
+    rates = np.full(len(offsets) - 1, np.nan)
+    for i in range(len(offsets) - 1):
+        vals = np.abs(data[key][offsets[i] : offsets[i + 1]])
+        runs = data["run"][offsets[i] : offsets[i + 1]]
+        cond = np.isfinite(vals) & (vals > 0) & (runs == 0)
+        if np.count_nonzero(cond) < min_cycles:
+            continue
+        x = np.arange(len(vals))[cond]
+        rates[i] = np.polyfit(x, np.log10(vals[cond]), 1)[0]
+    return rates
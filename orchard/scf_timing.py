@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# orchard: Utilities to training and analyzing machine learning-based density functionals
+# Copyright (C) 2024 The President and Fellows of Harvard College
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>
+#
+# Author: Kyle Bystrom <kylebystrom@gmail.com>
+#
+
+
+"""
+Phase-level timing of SCF tasks. A PhaseTimer accumulates the wall
+time, CPU time (of all threads of the process) and number of calls per
+phase. instrument_calc makes the expensive methods of a calc and of
+its grids, numint, DF and dispersion objects report to a timer, by
+switching each object to a subclass with timed methods, so copies of
+the calc (e.g. in the precision_ramp mode) and second-order solvers
+built from it are timed too.
+
+Phases can be nested: "veff" includes "jk" and "xc", "jk" includes
+"df_build" on the first call (J-only density fitting does not call
+DF.build, so its setup is only part of "jk"), and "energy_nuc"
+includes "dispersion". Re-entrant calls of the same phase are only
+counted once.
+"""
+
+import time
+from contextlib import contextmanager
+
+from pyscf import lib
+
+from orchard.resources import get_peak_rss_mb
+
+# method name -> phase name, per object type
+CALC_PHASES = {
+    "get_init_guess": "init_guess",
+    "get_veff": "veff",
+    "get_jk": "jk",
+    "get_j": "jk",
+    "get_k": "jk",
+    "get_fock": "fock",
+    "eig": "diagonalization",
+    "energy_nuc": "energy_nuc",
+}
+NUMINT_PHASES = {
+    "nr_rks": "xc",
+    "nr_uks": "xc",
+    "nr_nlc_vxc": "xc",
+}
+GRIDS_PHASES = {"build": "grids"}
+DF_PHASES = {"build": "df_build"}
+_timed_classes = {}
+
+
+class PhaseTimer:
+    def __init__(self):
+        self.phases = {}
+        self._active = set()
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+
+    def add(self, name, wall, cpu=0.0, calls=1):
+        phase = self.phases.setdefault(name, {"wall": 0.0, "cpu": 0.0, "calls": 0})
+        phase["wall"] += wall
+        phase["cpu"] += cpu
+        phase["calls"] += calls
+
+    @contextmanager
+    def phase(self, name):
+        if name in self._active:
+            yield
+            return
+        self._active.add(name)
+        t0, c0 = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self._active.discard(name)
+            self.add(name, time.perf_counter() - t0, time.process_time() - c0)
+
+    def summary(self, mol=None, grids=None, threads=None):
+        """
+        Dict with the phase timings, total wall and CPU time, thread
+        count (default lib.num_threads()) and peak RSS, and the system
+        size if mol is given.
+        """
+        summary = {
+            "phases": {
+                name: {
+                    "wall": float(p["wall"]),
+                    "cpu": float(p["cpu"]),
+                    "calls": int(p["calls"]),
+                }
+                for name, p in self.phases.items()
+            },
+            "wall": time.perf_counter() - self.start_wall,
+            "cpu": time.process_time() - self.start_cpu,
+            "threads": lib.num_threads() if threads is None else threads,
+            "peak_rss_mb": get_peak_rss_mb(),
+        }
+        if mol is not None:
+            summary["size"] = {
+                "natm": mol.natm,
+                "nelectron": mol.nelectron,
+                "nao": mol.nao_nr(),
+            }
+            if grids is not None and getattr(grids, "weights", None) is not None:
+                summary["size"]["ngrids"] = int(grids.weights.size)
+        return summary
+
+
+def _timed_method(func, phase):
+    def method(self, *args, **kwargs):
+        timer = getattr(self, "_phase_timer", None)
+        if timer is None:
+            return func(self, *args, **kwargs)
+        with timer.phase(phase):
+            return func(self, *args, **kwargs)
+
+    method.__name__ = func.__name__
+    method.__doc__ = func.__doc__
+    return method
+
+
+def _instrument(obj, phases, timer):
+    if obj is None:
+        return
+    cls = type(obj)
+    if cls not in _timed_classes.values():
+        if cls not in _timed_classes:
+            attrs = {}
+            for name, phase in phases.items():
+                func = getattr(cls, name, None)
+                # only plain methods, not static/class methods
+                if callable(func) and not isinstance(
+                    cls.__dict__.get(name), (staticmethod, classmethod)
+                ):
+                    attrs[name] = _timed_method(func, phase)
+            attrs["_untimed_class"] = cls
+            _timed_classes[cls] = type(cls.__name__, (cls,), attrs)
+        obj.__class__ = _timed_classes[cls]
+    obj._phase_timer = timer
+
+
+def untimed_class(obj):
+    """
+    The class of obj before instrument_calc, e.g. to compare the types
+    of objects of which only some are instrumented.
+    """
+    return getattr(type(obj), "_untimed_class", type(obj))
+
+
+def _uninstrument(obj):
+    if obj is None:
+        return
+    if type(obj) in _timed_classes.values():
+        obj.__class__ = type(obj)._untimed_class
+    obj.__dict__.pop("_phase_timer", None)
+
+
+def _instrument_kernel(disp, timer):
+    if "_untimed_kernel" in disp.__dict__:
+        kernel = disp._untimed_kernel
+    else:
+        kernel = disp.kernel
+        disp._untimed_kernel = kernel
+
+    def timed_kernel(*args, **kwargs):
+        with timer.phase("dispersion"):
+            return kernel(*args, **kwargs)
+
+    disp.kernel = timed_kernel
+
+
+def instrument_calc(calc, timer):
+    """
+    Make calc and its grids, numint, DF and dispersion objects report
+    to timer. Returns calc.
+    """
+    _instrument(calc, CALC_PHASES, timer)
+    _instrument(getattr(calc, "_numint", None), NUMINT_PHASES, timer)
+    _instrument(getattr(calc, "grids", None), GRIDS_PHASES, timer)
+    _instrument(getattr(calc, "nlcgrids", None), GRIDS_PHASES, timer)
+    _instrument(getattr(calc, "with_df", None), DF_PHASES, timer)
+    for name in ["with_dftd3", "with_dftd4"]:
+        if getattr(calc, name, None) is not None:
+            _instrument_kernel(getattr(calc, name), timer)
+    return calc
+
+
+def remove_timer(calc):
+    """
+    Undo instrument_calc: restore the original classes of calc and its
+    components and the original dispersion kernels.
+    """
+    for obj in [
+        calc,
+        getattr(calc, "_numint", None),
+        getattr(calc, "grids", None),
+        getattr(calc, "nlcgrids", None),
+        getattr(calc, "with_df", None),
+    ]:
+        _uninstrument(obj)
+    for name in ["with_dftd3", "with_dftd4"]:
+        disp = getattr(calc, name, None)
+        if disp is not None and "_untimed_kernel" in disp.__dict__:
+            disp.kernel = disp.__dict__.pop("_untimed_kernel")
+
+
+def add_phase(timings, name, wall, cpu=0.0):
+    """
+    Return a copy of a timing summary with one more phase, e.g. to
+    record the save time in a later task.
+    """
+    timings = dict(timings)
+    timings["phases"] = dict(timings.get("phases", {}))
+    timings["phases"][name] = {"wall": float(wall), "cpu": float(cpu), "calls": 1}
+    return timings
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# orchard: Utilities to training and analyzing machine learning-based density functionals
+# Copyright (C) 2024 The President and Fellows of Harvard College
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>
+#
+# Author: Kyle Bystrom <kylebystrom@gmail.com>
+#
+
+
+"""
+Entry point for the orchard scripts, e.g.
+    python -m orchard.scripts train_gp --help
+Only the module of the requested command is imported, and each script
+defers its heavy (ciderpress, pyscf, JAX, etc.) imports until after
+its arguments are parsed, so --help and submission-only runs start fast.
+"""
+
+import runpy
+import sys
+
+COMMANDS = {
+    "benchmark_basis_cache": "Time Mole builds with the parsed basis/ECP cache",
+    "benchmark_scf_modes": "Compare SCF modes with direct convergence",
+    "build_results_catalog": "Rebuild the SQLite results catalog from SAVE_ROOT",
+    "calibrate_integral_cost": "Calibrate the cost model of the auto integral mode",
+    "compile_dataset": "Compile dataset of XC descriptors (old descriptors)",
+    "compile_gpaw_dataset": "Compile dataset of XC descriptors from GPAW calcs",
+    "compile_pyscf_dataset": "Compile dataset of XC descriptors from PySCF calcs",
+    "gp_to_spline": "Map a GP model to a cubic spline",
+    "make_error_table": "Compute error tables for exchange/correlation models",
+    "pack_accdb_geometries": "Pack the ACCDB geometries into one indexed file",
+    "train_gp": "Train a GP exchange model",
+    "train_mol": "Train a molecular GP model",
+    "train_mol_new": "Train a molecular GP model (new feature settings)",
+    "train_toten": "Refit a GP to total/reaction energies",
+    "train_xc_params": "Train a parametric (JAX-implemented) XC functional",
+}
+
+
+def print_usage(file=sys.stdout):
+    print("usage: python -m orchard.scripts <command> [args...]\n", file=file)
+    print("commands:", file=file)
+    width = max(len(name) for name in COMMANDS)
+    for name, desc in COMMANDS.items():
+        print("  {}  {}".format(name.ljust(width), desc), file=file)
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] in ["-h", "--help"]:
+        print_usage()
+        return
+    command = sys.argv[1].replace("-", "_")
+    if command not in COMMANDS:
+        print("Unknown command {}\n".format(sys.argv[1]), file=sys.stderr)
+        print_usage(file=sys.stderr)
+        sys.exit(2)
+    sys.argv = ["orchard.scripts." + command] + sys.argv[2:]
+    runpy.run_module("orchard.scripts." + command, run_name="__main__")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# orchard: Utilities to training and analyzing machine learning-based density functionals
+# Copyright (C) 2024 The President and Fellows of Harvard College
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>
+#
+# Author: Kyle Bystrom <kylebystrom@gmail.com>
+#
+
+
+import time
+from argparse import ArgumentParser
+
+"""
+Microbenchmark for orchard.basis_cache. For each element, builds
+single-atom molecules repeatedly with basis/ECP names (parsed by PySCF
+on every build) and with the per-process cache used by setup_calc,
+and prints the time per build and the speedup. The cached builds
+are checked to give the same overlap matrix and electron count.
+"""
+
+DEFAULT_ELEMENTS = [
+    "H",
+    "Li",
+    "C",
+    "N",
+    "O",
+    "F",
+    "Na",
+    "Si",
+    "P",
+    "S",
+    "Cl",
+    "Fe",
+    "Cu",
+    "Zn",
+    "Br",
+    "I",
+]
+
+
+def build_mol(symb, basis, ecp, cached):
+    from pyscf import gto
+
+    from orchard.basis_cache import apply_basis_cache
+
+    mol = gto.Mole()
+    mol.atom = [[symb, (0.0, 0.0, 0.0)]]
+    mol.basis = basis
+    mol.ecp = ecp
+    mol.spin = None
+    mol.verbose = 0
+    if cached:
+        apply_basis_cache(mol)
+    return mol.build()
+
+
+def time_builds(symb, basis, ecp, cached, repeat):
+    start = time.perf_counter()
+    for i in range(repeat):
+        mol = build_mol(symb, basis, ecp, cached)
+    return (time.perf_counter() - start) / repeat, mol
+
+
+def main():
+    m_desc = "Time Mole builds with and without the parsed basis/ECP cache"
+
+    parser = ArgumentParser(description=m_desc)
+    parser.add_argument(
+        "--elements",
+        nargs="+",
+        default=DEFAULT_ELEMENTS,
+        help="Element symbols to build single-atom molecules for",
+    )
+    parser.add_argument("--basis", type=str, default="def2-qzvppd")
+    parser.add_argument(
+        "--ecp",
+        type=str,
+        default=None,
+        help="ECP name, defaults to the basis name",
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    import numpy as np
+
+    from orchard.basis_cache import clear_cache
+
+    ecp = args.ecp or args.basis
+    clear_cache()
+    fmt = "{:<4} {:>6} {:>14} {:>14} {:>14} {:>8}"
+    print(
+        fmt.format(
+            "ELEM", "NAO", "NAMES (ms)", "1ST CACHE (ms)", "CACHED (ms)", "SPEEDUP"
+        )
+    )
+    totals = [0.0, 0.0]
+    for symb in args.elements:
+        t_first, _ = time_builds(symb, args.basis, ecp, True, 1)
+        t_names, ref_mol = time_builds(symb, args.basis, ecp, False, args.repeat)
+        t_cached, mol = time_builds(symb, args.basis, ecp, True, args.repeat)
+        assert mol.nelectron == ref_mol.nelectron
+        assert np.allclose(mol.intor("int1e_ovlp"), ref_mol.intor("int1e_ovlp"))
+        totals[0] += t_names
+        totals[1] += t_cached
+        print(
+            fmt.format(
+                symb,
+                mol.nao_nr(),
+                "{:.3f}".format(1000 * t_names),
+                "{:.3f}".format(1000 * t_first),
+                "{:.3f}".format(1000 * t_cached),
+                "x{:.1f}".format(t_names / t_cached),
+            )
+        )
+    print(
+        "TOTAL per build of all elements: {:.3f} ms -> {:.3f} ms (x{:.1f})".format(
+            1000 * totals[0], 1000 * totals[1], totals[0] / totals[1]
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
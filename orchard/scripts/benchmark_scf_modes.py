@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# orchard: Utilities to training and analyzing machine learning-based density functionals
+# Copyright (C) 2024 The President and Fellows of Harvard College
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>
+#
+# Author: Kyle Bystrom <kylebystrom@gmail.com>
+#
+
+
+import time
+from argparse import ArgumentParser
+
+"""
+Script to benchmark the SCF modes of pyscf_caller.run_scf against
+direct convergence on a fixed set of molecules. For each molecule and
+mode, prints the wall time, number of SCF cycles in the target basis
+and the total energy difference from direct convergence.
+"""
+
+DEFAULT_MOLECULES = [
+    "C",
+    "N",
+    "O",
+    "H2O",
+    "NH3",
+    "CH4",
+    "C2H4",
+    "CH3OH",
+    "CH3CH2OH",
+    "C6H6",
+]
+
+SCF_MODES = {
+    "direct": {},
+    "basis_ladder": {"basis_ladder": True},
+    "precision_ramp": {"precision_ramp": True},
+    "ladder+ramp": {"basis_ladder": True, "precision_ramp": True},
+    "symmetry": {"symmetry": True},
+}
+
+
+def run_mode(atoms, settings, mode):
+    from orchard import pyscf_caller
+    from orchard.pyscf_tasks import get_pyscf_settings
+
+    settings = get_pyscf_settings(settings)
+    settings["control"].update(SCF_MODES[mode])
+    spin = int(round(atoms.get_initial_magnetic_moments().sum()))
+    settings["mol"]["spin"] = spin
+    settings["control"]["spinpol"] = spin != 0
+    start = time.monotonic()
+    calc = pyscf_caller.setup_calc(atoms, settings)
+    info = pyscf_caller.run_scf(calc, atoms, settings)
+    wall_time = time.monotonic() - start
+    return {
+        "e_tot": calc.e_tot,
+        "converged": calc.converged,
+        "cycles": calc.cycles,
+        "wall_time": wall_time,
+        "info": info,
+    }
+
+
+def main():
+    m_desc = "Compare SCF modes (e.g. basis_ladder) with direct convergence"
+
+    parser = ArgumentParser(description=m_desc)
+    parser.add_argument(
+        "--molecules",
+        nargs="+",
+        default=DEFAULT_MOLECULES,
+        help="ASE g2 molecule or atom names",
+    )
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        default=list(SCF_MODES.keys()),
+        choices=list(SCF_MODES.keys()),
+        help="SCF modes to compare, direct is always run",
+    )
+    parser.add_argument("--functional", type=str, default="PBE")
+    parser.add_argument("--basis", type=str, default="def2-tzvppd")
+    parser.add_argument("--density-fit", action="store_true")
+    parser.add_argument("--conv-tol", type=float, default=1e-9)
+    parser.add_argument("--grids-level", type=int, default=3)
+    parser.add_argument("--verbose", type=int, default=0)
+    args = parser.parse_args()
+
+    from ase.build import molecule
+
+    settings = {
+        "control": {
+            "mol_format": "ase",
+            "spinpol": False,
+            "density_fit": args.density_fit,
+        },
+        "mol": {
+            "basis": args.basis,
+            "ecp": args.basis,
+            "verbose": args.verbose,
+        },
+        "calc": {"xc": args.functional, "conv_tol": args.conv_tol},
+        "grids": {"level": args.grids_level},
+    }
+    modes = ["direct"] + [m for m in args.modes if m != "direct"]
+    fmt = "{:<12} {:<14} {:>10} {:>7} {:>12} {:>6}"
+    print(fmt.format("MOLECULE", "MODE", "TIME (s)", "CYCLES", "DE (Ha)", "CONV"))
+    totals = {mode: 0.0 for mode in modes}
+    for name in args.molecules:
+        atoms = molecule(name)
+        ref = None
+        for mode in modes:
+            res = run_mode(atoms, settings, mode)
+            if ref is None:
+                ref = res
+            totals[mode] += res["wall_time"]
+            print(
+                fmt.format(
+                    name,
+                    mode,
+                    "{:.2f}".format(res["wall_time"]),
+                    res["cycles"],
+                    "{:.2e}".format(res["e_tot"] - ref["e_tot"]),
+                    str(res["converged"]),
+                )
+            )
+    print("TOTAL WALL TIME")
+    for mode in modes:
+        speedup = totals["direct"] / totals[mode] if totals[mode] > 0 else 0
+        print("  {:<14} {:.2f} s  (x{:.2f})".format(mode, totals[mode], speedup))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# orchard: Utilities to training and analyzing machine learning-based density functionals
+# Copyright (C) 2024 The President and Fellows of Harvard College
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>
+#
+# Author: Kyle Bystrom <kylebystrom@gmail.com>
+#
+
+
+import time
+from argparse import ArgumentParser
+
+from orchard import workflow_utils
+from orchard.results_catalog import (
+    CATALOG_CALC_TYPES,
+    ResultsCatalog,
+    get_catalog_path,
+    rebuild_catalog,
+)
+
+"""
+Script to (re)build the SQLite results catalog by crawling SAVE_ROOT.
+"""
+
+
+def main():
+    m_desc = "Rebuild the results catalog from the run_info.yaml files in SAVE_ROOT"
+
+    parser = ArgumentParser(description=m_desc)
+    parser.add_argument(
+        "--save-root",
+        type=str,
+        default=None,
+        help="Directory to crawl, defaults to SAVE_ROOT",
+    )
+    parser.add_argument(
+        "--catalog-path",
+        type=str,
+        default=None,
+        help="Catalog file, defaults to CATALOG_PATH or <save-root>/results_catalog.sqlite",
+    )
+    parser.add_argument(
+        "--calc-types",
+        type=str,
+        nargs="+",
+        default=CATALOG_CALC_TYPES,
+        help="Calculation types (top-level directories) to crawl",
+    )
+    parser.add_argument(
+        "--nproc", type=int, default=None, help="Number of worker processes"
+    )
+    args = parser.parse_args()
+
+    save_root = args.save_root or workflow_utils.SAVE_ROOT
+    if save_root is None:
+        raise ValueError("Must provide --save-root or set MLDFTDB_ROOT in config")
+    catalog_path = args.catalog_path or get_catalog_path(save_root)
+    start = time.monotonic()
+    nrec = rebuild_catalog(
+        save_root,
+        catalog=ResultsCatalog(catalog_path),
+        calc_types=args.calc_types,
+        nproc=args.nproc,
+    )
+    stop = time.monotonic()
+    print(
+        "Recorded {} results in {} ({:.1f} s)".format(nrec, catalog_path, stop - start)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# orchard: Utilities to training and analyzing machine learning-based density functionals
+# Copyright (C) 2024 The President and Fellows of Harvard College
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>
+#
+# Author: Kyle Bystrom <kylebystrom@gmail.com>
+#
+
+
+import time
+from argparse import ArgumentParser
+
+"""
+Script to calibrate the cost model used by the 'auto' integral mode
+(orchard.integral_strategy) on the local machine. Times exact ERIs,
+the DF tensor build, DF J and K builds and an SGX JK build for a few
+molecules, and writes the fitted per-operation coefficients (median
+over molecules) to INTEGRAL_COST_FILE or ~/.orchard_integral_cost.yaml.
+"""
+
+DEFAULT_MOLECULES = ["H2O", "CH3OH", "C2H6", "C6H6"]
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    res = func(*args, **kwargs)
+    return res, time.perf_counter() - start
+
+
+def calibrate_molecule(atoms, basis, nthreads, params):
+    import numpy as np
+    from pyscf import df, dft, gto, lib, scf, sgx
+    from pyscf.pbc.tools.pyscf_ase import atoms_from_ase
+
+    mol = gto.M(atom=atoms_from_ase(atoms), basis=basis, verbose=0)
+    nao = mol.nao_nr()
+    nocc = mol.nelectron // 2
+    npair = nao * (nao + 1) // 2
+    auxmol = df.addons.make_auxmol(mol)
+    naux = auxmol.nao_nr()
+    mf = dft.RKS(mol, xc="PBE0")
+    dm = mf.get_init_guess()
+    ratios = {}
+
+    _, t = _timed(mol.intor, "int2e", aosym="s8")
+    ratios["eri"] = t / (npair**2 / 2)
+
+    cderi, t = _timed(df.incore.cholesky_eri, mol, auxmol=auxmol)
+    ratios["int3c"] = t / (naux * npair)
+
+    dm_tril = lib.pack_tril(dm + dm.T - np.diag(np.diag(dm)))
+
+    def _dfj():
+        return lib.unpack_tril(cderi.T.dot(cderi.dot(dm_tril)))
+
+    _, t = _timed(_dfj)
+    ratios["dfj"] = t / (naux * npair)
+
+    mf_df = mf.density_fit()
+    mf_df.with_df._cderi = cderi
+    _, t = _timed(mf_df.get_k, mol, dm)
+    ratios["dfk"] = t / (nocc * naux * nao**2)
+
+    mf_sgx = sgx.sgx_fit(scf.RHF(mol))
+    mf_sgx.with_df.build()
+    _, t = _timed(mf_sgx.with_df.get_jk, dm)
+    ngrids = params["sgx_grids_per_atom"] * mol.natm
+    ratios["sgx"] = t / (ngrids * nao * (nao + nocc))
+    return {k: v * nthreads for k, v in ratios.items()}
+
+
+def main():
+    m_desc = "Calibrate the cost model of the 'auto' integral mode"
+
+    parser = ArgumentParser(description=m_desc)
+    parser.add_argument(
+        "--molecules",
+        nargs="+",
+        default=DEFAULT_MOLECULES,
+        help="ASE g2 molecule names",
+    )
+    parser.add_argument("--basis", type=str, default="def2-tzvp")
+    parser.add_argument(
+        "--out-file",
+        type=str,
+        default=None,
+        help="Output file, defaults to INTEGRAL_COST_FILE or "
+        "~/.orchard_integral_cost.yaml",
+    )
+    args = parser.parse_args()
+
+    import numpy as np
+    import yaml
+    from ase.build import molecule
+    from pyscf import lib
+
+    from orchard.integral_strategy import DEFAULT_AUTO_PARAMS, get_cost_file
+
+    nthreads = lib.num_threads()
+    all_ratios = {}
+    for name in args.molecules:
+        ratios = calibrate_molecule(
+            molecule(name), args.basis, nthreads, DEFAULT_AUTO_PARAMS
+        )
+        print(name, " ".join("{}={:.3e}".format(k, v) for k, v in ratios.items()))
+        for k, v in ratios.items():
+            all_ratios.setdefault(k, []).append(v)
+    coeffs = {k: float(np.median(v)) for k, v in all_ratios.items()}
+    out_file = args.out_file or get_cost_file()
+    with open(out_file, "w") as f:
+        yaml.dump(
+            {
+                "coeffs": coeffs,
+                "basis": args.basis,
+                "molecules": args.molecules,
+                "nthreads": nthreads,
+            },
+            f,
+        )
+    print("Wrote", out_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -25,16 +25,10 @@ from argparse import ArgumentParser
 
 import numpy as np
 import yaml
-from ciderpress.analyzers import ElectronAnalyzer, RHFAnalyzer, UHFAnalyzer
-from ciderpress.data import (
-    get_total_weights_spherical,
-    get_unique_coord_indexes_spherical,
-)
-from ciderpress.density import DESC_VERSION_LIST, GG_AMIN, get_exchange_descriptors
-from ciderpress.descriptors import FAST_DESC_VERSION_LIST, get_descriptors
-from pyscf.lib import chkfile
 
-from orchard.workflow_utils import SAVE_ROOT, get_save_dir, load_mol_ids
+from orchard import workflow_utils
+from orchard.results_catalog import get_result_dirs
+from orchard.workflow_utils import get_save_dir, load_mol_ids
 
 """
 Script to compile a dataset from the CIDER DB for training a CIDER functional.
@@ -53,6 +47,12 @@ def compile_dataset_old(
     analysis_level=1,
     **gg_kwargs
 ):
+    from ciderpress.analyzers import ElectronAnalyzer, RHFAnalyzer, UHFAnalyzer
+    from ciderpress.data import (
+        get_total_weights_spherical,
+        get_unique_coord_indexes_spherical,
+    )
+    from ciderpress.density import get_exchange_descriptors
 
     all_descriptor_data = []
     all_rho_data = []
@@ -165,6 +165,10 @@ def compile_dataset_old(
 def compile_single_system(
     save_file, analyzer_file, version, sparse_level, orbs, save_baselines, gg_kwargs
 ):
+    from ciderpress.analyzers import ElectronAnalyzer, RHFAnalyzer, UHFAnalyzer
+    from ciderpress.descriptors import get_descriptors
+    from pyscf.lib import chkfile
+
     start = time.monotonic()
     analyzer = ElectronAnalyzer.load(analyzer_file)
     if sparse_level is not None:
@@ -235,6 +239,19 @@ def compile_single_system(
     chkfile.dump(save_file, "train_data", data)
 
 
+def _find_existing_systems(save_dir):
+    """
+    System ids with a feature file in save_dir, found in one walk.
+    """
+    existing = set()
+    for dirpath, dirnames, filenames in os.walk(save_dir):
+        for fname in filenames:
+            if fname.endswith(".hdf5"):
+                path = os.path.join(dirpath, fname[:-5])
+                existing.add(os.path.relpath(path, save_dir))
+    return existing
+
+
 def intk_to_strk(d):
     if not isinstance(d, dict):
         return d
@@ -261,6 +278,8 @@ def compile_dataset(
     save_dir=None,
     **gg_kwargs
 ):
+    from ciderpress.descriptors import FAST_DESC_VERSION_LIST
+
     if version not in FAST_DESC_VERSION_LIST:
         raise ValueError("Unsupported version for new dataset module")
 
@@ -313,11 +332,20 @@ def compile_dataset(
 
         fwlist = {}
 
+    data_dirs, missing = get_result_dirs(
+        SAVE_ROOT, "KS", FUNCTIONAL, BASIS, MOL_IDS, analysis_level=analysis_level
+    )
+    if missing:
+        logging.warning(
+            "No level {} analysis in catalog for {}".format(analysis_level, missing)
+        )
+    existing = _find_existing_systems(save_dir) if skip_existing else set()
+
     for MOL_ID in MOL_IDS:
         logging.info("Computing descriptors for {}".format(MOL_ID))
-        data_dir = get_save_dir(SAVE_ROOT, "KS", BASIS, MOL_ID, FUNCTIONAL)
+        data_dir = data_dirs[MOL_ID]
         save_file = os.path.join(save_dir, MOL_ID + ".hdf5")
-        if os.path.exists(save_file) and skip_existing:
+        if MOL_ID in existing:
             print("Already exists, skipping:", MOL_ID)
             continue
         analyzer_file = data_dir + "/analysis_L{}.hdf5".format(analysis_level)
@@ -368,7 +396,9 @@ def main():
     )
     parser.add_argument("--gg-a0", default=8.0, type=float)
     parser.add_argument("--gg-facmul", default=1.0, type=float)
-    parser.add_argument("--gg-amin", default=GG_AMIN, type=float)
+    parser.add_argument(
+        "--gg-amin", default=None, type=float, help="Default ciderpress GG_AMIN"
+    )
     parser.add_argument(
         "--gg-vvmul",
         default=1.0,
@@ -409,6 +439,10 @@ def main():
     )
     args = parser.parse_args()
 
+    from ciderpress.density import DESC_VERSION_LIST, GG_AMIN
+
+    if args.gg_amin is None:
+        args.gg_amin = GG_AMIN
     version = args.version.lower()
     if version not in DESC_VERSION_LIST:
         raise ValueError("Unsupported descriptor set")
@@ -435,7 +469,7 @@ def main():
         "_UNNAMED" if args.suffix is None else args.suffix,
         mol_id_code.upper().split("/")[-1],
         mol_ids,
-        SAVE_ROOT,
+        workflow_utils.SAVE_ROOT,
         args.functional,
         args.basis,
         # spherical_atom=args.spherical_atom,
@@ -23,10 +23,9 @@ import os
 from argparse import ArgumentParser
 
 import yaml
-from ciderpress.density import GG_AMIN
 
-from orchard.gpaw_tasks import StoreFeatures
-from orchard.workflow_utils import SAVE_ROOT, load_mol_ids
+from orchard import workflow_utils
+from orchard.workflow_utils import load_mol_ids
 
 
 def compile_dataset(
@@ -41,6 +40,8 @@ def compile_dataset(
     save_baselines=True,
     save_dir=None,
 ):
+    from orchard.gpaw_tasks import StoreFeatures
+
     if version not in ["b", "d"]:
         raise ValueError("Unsupported version for new dataset module")
 
@@ -102,6 +103,8 @@ def compile_exx_dataset(
     save_gap_data=False,
     save_baselines=True,
 ):
+    from orchard.gpaw_tasks import StoreFeatures
+
     fwlist = {}
 
     for MOL_ID in MOL_IDS:
@@ -149,7 +152,9 @@ def main():
     )
     parser.add_argument("--gg-a0", default=8.0, type=float)
     parser.add_argument("--gg-facmul", default=1.0, type=float)
-    parser.add_argument("--gg-amin", default=GG_AMIN, type=float)
+    parser.add_argument(
+        "--gg-amin", default=None, type=float, help="Default ciderpress GG_AMIN"
+    )
     parser.add_argument(
         "--gg-vvmul",
         default=1.0,
@@ -173,6 +178,10 @@ def main():
     )
     args = parser.parse_args()
 
+    if args.gg_amin is None:
+        from ciderpress.density import GG_AMIN
+
+        args.gg_amin = GG_AMIN
     version = args.version.lower()
     if version not in ["b", "d"]:
         raise ValueError("Unsupported descriptor set")
@@ -188,7 +197,7 @@ def main():
     if args.exx_only:
         res = compile_exx_dataset(
             mol_ids,
-            SAVE_ROOT,
+            workflow_utils.SAVE_ROOT,
             args.functional,
             kpt_density=args.kpt_density,
             save_gap_data=args.save_gap_data,
@@ -198,7 +207,7 @@ def main():
             "_UNNAMED" if args.suffix is None else args.suffix,
             mol_id_code.upper().split("/")[-1],
             mol_ids,
-            SAVE_ROOT,
+            workflow_utils.SAVE_ROOT,
             args.functional,
             gg_kwargs,
             version=version,
@@ -25,19 +25,9 @@ from argparse import ArgumentParser
 
 import numpy as np
 import yaml
-from ciderpress.dft.settings import (
-    FracLaplSettings,
-    HybridSettings,
-    NLDFSettings,
-    SDMXBaseSettings,
-    SemilocalSettings,
-)
-from ciderpress.pyscf.analyzers import ElectronAnalyzer, RHFAnalyzer, UHFAnalyzer
-from ciderpress.pyscf.descriptors import get_descriptors
-from pyscf.lib import chkfile
 
-from orchard.pyscf_tasks import StoreFeatures2
-from orchard.workflow_utils import SAVE_ROOT, get_save_dir, load_mol_ids
+from orchard import workflow_utils
+from orchard.workflow_utils import get_save_dir, load_mol_ids
 
 
 def intk_to_strk(d):
@@ -50,6 +40,14 @@ def intk_to_strk(d):
 
 
 def get_feat_type(settings):
+    from ciderpress.dft.settings import (
+        FracLaplSettings,
+        HybridSettings,
+        NLDFSettings,
+        SDMXBaseSettings,
+        SemilocalSettings,
+    )
+
     if settings == "l":
         return "REF"
     elif isinstance(settings, SemilocalSettings):
@@ -69,6 +67,10 @@ def get_feat_type(settings):
 def compile_single_system(
     settings, save_file, analyzer_file, sparse_level, orbs, save_baselines
 ):
+    from ciderpress.pyscf.analyzers import ElectronAnalyzer, RHFAnalyzer, UHFAnalyzer
+    from ciderpress.pyscf.descriptors import get_descriptors
+    from pyscf.lib import chkfile
+
     start = time.monotonic()
     analyzer = ElectronAnalyzer.load(analyzer_file)
     if sparse_level is not None:
@@ -210,6 +212,8 @@ def compile_dataset(
             save_baselines,
         ]
         if make_fws:
+            from orchard.pyscf_tasks import StoreFeatures2
+
             fwname = "feature_{}_{}".format(feat_name, mol_id)
             args[0] = yaml.dump(args[0], Dumper=yaml.CDumper)
             fwlist[fwname] = StoreFeatures2(args=args)
@@ -318,7 +322,7 @@ def main():
         args.feat_name,
         mol_id_code.upper().split("/")[-1],
         mol_id_list,
-        SAVE_ROOT,
+        workflow_utils.SAVE_ROOT,
         args.functional,
         args.basis,
         sparse_level=sparse_level,
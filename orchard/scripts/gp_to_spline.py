@@ -22,11 +22,6 @@ from argparse import ArgumentParser
 from itertools import combinations
 
 import numpy as np
-import pyscf.lib
-from ciderpress.dft.xc_models import NormGPFunctional
-from ciderpress.models.kernels import *
-from interpolation.splines import UCGrid, eval_cubic, filter_cubic
-from joblib import dump, load
 
 from orchard.scripts.train_gp import parse_dataset
 
@@ -53,6 +48,10 @@ def get_mapped_gp_evaluator_simple(gpr, rbf_density=8, max_ngrid=120):
     """
     Quick approach for pure RBF GP mapping for N <= 4
     """
+    import pyscf.lib
+    from ciderpress.dft.xc_models import NormGPFunctional
+    from interpolation.splines import UCGrid, filter_cubic
+
     if gpr.args.agpr:
         raise ValueError("Must not be additive GP!")
     X = gpr.X
@@ -158,6 +157,11 @@ def get_mapped_gp_evaluator(
     arbf_density=8,
     max_ngrid=120,
 ):
+    import pyscf.lib
+    from ciderpress.dft.xc_models import NormGPFunctional
+    from ciderpress.models.kernels import arbf_args
+    from interpolation.splines import UCGrid, eval_cubic, filter_cubic
+
     if not gpr.args.agpr:
         raise ValueError("Must be additive GP!")
     X = gpr.X
@@ -409,6 +413,8 @@ def main():
     # srbf_density=8, arbf_density=8, max_ngrid=120
     args = parser.parse_args()
 
+    from joblib import dump, load
+
     print("OUTNAME", args.outname)
 
     gpr = load(args.fname)
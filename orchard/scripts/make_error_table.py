@@ -23,18 +23,19 @@ from argparse import ArgumentParser
 from collections import Counter
 
 import numpy as np
-import pandas as pd
 import yaml
-from ase.data import atomic_numbers, chemical_symbols, ground_state_magnetic_moments
-from ciderpress.analyzers import ElectronAnalyzer
-from ciderpress.data import predict_exchange, predict_total_exchange_unrestricted
-from ciderpress.models.compute_mol_cov import compute_x_pred
-from joblib import load
 
-from orchard.workflow_utils import SAVE_ROOT, get_save_dir, load_mol_ids
+from orchard import workflow_utils
+from orchard.results_catalog import get_result_dirs
+from orchard.workflow_utils import load_mol_ids
+
+# analysis files read by error_table3 and error_table3u
+ANALYSIS_LEVEL = 3
 
 
 def load_models(model_file):
+    from joblib import load
+
     with open(model_file, "r") as f:
         d = yaml.load(f, Loader=yaml.Loader)
         names = []
@@ -59,6 +60,10 @@ def load_models(model_file):
 
 
 def error_table3(dirs, Analyzer, models, rows, basis, functional):
+    from ase.data import atomic_numbers, chemical_symbols, ground_state_magnetic_moments
+    from ciderpress.analyzers import ElectronAnalyzer
+    from ciderpress.data import predict_exchange, predict_total_exchange_unrestricted
+
     errlst = [[] for _ in models]
     ae_errlst = [[] for _ in models]
     fxlst_pred = [[] for _ in models]
@@ -73,15 +78,23 @@ def error_table3(dirs, Analyzer, models, rows, basis, functional):
     rtse = np.zeros(NMODEL)
     for d in dirs:
         print(d.split("/")[-1])
-        analyzer = Analyzer.load(os.path.join(d, "analysis_L3.hdf5"))
+        analyzer = Analyzer.load(
+            os.path.join(d, "analysis_L{}.hdf5".format(ANALYSIS_LEVEL))
+        )
         atoms = [atomic_numbers[a[0]] for a in analyzer.mol._atom]
         formula = Counter(atoms)
         element_analyzers = {}
         for Z in list(formula.keys()):
             symbol = chemical_symbols[Z]
             spin = int(ground_state_magnetic_moments[Z])
-            path = "{}/KS/{}/{}/atoms/{}-{}-{}/analysis_L3.hdf5".format(
-                SAVE_ROOT, functional, basis, Z, symbol, spin
+            path = "{}/KS/{}/{}/atoms/{}-{}-{}/analysis_L{}.hdf5".format(
+                workflow_utils.SAVE_ROOT,
+                functional,
+                basis,
+                Z,
+                symbol,
+                spin,
+                ANALYSIS_LEVEL,
             )
             element_analyzers[Z] = ElectronAnalyzer.load(path)
         weights = analyzer.grids.weights
@@ -151,6 +164,10 @@ def error_table3(dirs, Analyzer, models, rows, basis, functional):
 
 
 def error_table3u(dirs, Analyzer, models, rows, basis, functional):
+    from ase.data import atomic_numbers, chemical_symbols, ground_state_magnetic_moments
+    from ciderpress.analyzers import ElectronAnalyzer
+    from ciderpress.data import predict_total_exchange_unrestricted
+
     errlst = [[] for _ in models]
     ae_errlst = [[] for _ in models]
     fxlst_pred = [[] for _ in models]
@@ -165,15 +182,23 @@ def error_table3u(dirs, Analyzer, models, rows, basis, functional):
     rtse = np.zeros(NMODEL)
     for d in dirs:
         print(d.split("/")[-1])
-        analyzer = Analyzer.load(os.path.join(d, "analysis_L3.hdf5"))
+        analyzer = Analyzer.load(
+            os.path.join(d, "analysis_L{}.hdf5".format(ANALYSIS_LEVEL))
+        )
         atoms = [atomic_numbers[a[0]] for a in analyzer.mol._atom]
         formula = Counter(atoms)
         element_analyzers = {}
         for Z in list(formula.keys()):
             symbol = chemical_symbols[Z]
             spin = int(ground_state_magnetic_moments[Z])
-            path = "{}/KS/{}/{}/atoms/{}-{}-{}/analysis_L3.hdf5".format(
-                SAVE_ROOT, functional, basis, Z, symbol, spin
+            path = "{}/KS/{}/{}/atoms/{}-{}-{}/analysis_L{}.hdf5".format(
+                workflow_utils.SAVE_ROOT,
+                functional,
+                basis,
+                Z,
+                symbol,
+                spin,
+                ANALYSIS_LEVEL,
             )
             element_analyzers[Z] = ElectronAnalyzer.load(path)
         analyzer.grids.weights
@@ -231,6 +256,8 @@ def error_table3u(dirs, Analyzer, models, rows, basis, functional):
 
 
 def get_single_file_xpred(fname_base, models, _get_fname):
+    from ciderpress.models.compute_mol_cov import compute_x_pred
+
     tmp = "//SUFFIX_TEMPLATE//"
     default = "WIDE_WIDE"
     try:
@@ -256,7 +283,7 @@ def error_table_rxn(mol_ids, fname_base, models, formulas=None, extra_dirs=None)
     def _get_fname(fname):
         if args.extra_dirs is None:
             fname = os.path.join(
-                SAVE_ROOT,
+                workflow_utils.SAVE_ROOT,
                 "DATASETS",
                 args.functional,
                 args.basis,
@@ -264,7 +291,7 @@ def error_table_rxn(mol_ids, fname_base, models, formulas=None, extra_dirs=None)
                 fname,
             )
         else:
-            ddirs = [SAVE_ROOT] + args.extra_dirs
+            ddirs = [workflow_utils.SAVE_ROOT] + args.extra_dirs
             for dd in ddirs:
                 cdd = os.path.join(
                     dd,
@@ -313,19 +340,18 @@ def error_table_rxn(mol_ids, fname_base, models, formulas=None, extra_dirs=None)
     if formulas is None:
         return exx, np.array(diffs)
 
-    rxn_names = list(formulas.keys())
-    rxn_names.sort()
-    rxn_diffs = []
-    noise_factors = [formulas[n].get("noise_factor") or 1.0 for n in rxn_names]
-    for im, model in enumerate(models):
-        ndiffs = {m: x for m, x in zip(mol_ids, diffs[im])}
-        rxn_diff_list = []
-        for name in rxn_names:
-            rxn_diff = 0
-            for s, c in zip(formulas[name]["structs"], formulas[name]["counts"]):
-                rxn_diff += c * ndiffs[s]
-            rxn_diff_list.append(rxn_diff)
-        rxn_diffs.append(np.array(rxn_diff_list))
+    from orchard.reaction_sets import ReactionSet
+
+    if not isinstance(formulas, ReactionSet):
+        formulas = ReactionSet.from_formulas(formulas)
+    order = sorted(range(len(formulas)), key=lambda i: formulas.rxn_ids[i])
+    rxn_names = [formulas.rxn_ids[i] for i in order]
+    noise_factors = formulas.noise_factor[order]
+    noise_factors[np.isnan(noise_factors) | (noise_factors == 0)] = 1.0
+    # ndiffs-style lookup: the last occurrence of a mol_id wins
+    mol_index = {m: i for i, m in enumerate(mol_ids)}
+    stoich = formulas.get_stoich_matrix(mol_index, nsys=len(mol_ids))[order]
+    rxn_diffs = stoich.dot(np.asarray(diffs).T).T
     return (
         exx,
         diffs,
@@ -365,7 +391,7 @@ def error_table_corr(dirs, Analyzer, models, rows):
             spin = int(ground_state_magnetic_moments[Z])
             letter = "" if spin == 0 else "U"
             path = "{}/{}CCSD/aug-cc-pvtz/atoms/{}-{}-{}/data.hdf5".format(
-                SAVE_ROOT, letter, Z, symbol, spin
+                workflow_utils.SAVE_ROOT, letter, Z, symbol, spin
             )
             if letter == "":
                 element_analyzers[Z] = CCSDAnalyzer.load(path)
@@ -499,6 +525,9 @@ if __name__ == "__main__":
     )
     args = parser.parse_args()
 
+    import pandas as pd
+    from ciderpress.analyzers import ElectronAnalyzer
+
     if args.xsuffix is not None:
         args.xsuffix = "//SUFFIX_TEMPLATE//"
     if args.base_sysdir is None:
@@ -517,18 +546,31 @@ if __name__ == "__main__":
 
     Analyzer = ElectronAnalyzer
 
-    dirs = []
-    for mol_id in mol_ids:
-        dirs.append(get_save_dir(SAVE_ROOT, "KS", args.basis, mol_id, args.functional))
+    if args.xsuffix is None:
+        # the error tables read analysis files from the KS results
+        dir_dict, missing = get_result_dirs(
+            workflow_utils.SAVE_ROOT,
+            "KS",
+            args.functional,
+            args.basis,
+            mol_ids,
+            analysis_level=ANALYSIS_LEVEL,
+        )
+        if missing:
+            print(
+                "WARNING: No level {} analysis in catalog for".format(ANALYSIS_LEVEL),
+                missing,
+            )
+        dirs = [dir_dict[mol_id] for mol_id in mol_ids]
 
     rows, models = load_models(args.model_file)
 
     if args.xsuffix is not None:
         formulas = None
         if args.reaction_dataset is not None:
-            from orchard.workflow_utils import load_rxns
+            from orchard.reaction_sets import ReactionSet
 
-            formulas = load_rxns(args.reaction_dataset)
+            formulas = ReactionSet.load(args.reaction_dataset)
         res = error_table_rxn(mol_ids, fnames, models, formulas=formulas)
         df = pd.DataFrame()
         if formulas is None:
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# orchard: Utilities to training and analyzing machine learning-based density functionals
+# Copyright (C) 2024 The President and Fellows of Harvard College
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>
+#
+# Author: Kyle Bystrom <kylebystrom@gmail.com>
+#
+
+
+import time
+from argparse import ArgumentParser
+
+from orchard.geometry_pack import compile_geometry_pack, get_pack_path
+
+"""
+Script to pack all ACCDB geometries into a single indexed file, which
+read_accdb_structure then uses instead of parsing individual .xyz files.
+"""
+
+
+def main():
+    m_desc = "Pack ACCDB_ROOT/Geometries into one indexed binary file"
+
+    parser = ArgumentParser(description=m_desc)
+    parser.add_argument(
+        "--accdb-root",
+        type=str,
+        default=None,
+        help="ACCDB root directory, defaults to ACCDB_ROOT",
+    )
+    parser.add_argument(
+        "--out-file",
+        type=str,
+        default=None,
+        help="Output file, defaults to <accdb-root>/Geometries.pack.npz",
+    )
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    out_file = compile_geometry_pack(
+        accdb_root=args.accdb_root,
+        out_file=args.out_file or get_pack_path(args.accdb_root),
+    )
+    stop = time.monotonic()
+    print("Wrote {} ({:.1f} s)".format(out_file, stop - start))
+
+
+if __name__ == "__main__":
+    main()
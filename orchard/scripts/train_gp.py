@@ -23,11 +23,8 @@ from argparse import ArgumentParser
 
 import numpy as np
 import yaml
-from ciderpress.data import filter_descriptors, load_descriptors
-from ciderpress.models.gp import *
-from joblib import dump
 
-from orchard.workflow_utils import SAVE_ROOT
+from orchard import workflow_utils
 
 
 def parse_settings(args):
@@ -35,7 +32,12 @@ def parse_settings(args):
     if args.suffix is not None:
         fname = fname + "_" + args.suffix
     fname = os.path.join(
-        SAVE_ROOT, "DATASETS", args.functional, args.basis, args.version, fname
+        workflow_utils.SAVE_ROOT,
+        "DATASETS",
+        args.functional,
+        args.basis,
+        args.version,
+        fname,
     )
     print(fname)
     with open(os.path.join(fname, "settings.yaml"), "r") as f:
@@ -56,9 +58,16 @@ def parse_dataset(args, i, val=False):
     if args.suffix is not None:
         fname = fname + "_" + args.suffix
     fname = os.path.join(
-        SAVE_ROOT, "DATASETS", args.functional, args.basis, args.version, fname
+        workflow_utils.SAVE_ROOT,
+        "DATASETS",
+        args.functional,
+        args.basis,
+        args.version,
+        fname,
     )
     print(fname)
+    from ciderpress.data import filter_descriptors, load_descriptors
+
     X, y, rho_data = load_descriptors(fname)
     if val:
         # offset in case repeat datasets are used
@@ -189,6 +198,9 @@ def main():
     )
     args = parser.parse_args()
 
+    from ciderpress.models.gp import EXGPR, FeatureList
+    from joblib import dump
+
     parse_settings(args)
 
     np.random.seed(args.seed)
@@ -27,15 +27,9 @@ from argparse import ArgumentParser
 
 import numpy as np
 import yaml
-from ciderpress.density import LDA_FACTOR
-from ciderpress.models.baselines import BASELINE_CODES
-from ciderpress.models.dft_kernel import DFTKernel
-from ciderpress.models.train import MOLGP, DescParams, strk_to_tuplek
-from ciderpress.xcutil.transform_data import FeatureList
-from joblib import dump, load
-from pyscf.lib import chkfile
 
-from orchard.workflow_utils import SAVE_ROOT, load_rxns
+from orchard import workflow_utils
+from orchard.workflow_utils import load_rxns
 
 
 def warn_with_traceback(message, category, filename, lineno, file=None, line=None):
@@ -55,9 +49,11 @@ def find_dataset(fname, args):
             "DATASETS", args.functional, args.basis, args.version, args.suffix, fname
         )
         if args.extra_dirs is None:
-            fname = os.path.join(SAVE_ROOT, reldir)
+            fname = os.path.join(workflow_utils.SAVE_ROOT, reldir)
         else:
-            ddirs = [os.path.join(SAVE_ROOT, "DATASETS")] + args.extra_dirs
+            ddirs = [
+                os.path.join(workflow_utils.SAVE_ROOT, "DATASETS")
+            ] + args.extra_dirs
             for dd in ddirs:
                 cdd = os.path.join(dd, reldir)
                 print(cdd)
@@ -98,7 +94,7 @@ def parse_settings(args):
     fname = args.datasets_list[0]
     if args.save_dir is None:
         dname = os.path.join(
-            SAVE_ROOT,
+            workflow_utils.SAVE_ROOT,
             "DATASETS",
             args.functional,
             args.basis,
@@ -117,6 +113,10 @@ def parse_settings(args):
 
 
 def parse_dataset_for_ctrl(args, i):
+    from ciderpress.density import LDA_FACTOR
+    from ciderpress.models.train import strk_to_tuplek
+    from pyscf.lib import chkfile
+
     fname = args.datasets_list[2 * i]
     n = int(args.datasets_list[2 * i + 1])
     dirname = find_dataset(fname, args)
@@ -342,6 +342,13 @@ def main():
         help="override default save directory for features",
     )
     args = parser.parse_args()
+
+    from ciderpress.models.baselines import BASELINE_CODES
+    from ciderpress.models.dft_kernel import DFTKernel
+    from ciderpress.models.train import MOLGP, DescParams
+    from ciderpress.xcutil.transform_data import FeatureList
+    from joblib import dump, load
+
     parse_settings(args)
     if args.debug_model is not None:
         args.debug_model = load(args.debug_model)
@@ -27,12 +27,6 @@ from argparse import ArgumentParser
 
 import numpy as np
 import yaml
-from ciderpress.dft.settings import LDA_FACTOR, FeatureSettings
-from ciderpress.dft.transform_data import FeatureList
-from ciderpress.models.baselines import BASELINE_CODES
-from ciderpress.models.dft_kernel import DFTKernel
-from ciderpress.models.train import MOLGP, strk_to_tuplek
-from joblib import dump, load
 
 from orchard.workflow_utils import load_rxns
 
@@ -111,6 +105,8 @@ def get_base_path(dset_name, data_settings):
 
 
 def parse_settings(set0, data_settings, args):
+    from ciderpress.dft.settings import FeatureSettings
+
     base_dname = get_base_path(set0, data_settings)
     settings_dict = {}
     name_dict = _get_name_dict(args)
@@ -176,6 +172,9 @@ def get_plan_module(plan_file):
 
 
 def parse_dataset_for_ctrl(fname, n, args, data_settings, feat_settings):
+    from ciderpress.dft.settings import LDA_FACTOR
+    from ciderpress.models.train import MOLGP, strk_to_tuplek
+
     print(fname, n, data_settings)
     dirnames = find_datasets(fname, args, data_settings)
     with open(os.path.join(dirnames["SL"], "{}_settings.yaml".format(fname)), "r") as f:
@@ -380,6 +379,13 @@ def main():
         "weights on datasets) while ignoring other parameters.",
     )
     args = parser.parse_args()
+
+    from ciderpress.dft.transform_data import FeatureList
+    from ciderpress.models.baselines import BASELINE_CODES
+    from ciderpress.models.dft_kernel import DFTKernel
+    from ciderpress.models.train import MOLGP
+    from joblib import dump, load
+
     if args.debug_model is not None:
         args.debug_model = load(args.debug_model)
     if args.debug_spline is not None:
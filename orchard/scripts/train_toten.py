@@ -23,16 +23,8 @@ from argparse import ArgumentParser
 
 import numpy as np
 import yaml
-from ciderpress.models.compute_mol_cov import (
-    compute_heg_covs,
-    compute_new_alpha,
-    compute_tr_covs,
-    compute_tr_covs_ex,
-    reduce_model_size_,
-)
-from joblib import dump, load
 
-from orchard.workflow_utils import SAVE_ROOT, load_rxns
+from orchard import workflow_utils
 
 
 def parse_settings(args):
@@ -40,7 +32,12 @@ def parse_settings(args):
     if args.suffix is not None:
         fname = fname + "_" + args.suffix
     fname = os.path.join(
-        SAVE_ROOT, "DATASETS", args.functional, args.basis, args.version, fname
+        workflow_utils.SAVE_ROOT,
+        "DATASETS",
+        args.functional,
+        args.basis,
+        args.version,
+        fname,
     )
     print(fname)
     with open(os.path.join(fname, "settings.yaml"), "r") as f:
@@ -172,6 +169,17 @@ def main():
     )
     args = parser.parse_args()
 
+    from ciderpress.models.compute_mol_cov import (
+        compute_heg_covs,
+        compute_new_alpha,
+        compute_tr_covs,
+        compute_tr_covs_ex,
+        reduce_model_size_,
+    )
+    from joblib import dump, load
+
+    from orchard.reaction_sets import ReactionSet
+
     # parse_settings(args)
 
     np.random.seed(args.seed)
@@ -203,11 +211,7 @@ def main():
 
     vwrtt_list, exx_list = [], []
 
-    rxn_list = []
-    for rxn_id in args.reactions_list:
-        rxn_dict = load_rxns(rxn_id)
-        for v in list(rxn_dict.values()):
-            rxn_list.append(v)
+    rxn_sets = [ReactionSet.load(rxn_id) for rxn_id in args.reactions_list]
 
     import yaml
 
@@ -218,10 +222,15 @@ def main():
             fname = fname + "_" + args.suffix
         if args.extra_dirs is None:
             fname = os.path.join(
-                SAVE_ROOT, "DATASETS", args.functional, args.basis, args.version, fname
+                workflow_utils.SAVE_ROOT,
+                "DATASETS",
+                args.functional,
+                args.basis,
+                args.version,
+                fname,
             )
         else:
-            ddirs = [SAVE_ROOT] + args.extra_dirs
+            ddirs = [workflow_utils.SAVE_ROOT] + args.extra_dirs
             for dd in ddirs:
                 cdd = os.path.join(
                     dd, "DATASETS", args.functional, args.basis, args.version, fname
@@ -244,9 +253,9 @@ def main():
         vwrtt_list.append(vw_tmp)
         exx_list.append(exx_tmp)
         system_ids.append("UNIFORM_ELECTRON_GAS")
-        rxn_list.append(
-            {"structs": ["UNIFORM_ELECTRON_GAS"], "counts": [1], "noise": 0.00}
-        )
+        heg_rxn = {"structs": ["UNIFORM_ELECTRON_GAS"], "counts": [1], "noise": 0.00}
+        rxn_sets.append(ReactionSet.from_formulas({"UNIFORM_ELECTRON_GAS": heg_rxn}))
+    rxn_set = ReactionSet.concatenate(rxn_sets)
     vwrtt_mat = np.hstack(vwrtt_list)
     exx = np.concatenate(exx_list)
     idmap = {}
@@ -256,35 +265,14 @@ def main():
     print("IDMAP")
     for k, v in idmap.items():
         print("k v", k, v)
-    vwrtt_rxns = []
-    exx_rxns = []
-    noises = []
-    for rxn in rxn_list:
-        vw = 0
-        ex = 0
-        na = 0
-        for sysid, count in zip(rxn["structs"], rxn["counts"]):
-            try:
-                ind = idmap[sysid]
-            except KeyError:
-                raise RuntimeError(
-                    "Datasets must contain all system ids in reaction sets"
-                )
-            na += abs(count)
-            vw += count * vwrtt_mat[:, ind]
-            ex += count * exx[ind]
-        vwrtt_rxns.append(vw)
-        exx_rxns.append(ex)
-        if rxn.get("noise") is not None:
-            print("Fixed noise", rxn.get("noise"))
-            noises.append(rxn["noise"])
-        elif rxn.get("noise_factor") is not None:
-            noises.append(rxn["noise_factor"] * args.mol_sigma)
-        else:
-            noises.append(args.mol_sigma)
-    vwrtt_rxns = np.array(vwrtt_rxns, dtype=np.float64).T
-    exx_rxns = np.array(exx_rxns, dtype=np.float64)
-    noise_list = np.array(noises, dtype=np.float64)
+    try:
+        stoich = rxn_set.get_stoich_matrix(idmap, nsys=len(system_ids))
+    except KeyError:
+        raise RuntimeError("Datasets must contain all system ids in reaction sets")
+    vwrtt_rxns = np.asarray(stoich @ vwrtt_mat.T, dtype=np.float64).T
+    exx_rxns = np.asarray(stoich @ exx, dtype=np.float64)
+    noise_list = rxn_set.get_noise(args.mol_sigma)
+    print("Fixed noise count", np.count_nonzero(~np.isnan(rxn_set.noise)))
 
     vwrtt_mat = vwrtt_rxns
     exx = exx_rxns
@@ -22,33 +22,17 @@ import copy
 import os
 from argparse import ArgumentParser
 
-import dftd4.pyscf as pyd4
 import numpy
 import numpy as np
 import yaml
-from ciderpress.analyzers import ElectronAnalyzer as Analyzer
-from ciderpress.models.jax_pw6b95 import (
-    PW6B95_DEFAULT_PARAMS,
-    PW8B95_DEFAULT_PARAMS,
-    PW11B95_DEFAULT_PARAMS,
-    PW12B95_DEFAULT_PARAMS,
-    PW13B95_DEFAULT_PARAMS,
-    PW14B95_DEFAULT_PARAMS,
-    build_xcfunc_and_param_grad,
-    pw6b95_train,
-    pw8b95,
-    pw11b95,
-    pw12b95,
-    pw13b95,
-    pw14b95,
-    rpw12b95,
-)
-from pyscf import scf
-
-from orchard.workflow_utils import SAVE_ROOT, load_rxns
+
+from orchard import workflow_utils
+from orchard.results_catalog import get_result_dirs
 
 
 def get_base_energy(analyzer, d4func=None):
+    from pyscf import scf
+
     restricted = True if analyzer.dm.ndim == 2 else False
     analyzer.mol.build()
     print(analyzer.mol.charge, analyzer.mol.spin)
@@ -70,16 +54,25 @@ def get_base_energy(analyzer, d4func=None):
     else:
         e_base += 0.5 * numpy.einsum("ij,xji->", calc.get_j(dm=dm).sum(axis=0), dm).real
     if d4func is not None:
-        e_base += pyd4.DFTD4Dispersion(
-            calc.mol, xc=d4func.upper().replace(" ", "")
-        ).kernel()[0]
+        import dftd4.pyscf as pyd4
+
+        from orchard.dispersion_cache import use_dispersion_cache
+
+        disp = pyd4.DFTD4Dispersion(calc.mol, xc=d4func.upper().replace(" ", ""))
+        e_base += use_dispersion_cache(disp, "d4").kernel()[0]
     return e_base
 
 
-def load_molecular_data(basis, functional, mol_id, d4_functional=None):
+def load_molecular_data(basis, functional, mol_id, d4_functional=None, save_dir=None):
+    from ciderpress.analyzers import ElectronAnalyzer as Analyzer
+
     print("MOL LOAD", mol_id)
-    # d = os.path.join(SAVE_ROOT, 'KS', functional, basis, mol_id, 'analysis_L1.hdf5')
-    d = os.path.join(SAVE_ROOT, "KS", functional, basis, mol_id, "analysis_L3.hdf5")
+    if save_dir is None:
+        save_dir = os.path.join(
+            workflow_utils.SAVE_ROOT, "KS", functional, basis, mol_id
+        )
+    # d = os.path.join(save_dir, 'analysis_L1.hdf5')
+    d = os.path.join(save_dir, "analysis_L3.hdf5")
     analyzer = Analyzer.load(d)
     analyzer.set("restricted", analyzer.dm.ndim == 2)
     analyzer.set("e_base", get_base_energy(analyzer, d4_functional))
@@ -169,52 +162,40 @@ def compute_mol_preds_and_derivs(vpg_func, params, inputs_dict):
     return predictions
 
 
-def compute_rxn_preds_and_derivs(formulas, mol_predictions, pnames):
+def compute_rxn_preds_and_derivs(rxn_set, mol_predictions, pnames):
     ha_per_kcal = 0.001593601
-    rxn_predictions = {}
-    for rxn_id, rxn in formulas.items():
-        # print('RXN', rxn_id)
-        rp = {
-            "e_pred": 0,
-            "de_pred": {param: 0 for param in pnames},
-            "e_ref": ha_per_kcal * formulas[rxn_id]["energy"],
-            "weight": 1.0 / (formulas[rxn_id].get("noise_factor") or 1.0) ** 2,
-        }
-        for struct, count in zip(rxn["structs"], rxn["counts"]):
-            mp = mol_predictions[struct]
-            rp["e_pred"] += count * mp["energy"]
-            for param in pnames:
-                rp["de_pred"][param] += count * mp["grad"][param]
-        rxn_predictions[rxn_id] = rp
-    return rxn_predictions
+    mol_preds = [mol_predictions[sysid] for sysid in rxn_set.system_ids]
+    energies = np.array([mp["energy"] for mp in mol_preds], dtype=np.float64)
+    grads = np.array(
+        [[mp["grad"][param] for param in pnames] for mp in mol_preds],
+        dtype=np.float64,
+    ).reshape(len(mol_preds), len(pnames))
+    de_pred = rxn_set.get_reaction_values(grads)
+    return {
+        "e_pred": rxn_set.get_reaction_values(energies),
+        "de_pred": {param: de_pred[:, i] for i, param in enumerate(pnames)},
+        "e_ref": ha_per_kcal * rxn_set.energies,
+        "weight": rxn_set.get_weights(),
+    }
 
 
 def compute_loss_and_grad(rxn_predictions, pnames):
-    loss = 0
-    dloss = {param: 0 for param in pnames}
-    for rxn_id, rp in rxn_predictions.items():
-        loss += 0.5 * rp["weight"] * (rp["e_pred"] - rp["e_ref"]) ** 2
-        dloss_tmp = rp["weight"] * (rp["e_pred"] - rp["e_ref"])
-        for param in pnames:
-            dloss[param] += dloss_tmp * rp["de_pred"][param]
+    rp = rxn_predictions
+    wdiff = rp["weight"] * (rp["e_pred"] - rp["e_ref"])
+    loss = 0.5 * np.dot(wdiff, rp["e_pred"] - rp["e_ref"])
+    dloss = {param: np.dot(wdiff, rp["de_pred"][param]) for param in pnames}
     return loss, dloss
 
 
 def compute_loss_linear(rxn_predictions, linp):
+    rp = rxn_predictions
     nlinp = len(linp)
-    b = np.zeros(nlinp)
-    cov = np.zeros((nlinp, nlinp))
-    cov += 1e-5 * np.identity(nlinp)
-    loss = 0
-    for rxn_id, rp in rxn_predictions.items():
-        diff = rp["e_ref"] - rp["e_pred"]
-        loss += 0.5 * rp["weight"] * diff**2
-        for i in range(nlinp):
-            b[i] += rp["weight"] * rp["de_pred"][linp[i]] * diff
-            for j in range(nlinp):
-                cov[i, j] += (
-                    rp["weight"] * rp["de_pred"][linp[i]] * rp["de_pred"][linp[j]]
-                )
+    diff = rp["e_ref"] - rp["e_pred"]
+    loss = 0.5 * np.dot(rp["weight"] * diff, diff)
+    de_pred = np.stack([rp["de_pred"][p] for p in linp], axis=1)
+    wde_pred = rp["weight"][:, None] * de_pred
+    b = wde_pred.T.dot(diff)
+    cov = 1e-5 * np.identity(nlinp) + wde_pred.T.dot(de_pred)
     beta = np.linalg.solve(cov, b)
     beta = {linp[i]: beta[i] for i in range(nlinp)}
     return loss, beta
@@ -419,12 +400,32 @@ def main():
     parser.add_argument("--init-param-file", type=str, default=None)
     args = parser.parse_args()
 
+    from ciderpress.models.jax_pw6b95 import (
+        PW6B95_DEFAULT_PARAMS,
+        PW8B95_DEFAULT_PARAMS,
+        PW11B95_DEFAULT_PARAMS,
+        PW12B95_DEFAULT_PARAMS,
+        PW13B95_DEFAULT_PARAMS,
+        PW14B95_DEFAULT_PARAMS,
+        build_xcfunc_and_param_grad,
+        pw6b95_train,
+        pw8b95,
+        pw11b95,
+        pw12b95,
+        pw13b95,
+        pw14b95,
+        rpw12b95,
+    )
+
+    from orchard.reaction_sets import ReactionSet
+
     print("TRAIN INPUTS")
     print(args)
 
-    formulas = {}
-    for rxn_set in args.reaction_datasets:
-        formulas.update(load_rxns(rxn_set))
+    formulas = ReactionSet.concatenate(
+        [ReactionSet.load(rxn_set) for rxn_set in args.reaction_datasets],
+        drop_duplicates=True,
+    )
     """
     rnames = list(formulas.keys())
     np.random.seed(42)
@@ -435,17 +436,26 @@ def main():
     formulas = new_formulas
     """
 
-    mol_ids = set()
-    for _, rxn in formulas.items():
-        for struct in rxn["structs"]:
-            mol_ids.add(struct)
-    mol_ids = list(mol_ids)
-    mol_ids.sort()
+    mol_ids = sorted(formulas.system_ids)
 
+    save_dirs, missing = get_result_dirs(
+        workflow_utils.SAVE_ROOT,
+        "KS",
+        args.functional,
+        args.basis,
+        mol_ids,
+        analysis_level=3,
+    )
+    if missing:
+        print("WARNING: No level 3 analysis in catalog for", missing)
     mol_data = {}
     for mol_id in mol_ids:
         mol_data[mol_id] = load_molecular_data(
-            args.basis, args.functional, mol_id, d4_functional=args.d4_functional
+            args.basis,
+            args.functional,
+            mol_id,
+            d4_functional=args.d4_functional,
+            save_dir=save_dirs[mol_id],
         )
 
     model_type = args.xc_model_name.upper().strip()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# orchard: Utilities to training and analyzing machine learning-based density functionals
+# Copyright (C) 2024 The President and Fellows of Harvard College
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>
+#
+# Author: Kyle Bystrom <kylebystrom@gmail.com>
+#
+
+
+"""
+Initial guess resolver for SCF calculations. Looks for converged calcs
+of the same system in the save root and builds a density matrix guess
+from the closest one:
+
+1. The same basis with another functional (the density is used as is).
+2. Another, smaller basis (the density is projected onto the new basis).
+
+Among several candidates, the largest basis is preferred, then the
+same functional, then the most recent converged run.
+
+Candidates are found through the results catalog (see
+orchard.results_catalog) if it has entries for the system, or by
+scanning the KS directory otherwise (e.g. for results stored before
+the catalog was created). A candidate is only used if its geometry, charge and spin
+match the new calc.
+"""
+
+import glob
+import os
+
+import numpy as np
+from pyscf import lib, scf
+
+from orchard.pyscf_caller import convert_dm_spin
+from orchard.results_catalog import get_catalog, get_row_save_dir
+from orchard.scf_handles import load_rdm1
+from orchard.workflow_utils import get_functional_db_name
+
+GEOM_TOL = 1e-6
+
+
+def _find_candidates(save_root_dir, system_id):
+    """
+    Returns:
+        list of (functional, basis, save_dir, updated) tuples of the
+        converged calcs of system_id, where updated is the time the
+        result was stored
+    """
+    catalog = get_catalog(save_root_dir, create=False)
+    rows = []
+    if catalog is not None:
+        rows = catalog.get_table(calc_type="KS", system_ids=[system_id])
+    if len(rows) > 0:
+        return [
+            (
+                row["functional"],
+                row["basis"],
+                get_row_save_dir(save_root_dir, row),
+                row["updated"] or 0,
+            )
+            for row in rows
+            if row["converged"] and "data.hdf5" in row["files"]
+        ]
+    candidates = []
+    pattern = os.path.join(save_root_dir, "KS", "*", "*", system_id, "data.hdf5")
+    for fname in glob.glob(pattern):
+        save_dir = os.path.dirname(fname)
+        if not _load_source_info(save_dir).get("converged"):
+            continue
+        rel = os.path.relpath(save_dir, os.path.join(save_root_dir, "KS"))
+        functional, basis = rel.split(os.sep)[:2]
+        candidates.append((functional, basis, save_dir, os.path.getmtime(fname)))
+    return candidates
+
+
+def _same_system(mol1, mol2):
+    if mol1.natm != mol2.natm or mol1.spin != mol2.spin:
+        return False
+    if mol1.charge != mol2.charge:
+        return False
+    if not np.array_equal(mol1.atom_charges(), mol2.atom_charges()):
+        return False
+    return np.allclose(mol1.atom_coords(), mol2.atom_coords(), atol=GEOM_TOL)
+
+
+def _load_source_info(save_dir):
+    import yaml
+
+    fname = os.path.join(save_dir, "run_info.yaml")
+    if not os.path.exists(fname):
+        return {}
+    with open(fname, "r") as f:
+        return yaml.load(f, Loader=getattr(yaml, "CLoader", yaml.Loader)) or {}
+
+
+def find_initial_guess(calc, system_id, save_root_dir, method_name=None):
+    """
+    Find a density matrix guess for calc from stored calcs of
+    system_id in save_root_dir.
+
+    Args:
+        calc: PySCF calc (mol must be built)
+        system_id (str): System id of the calc
+        save_root_dir (str): Save root to search
+        method_name (str): Functional of calc, which is skipped
+            (it would just be the same calculation).
+
+    Returns:
+        dm0 (or None if no guess was found), info dict for run_info.yaml
+    """
+    if save_root_dir is None:
+        return None, {"method": "default"}
+    mol = calc.mol
+    unrestricted = isinstance(calc, scf.uhf.UHF)
+    own = None if method_name is None else get_functional_db_name(method_name)
+    same_basis, other_basis = [], []
+    for functional, basis, save_dir, updated in _find_candidates(
+        save_root_dir, system_id
+    ):
+        if functional == own and basis == mol.basis:
+            continue
+        if basis == mol.basis:
+            same_basis.append((functional, basis, save_dir, updated))
+        else:
+            other_basis.append((functional, basis, save_dir, updated))
+
+    def priority(candidate):
+        functional, basis, save_dir, updated = candidate
+        return (functional == own, updated)
+
+    same_basis.sort(key=priority, reverse=True)
+    for functional, basis, save_dir, updated in same_basis:
+        try:
+            src_mol = lib.chkfile.load_mol(os.path.join(save_dir, "mol.chk"))
+        except (OSError, KeyError):
+            continue
+        if not _same_system(src_mol, mol) or src_mol.nao_nr() != mol.nao_nr():
+            continue
+        dm = load_rdm1(os.path.join(save_dir, "data.hdf5"), "calc")
+        return convert_dm_spin(dm, unrestricted), {
+            "method": "same_basis",
+            "source_dir": save_dir,
+            "source_functional": functional,
+            "source_basis": basis,
+        }
+
+    # project from the largest stored basis that is smaller than mol.basis
+    projected = []
+    nao = mol.nao_nr()
+    for candidate in other_basis:
+        save_dir = candidate[2]
+        try:
+            src_mol = lib.chkfile.load_mol(os.path.join(save_dir, "mol.chk"))
+        except (OSError, KeyError):
+            continue
+        if _same_system(src_mol, mol) and src_mol.nao_nr() < nao:
+            key = (src_mol.nao_nr(),) + priority(candidate)
+            projected.append((key, candidate, src_mol))
+    if len(projected) > 0:
+        _, candidate, src_mol = max(projected, key=lambda x: x[0])
+        functional, basis, save_dir, _ = candidate
+        dm = load_rdm1(os.path.join(save_dir, "data.hdf5"), "calc")
+        dm = scf.addons.project_dm_nr2nr(src_mol, dm, mol)
+        return convert_dm_spin(dm, unrestricted), {
+            "method": "projected",
+            "source_dir": save_dir,
+            "source_functional": functional,
+            "source_basis": basis,
+        }
+    return None, {"method": "default"}
+
+
+def finalize_init_guess_info(info, calc):
+    """
+    Add the SCF iteration count of calc to the init guess info. For
+    warm starts, also add the cold-start iteration count of the source
+    calc (if it was recorded) and the difference as an estimate of the
+    iterations saved. This is only an estimate, since the source may
+    use another functional or basis than calc.
+    """
+    info = dict(info)
+    info["cycles"] = getattr(calc, "cycles", None)
+    if info.get("source_dir") is not None and info["cycles"] is not None:
+        src_info = _load_source_info(info["source_dir"])
+        src_guess = src_info.get("init_guess")
+        if src_guess is not None:
+            # a warm-started source only has an estimate itself
+            src_cold_cycles = src_guess.get(
+                "cold_cycles", src_guess.get("source_cold_cycles")
+            )
+        else:
+            src_cold_cycles = src_info.get("scf_cycles")
+        if src_cold_cycles is not None:
+            info["source_cold_cycles"] = src_cold_cycles
+            info["cycles_saved_estimate"] = src_cold_cycles - info["cycles"]
+    elif info.get("method") == "checkpoint" and info["cycles"] is not None:
+        # cycles run before the job was interrupted count as cold cycles
+        info["cold_cycles"] = info["cycle"] + info["cycles"]
+    else:
+        info["cold_cycles"] = info["cycles"]
+    return info
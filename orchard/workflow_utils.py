@@ -21,22 +21,42 @@
 import os
 
 import yaml
-from ase import Atoms
 
 config_file = os.path.expanduser("~/.orchard_config.yaml")
-if os.path.exists(config_file):
-    with open(config_file, "r") as f:
-        settings = yaml.load(f, Loader=yaml.Loader)
-    MLDFTDB_ROOT = settings.get("MLDFTDB_ROOT")
-    ACCDB_ROOT = settings.get("ACCDB_ROOT")
-    VCML_ROOT = settings.get("VCML_ROOT")
-    RXN_ROOT = settings.get("RXN_ROOT")
-else:
-    MLDFTDB_ROOT = None
-    ACCDB_ROOT = None
-    VCML_ROOT = None
-    RXN_ROOT = None
-SAVE_ROOT = MLDFTDB_ROOT
+CONFIG_KEYS = [
+    "MLDFTDB_ROOT",
+    "ACCDB_ROOT",
+    "VCML_ROOT",
+    "RXN_ROOT",
+    "CATALOG_PATH",
+]
+_config = None
+
+
+def get_config():
+    """
+    Return the contents of ~/.orchard_config.yaml as a dict. The file
+    is only read the first time a setting is needed, so importing
+    orchard modules does not touch the filesystem.
+    """
+    global _config
+    if _config is None:
+        if os.path.exists(config_file):
+            with open(config_file, "r") as f:
+                _config = yaml.load(f, Loader=yaml.Loader) or {}
+        else:
+            _config = {}
+    return _config
+
+
+def __getattr__(name):
+    # Config values are exposed as module attributes (e.g. SAVE_ROOT)
+    # but resolved lazily on first access.
+    if name == "SAVE_ROOT":
+        return get_config().get("MLDFTDB_ROOT")
+    if name in CONFIG_KEYS:
+        return get_config().get(name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 
 def get_functional_db_name(functional):
@@ -72,14 +92,18 @@ def _append_prefix(prefix, sysid):
     return os.path.join(prefix, sysid)
 
 
-def load_rxns(rxn_list_id, rxndir=None):
+def get_rxn_file(rxn_list_id, rxndir=None):
     if rxndir is None:
-        rxndir = RXN_ROOT
+        rxndir = get_config().get("RXN_ROOT")
     if rxndir is None:
         raise ValueError("Must provide rxndir or set RXN_ROOT in config")
-    rxnfile = os.path.join(rxndir, rxn_list_id) + ".yaml"
+    return os.path.join(rxndir, rxn_list_id) + ".yaml"
+
+
+def load_rxns(rxn_list_id, rxndir=None):
+    rxnfile = get_rxn_file(rxn_list_id, rxndir=rxndir)
     with open(rxnfile, "r") as f:
-        contents = yaml.load(f, Loader=yaml.Loader)
+        contents = yaml.load(f, Loader=getattr(yaml, "CLoader", yaml.Loader))
     if contents.get("prefix") is not None:
         prefix = contents.pop("prefix")
         for k, v in contents.items():
@@ -90,25 +114,62 @@ def load_rxns(rxn_list_id, rxndir=None):
 
 
 def read_accdb_structure(struct_id):
-    fname = "{}.xyz".format(os.path.join(ACCDB_ROOT, "Geometries", struct_id))
-    with open(fname, "r") as f:
-        # print(fname)
-        lines = f.readlines()
-        natom = int(lines[0])
-        charge_and_spin = lines[1].split()
-        charge = int(charge_and_spin[0].strip().strip(","))
-        spin = int(charge_and_spin[1].strip().strip(",")) - 1
-        symbols = []
-        coords = []
-        for i in range(natom):
-            line = lines[2 + i]
-            symbol, x, y, z = line.split()
-            if symbol.isdigit():
-                symbol = int(symbol)
-            else:
-                symbol = symbol[0].upper() + symbol[1:].lower()
-            symbols.append(symbol)
-            coords.append([x, y, z])
-        struct = Atoms(symbols, positions=coords)
-        # print(charge, spin, struct)
-    return struct, os.path.join("ACCDB", struct_id), spin, charge
+    """
+    Read an ACCDB structure, using the compiled geometry pack
+    (see orchard.geometry_pack) if it exists and contains struct_id.
+
+    Returns:
+        Atoms, system_id, spin, charge
+    """
+    from ase import Atoms
+
+    from orchard.geometry_pack import get_geometry_pack, parse_accdb_xyz
+
+    accdb_root = get_config().get("ACCDB_ROOT")
+    pack = get_geometry_pack(accdb_root)
+    system_id = os.path.join("ACCDB", struct_id)
+    if pack is not None and struct_id in pack:
+        struct, charge, spin = pack.get_atoms(struct_id)
+        return struct, system_id, spin, charge
+    fname = "{}.xyz".format(os.path.join(accdb_root, "Geometries", struct_id))
+    symbols, coords, charge, spin = parse_accdb_xyz(fname)
+    struct = Atoms(symbols, positions=coords)
+    return struct, system_id, spin, charge
+
+
+def read_accdb_structures(struct_ids):
+    """
+    Batch version of read_accdb_structure. Returns a list of
+    (Atoms, system_id, spin, charge) tuples.
+    """
+    return [read_accdb_structure(struct_id) for struct_id in struct_ids]
+
+
+def group_geometry_families(systems, decimals=6):
+    """
+    Group systems with identical geometries, e.g. a molecule and its
+    ions in the ACCDB ionization potential sets.
+
+    Args:
+        systems: list of (Atoms, system_id, spin, charge) tuples, as
+            returned by read_accdb_structures
+        decimals: positions (Angstrom) are compared after rounding
+
+    Returns:
+        list of (Atoms, members) tuples, where members is a list of
+        dicts with keys system_id, charge and spin
+    """
+    from orchard.disk_cache import hash_key
+
+    families = {}
+    for struct, system_id, spin, charge in systems:
+        key = hash_key(
+            [struct.get_atomic_numbers(), struct.get_positions()],
+            decimals=decimals,
+        )
+        if key not in families:
+            families[key] = (struct, [])
+        families[key][1].append(
+            {"system_id": system_id, "charge": int(charge), "spin": int(spin)}
+        )
+    return list(families.values())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# orchard: Utilities to training and analyzing machine learning-based density functionals
+# Copyright (C) 2024 The President and Fellows of Harvard College
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>
+#
+# Author: Kyle Bystrom <kylebystrom@gmail.com>
+#
+
+
+"""
+Guard the lazy imports: importing orchard and running the scripts with
+--help must stay fast, must not load the heavy dependencies and must
+not read ~/.orchard_config.yaml. Each check runs in a fresh interpreter
+so that nothing is already imported.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from orchard.scripts.__main__ import COMMANDS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# generous, so that slow machines pass; the lazy imports take ~0.05 s
+# for the core modules and ~0.15 s for a script's --help
+IMPORT_TIME_BUDGET = 1.0
+HEAVY_MODULES = [
+    "ase",
+    "ciderpress",
+    "dftd4",
+    "fireworks",
+    "gpaw",
+    "h5py",
+    "jax",
+    "joblib",
+    "pandas",
+    "pyscf",
+    "scipy",
+    "sklearn",
+]
+CORE_MODULES = [
+    "orchard",
+    "orchard.workflow_utils",
+    "orchard.results_catalog",
+    "orchard.scripts.__main__",
+]
+
+_CHECK_TEMPLATE = """
+import contextlib, io, json, runpy, sys, time
+t0 = time.perf_counter()
+{body}
+wall = time.perf_counter() - t0
+heavy = [m for m in {heavy!r} if m in sys.modules]
+wu = sys.modules.get("orchard.workflow_utils")
+config_read = wu is not None and wu._config is not None
+print(json.dumps({{"wall": wall, "heavy": heavy, "config_read": config_read}}))
+"""
+
+
+def _run_check(body, tmp_path):
+    code = _CHECK_TEMPLATE.format(body=body, heavy=HEAVY_MODULES)
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([ROOT, env.get("PYTHONPATH", "")])
+    # a config that must only be read when a setting is used
+    env["HOME"] = str(tmp_path)
+    with open(os.path.join(str(tmp_path), ".orchard_config.yaml"), "w") as f:
+        f.write("MLDFTDB_ROOT: {}\n".format(os.path.join(str(tmp_path), "db")))
+    res = subprocess.run(
+        [sys.executable, "-c", code],
+        env=env,
+        cwd=str(tmp_path),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(res.stdout.strip().splitlines()[-1])
+
+
+def test_core_import_time(tmp_path):
+    body = "\n".join("import {}".format(name) for name in CORE_MODULES)
+    res = _run_check(body, tmp_path)
+    assert res["heavy"] == []
+    assert not res["config_read"]
+    assert res["wall"] < IMPORT_TIME_BUDGET
+
+
+@pytest.mark.parametrize("command", sorted(COMMANDS))
+def test_script_import_reads_no_config(command, tmp_path):
+    res = _run_check("import orchard.scripts.{}".format(command), tmp_path)
+    assert not res["config_read"]
+
+
+@pytest.mark.parametrize("command", sorted(COMMANDS))
+def test_script_help_import_time(command, tmp_path):
+    body = """
+sys.argv = [{command!r}, "--help"]
+try:
+    with contextlib.redirect_stdout(io.StringIO()):
+        runpy.run_module("orchard.scripts." + {command!r}, run_name="__main__")
+except SystemExit:
+    pass
+""".format(
+        command=command
+    )
+    res = _run_check(body, tmp_path)
+    assert res["heavy"] == []
+    assert not res["config_read"]
+    assert res["wall"] < IMPORT_TIME_BUDGET